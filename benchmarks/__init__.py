@@ -0,0 +1,11 @@
+"""
+Reproducible benchmark suite for danotes
+
+    python -m benchmarks run -o results.json [--blocks 200 --lines 20 --link-density 0.1 --depth 2]
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks memory --blocks 100000
+"""
+
+from .corpus import *
+from .bench_core import *
+from .bench_memory import *
@@ -0,0 +1,147 @@
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from importlib import metadata
+
+from .bench_core import run_benchmarks
+from .corpus import generate_corpus, generate_legacy_corpus
+from .bench_memory import measure_memory
+
+
+## ----------------------------------------------------------------------------
+# @section TRAMPOLINE_FUNCTIONS
+
+def cli_run(args):
+    params = {
+        'blocks': args.blocks,
+        'lines': args.lines,
+        'link_density': args.link_density,
+        'depth': args.depth,
+        'repeat': args.repeat,
+        'seed': args.seed,
+    }
+    log = lambda line: print(line, file=sys.stderr, flush=True)
+    results = run_benchmarks(**params, only=args.only, log=log)
+
+    try:
+        version = metadata.version('danotes')
+    except metadata.PackageNotFoundError:
+        version = 'unknown'
+
+    output = {
+        'meta': {
+            'danotes': version,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'params': params,
+        },
+        'results': results,
+    }
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+def cli_compare(args):
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.current, encoding='utf-8') as file:
+        current = json.load(file)
+
+    if baseline['meta']['params'] != current['meta']['params']:
+        print(f"[Warning]: Benchmark params differ {baseline['meta']['params']} != {current['meta']['params']}", file=sys.stderr)
+
+    regressions = 0
+    print(f"{'benchmark':<32} {'baseline ms':>12} {'current ms':>12} {'ratio':>8}")
+    for name, stats in current['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:<32} {'-':>12} {stats['median'] * 1000:>12.3f} {'new':>8}")
+            continue
+        old = baseline['results'][name]['median']
+        ratio = stats['median'] / old if old else float('inf')
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:<32} {old * 1000:>12.3f} {stats['median'] * 1000:>12.3f} {ratio:>8.2f}{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than {args.threshold:.0%} over the baseline", file=sys.stderr)
+        sys.exit(1)
+
+
+def cli_memory(args):
+    result = measure_memory(blocks=args.blocks, lines=args.lines, link_density=args.link_density, depth=args.depth, seed=args.seed)
+    for key, value in result.items():
+        print(f"{key:<24} {value:>16,.1f}" if isinstance(value, float) else f"{key:<24} {value:>16,}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'memory': result}, indent=2) + '\n')
+
+
+def cli_corpus(args):
+    if args.legacy:
+        generate_legacy_corpus(args.path, blocks=args.blocks, lines=args.lines, link_density=args.link_density, seed=args.seed)
+    else:
+        generate_corpus(args.path, blocks=args.blocks, lines=args.lines, link_density=args.link_density, depth=args.depth, seed=args.seed)
+    print(f"Corpus written to {args.path}")
+
+## EOF EOF EOF TRAMPOLINE_FUNCTIONS
+## ----------------------------------------------------------------------------
+
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument("--blocks", type=int, default=200, help="Number of Article blocks (default: 200)")
+    parser.add_argument("--lines", type=int, default=20, help="Content lines per block (default: 20)")
+    parser.add_argument("--link-density", type=float, default=0.1, help="Fraction of content lines carrying a link (default: 0.1)")
+    parser.add_argument("--depth", type=int, default=2, help="Source path depth of the blocks (default: 2)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the corpus (default: 0)")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Reproducible benchmarks of the core Danom operations and CLI handlers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks on a synthetic corpus")
+    add_corpus_arguments(run_parser)
+    run_parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each benchmark (default: 3)")
+    run_parser.add_argument("--only", help="Only run the benchmarks whose name contains this string")
+    run_parser.add_argument("-o", "--output", help="Store the results as JSON (default: stdout)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results JSON files")
+    compare_parser.add_argument("baseline", help="Results of the reference version")
+    compare_parser.add_argument("current", help="Results of the version under test")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as regression (default: 0.1)")
+
+    memory_parser = subparsers.add_parser("memory", help="Measure the per-block memory of a loaded document")
+    add_corpus_arguments(memory_parser)
+    memory_parser.set_defaults(blocks=100000)
+    memory_parser.add_argument("-o", "--output", help="Store the results as JSON")
+
+    corpus_parser = subparsers.add_parser("corpus", help="Only write a synthetic corpus")
+    add_corpus_arguments(corpus_parser)
+    corpus_parser.add_argument("--legacy", help="Write a legacy vim-dan document instead", action="store_true")
+    corpus_parser.add_argument("path", help="Output file")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        cli_run(args)
+    elif args.command == "compare":
+        cli_compare(args)
+    elif args.command == "memory":
+        cli_memory(args)
+    elif args.command == "corpus":
+        cli_corpus(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmarks of the core Danom operations and of each CLI handler end-to-end
+"""
+
+import io
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+
+import danotes
+from danotes.model import Danom, transform_legacy_title
+from .corpus import generate_corpus, generate_legacy_corpus
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def measure(func, setup=None, repeat: int = 3) -> dict:
+    """
+    Run func(setup()) `repeat` times, only timing func
+    Output of the danotes debug prints is discarded
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            result = func(arg) if setup else func()
+            ## Streamed outputs are consumed as a CLI would do
+            if result is not None and not isinstance(result, (str, Danom)) and hasattr(result, '__next__'):
+                for _ in result:
+                    pass
+            timings.append(time.perf_counter() - start)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'repeat': repeat,
+    }
+
+
+def loaded(path):
+    """Setup returning a freshly loaded Danom"""
+    return lambda: Danom().load(path)
+
+
+def loaded_with_links(path):
+    def setup():
+        danom = Danom().load(path)
+        danom.get_links_target()
+        return danom
+    return setup
+
+
+def copied(path, workdir):
+    """Setup returning the path of a fresh copy of the corpus (handlers modify it in place)"""
+    def setup():
+        target = Path(workdir) / f"copy{Path(path).suffix}"
+        shutil.copyfile(path, target)
+        return str(target)
+    return setup
+
+
+def legacy_loaded(path, workdir):
+    """Setup returning a Danom loaded from a transformed legacy copy (input of update_from_legacy)"""
+    def setup():
+        target = Path(workdir) / "legacy-copy.dan"
+        shutil.copyfile(path, target)
+        with redirect_stdout(io.StringIO()):
+            transform_legacy_title(target)
+        return Danom().load(target)
+    return setup
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section BENCHMARKS
+
+def run_benchmarks(blocks: int = 200, lines: int = 20, link_density: float = 0.1, depth: int = 2, repeat: int = 3, seed: int = 0, only: str = None, log=None) -> dict:
+    """Generate the corpora on a temporary dir and time each benchmark. Returns {name: stats}"""
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='danotes-bench-') as workdir:
+        corpus = generate_corpus(Path(workdir) / 'corpus.dan', blocks=blocks, lines=lines, link_density=link_density, depth=depth, seed=seed)
+        legacy = generate_legacy_corpus(Path(workdir) / 'legacy.dan', blocks=blocks, lines=lines, link_density=link_density, seed=seed)
+        ## Rendered once so every text benchmark starts from the danotes own output
+        with redirect_stdout(io.StringIO()):
+            danotes.file_refresh(corpus)
+        last_buid = Danom().load(corpus)[-1].buid
+        ## Local text file source of block_source (command sources run with ttl=0, so the cache is not timed)
+        source_file = Path(workdir) / 'source.txt'
+        source_file.write_text(''.join(f"benchmark source line {i}\n" for i in range(lines)), encoding='utf-8')
+        source_file = str(source_file)
+
+        benchmarks = {
+            ## Core Danom operations
+            'Danom.load': (lambda: Danom().load(corpus), None),
+            'Danom.get_links_target': (lambda danom: danom.get_links_target(), loaded(corpus)),
+            'Danom.update_toc_block': (lambda danom: danom.update_toc_block(), loaded(corpus)),
+            'Danom.to_text': (lambda danom: danom.to_text(), loaded_with_links(corpus)),
+            'Danom.to_file': (lambda danom: danom.to_file(Path(workdir) / 'out.dan'), loaded_with_links(corpus)),
+            'Danom.update_from_legacy': (lambda danom: danom.update_from_legacy(), legacy_loaded(legacy, workdir)),
+
+            ## CLI handlers end-to-end
+            'cli.file_refresh': (lambda path: danotes.file_refresh(path), copied(corpus, workdir)),
+            'cli.file_update_toc': (lambda path: danotes.file_update_toc(path), copied(corpus, workdir)),
+            'cli.file_update_notoc': (lambda path: danotes.file_update_notoc(path), copied(corpus, workdir)),
+            'cli.file_migrate': (lambda path: danotes.file_migrate(path), copied(legacy, workdir)),
+            'cli.file_append': (lambda path: danotes.file_append(path, 'appended line'), copied(corpus, workdir)),
+            'cli.block_show.json': (lambda path: danotes.block_show(path, json=True), copied(corpus, workdir)),
+            ## Drained here, the handler only returns the generator
+            'cli.block_show.ndjson': (lambda path: sum(1 for _ in danotes.block_show(path, ndjson=True)), copied(corpus, workdir)),
+            'cli.block_show.buid': (lambda path: danotes.block_show(path, buid=last_buid, text=True), copied(corpus, workdir)),
+            'cli.block_write.query': (lambda path: danotes.block_write(path, buid=last_buid, query='appended'), copied(corpus, workdir)),
+            'cli.block_write.new_label': (lambda path: danotes.block_write(path, new_label='Benchmark Article'), copied(corpus, workdir)),
+            'cli.block_write.journal': (lambda path: danotes.block_write(path, buid=last_buid, query='appended', journal=True), copied(corpus, workdir)),
+            'cli.block_source.file': (lambda path: danotes.block_source(path, source=source_file, title='Benchmark Source'), copied(corpus, workdir)),
+            'cli.block_source.command': (lambda path: danotes.block_source(path, source='echo benchmark source', title='Benchmark Source', ttl=0), copied(corpus, workdir)),
+            'cli.link_write': (lambda path: danotes.link_write(path, buid=last_buid, uuid=None, new_label='Benchmark Link'), copied(corpus, workdir)),
+            'cli.link_show': (lambda path: danotes.link_show(path, buid=None, uuid=None, label=None, json=True), copied(corpus, workdir)),
+            'cli.file_convert.danb': (lambda path: danotes.file_convert(path, str(Path(workdir) / 'out.danb')), copied(corpus, workdir)),
+        }
+
+        for name, (func, setup) in benchmarks.items():
+            if only and only not in name:
+                continue
+            results[name] = measure(func, setup, repeat=repeat)
+            if log:
+                log(f"{name:<32} median {results[name]['median'] * 1000:>12.3f} ms")
+
+    return results
+
+## EOF EOF EOF BENCHMARKS
+## ----------------------------------------------------------------------------
+
+__all__ = ['measure', 'run_benchmarks']
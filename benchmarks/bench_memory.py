@@ -0,0 +1,57 @@
+"""
+Memory benchmark of the Danom model (per-block overhead of a loaded document)
+"""
+
+import gc
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from danotes.model import Danom
+from .corpus import generate_corpus
+
+
+def measure_memory(blocks: int = 100000, lines: int = 20, link_density: float = 0.1, depth: int = 2, seed: int = 0, with_links: bool = True) -> dict:
+    """
+    Load a synthetic document under tracemalloc and split the retained memory into
+        - lines_bytes    : the content line strings (each distinct str counted once)
+        - overhead_bytes : everything else (Block, Content, LinksTarget, LinkTarget objects ...)
+    """
+    with tempfile.TemporaryDirectory(prefix='danotes-bench-') as workdir:
+        corpus = generate_corpus(Path(workdir) / 'corpus.dan', blocks=blocks, lines=lines, link_density=link_density, depth=depth, seed=seed)
+
+        gc.collect()
+        tracemalloc.start()
+        danom = Danom().load(corpus)
+        if with_links:
+            danom.get_links_target()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    seen = set()
+    lines_bytes = 0
+    line_count = 0
+    for block in danom:
+        for line in block.content:
+            line_count += 1
+            if id(line) not in seen:
+                seen.add(id(line))
+                lines_bytes += sys.getsizeof(line)
+
+    total_blocks = len(danom)
+    return {
+        'blocks': total_blocks,
+        'lines': line_count,
+        'distinct_line_objects': len(seen),
+        'retained_bytes': retained,
+        'peak_bytes': peak,
+        'lines_bytes': lines_bytes,
+        'overhead_bytes': retained - lines_bytes,
+        'bytes_per_block': retained / total_blocks,
+        'overhead_per_block': (retained - lines_bytes) / total_blocks,
+    }
+
+
+__all__ = ['measure_memory']
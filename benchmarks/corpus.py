@@ -0,0 +1,149 @@
+"""
+Synthetic .dan corpus generator for the benchmarks
+
+Documents are written as text directly (the figlet art is rendered once and reused)
+so generating a 100k blocks corpus does not pay the figlet cost of Danom.to_text()
+"""
+
+import random
+import pyfiglet
+from danotes.model import get_next_uid
+
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua request response session header "
+    "parameter returns description example function method object property value"
+).split()
+
+MODELINE_VARS = (
+    'dan_ext_list', 'dan_kw_question_list', 'dan_kw_nontext_list', 'dan_kw_linenr_list',
+    'dan_kw_warningmsg_list', 'dan_kw_colorcolumn_list', 'dan_kw_underlined_list',
+    'dan_kw_preproc_list', 'dan_kw_comment_list', 'dan_kw_identifier_list',
+    'dan_kw_ignore_list', 'dan_kw_statement_list', 'dan_kw_cursorline_list', 'dan_kw_tabline_list',
+)
+
+SEPARATOR = '=' * 105
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def figlet_lines(text: str) -> list:
+    return [line.rstrip() for line in pyfiglet.figlet_format(text).split('\n')]
+
+
+def iter_buids(first: str, count: int):
+    buid = first
+    for _ in range(count):
+        yield buid
+        buid = get_next_uid(buid)
+
+
+def make_source(rng: random.Random, depth: int) -> str:
+    """Source path of `depth` directories (empty for depth 0, as on User Blocks)"""
+    if depth <= 0:
+        return ''
+    parts = [f"dir{rng.randrange(4)}" for _ in range(depth)]
+    return './' + '/'.join(parts) + f"/page{rng.randrange(1000)}.html"
+
+
+def make_content(rng: random.Random, buid: str, buids: list, lines: int, link_density: float) -> list:
+    """Content lines of an Article, `link_density` of them carrying a Link Target or a Link Source"""
+    content = ['']
+    iid = '0'
+    for _ in range(lines):
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(4, 14)))
+        if rng.random() < link_density:
+            if rng.random() < 0.5:
+                iid = get_next_uid(iid)
+                line = f"<I={buid}#{iid}>{line.split(' ')[0]}</I> {line}"
+            else:
+                line = f"{line} <L={rng.choice(buids)}>{rng.choice(WORDS)}</L>"
+        ## Repeated blank lines as on real documents
+        content.append(line)
+        if rng.random() < 0.2:
+            content.append('')
+    return content
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section GENERATORS
+
+def generate_corpus(path, blocks: int = 1000, lines: int = 20, link_density: float = 0.1, depth: int = 2, seed: int = 0) -> str:
+    """
+    Write a synthetic .dan document
+        blocks       : number of Article blocks (plus the Header and TOC blocks)
+        lines        : content lines per Article
+        link_density : fraction of content lines carrying a link (half targets <I=>, half sources <L=>)
+        depth        : source path depth of the Articles (0 for User Blocks)
+    """
+    rng = random.Random(seed)
+    art = figlet_lines('Article')
+    buids = list(iter_buids('2', blocks))
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<B=0>corpus\n')
+        file.write('\n'.join(figlet_lines('corpus')) + '\n<T>\n\n')
+        file.write('The following lines are used by danotes, modify them only if you know !\n\n')
+        for var in MODELINE_VARS:
+            file.write(f'{var}: []\n')
+        file.write('dan_wrap_lines: 105\ndan_title: "corpus"\n\n\n')
+        file.write(f'</B><L=1>To Document TOC</L> | <L=0>Back to Article Top</L>\n{SEPARATOR}\n')
+
+        file.write('<B=1>Document TOC\n<T>\n\n\n\n')
+        file.write(f'</B><L=1>To Document TOC</L> | <L=1>Back to Article Top</L>\n{SEPARATOR}\n')
+
+        for buid in buids:
+            file.write(f'<B={buid}>Article {buid}\n')
+            file.write('\n'.join(art) + '\n')
+            source = make_source(rng, depth)
+            if source:
+                file.write(f'source: "{source}"\n')
+            file.write('<T>\n')
+            file.write('\n'.join(make_content(rng, buid, buids, lines, link_density)) + '\n\n')
+            file.write(f'</B><L=1>To Document TOC</L> | <L={buid}>Back to Article Top</L>\n{SEPARATOR}\n')
+
+    return str(path)
+
+
+def generate_legacy_corpus(path, blocks: int = 1000, lines: int = 20, link_density: float = 0.1, seed: int = 0) -> str:
+    """Write a synthetic legacy vim-dan document (input of transform_legacy_title / file migrate)"""
+    rng = random.Random(seed)
+    label = 'Article'
+    art = figlet_lines(label)
+    buids = list(iter_buids('1', blocks))
+
+    with open(path, 'w', encoding='utf-8') as file:
+        ## Header: the modeline variables are expected on lines 11 to 24
+        header = figlet_lines('legacy')[:10]
+        header += [''] * (11 - len(header))
+        header += [f'" g:{var} = "{rng.choice(WORDS)},{rng.choice(WORDS)}"' for var in MODELINE_VARS]
+        header += ['', '']
+        file.write('\n'.join(header) + '\n')
+        file.write(f'{SEPARATOR}\n')
+
+        file.write('<B=0>Table of Contents\n')
+        file.write('\n'.join(figlet_lines('TOC')[:6]) + '\n')
+        for buid in buids:
+            file.write(f'- <L={buid}>{label}</L>\n')
+        file.write('\n</B>\n')
+        file.write(f'{SEPARATOR}\n')
+
+        for buid in buids:
+            file.write(f'<B={buid}>{label}\n')
+            file.write('\n'.join(art) + '\n')
+            file.write('\n'.join(make_content(rng, buid, buids, lines, link_density)) + '\n\n')
+            file.write('</B>\n')
+            file.write(f'{SEPARATOR}\n')
+
+    return str(path)
+
+## EOF EOF EOF GENERATORS
+## ----------------------------------------------------------------------------
+
+__all__ = ['generate_corpus', 'generate_legacy_corpus']
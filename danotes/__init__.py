@@ -1,8 +1,15 @@
 from .handlers.block import *
 from .handlers.link import *
 from .handlers.file import *
+from .handlers.bulk import *
+from .handlers.watch import *
+from .handlers.export import *
+from .handlers.diff import *
+from .handlers.dedup import *
+from .handlers.lsp import *
+from .handlers.history import *
 
-__all__ = ['file_new', 'file_append', 'block_write', 'block_show', 'link_write', 'link_show']
+__all__ = ['file_new', 'file_append', 'file_convert', 'file_compact', 'file_shard', 'file_unshard', 'file_merge', 'file_bulk', 'block_write', 'block_show', 'link_write', 'link_show', 'watch', 'export', 'diff', 'dedup', 'lsp']
 
 ## Momentary snippet for working directly with the danom interactively          ## DEBUGGING
 
@@ -1,8 +1,16 @@
 import argparse
 import sys
+from .profiling import PROFILER, profile_from_env
 from .handlers.block import *
 from .handlers.link import *
 from .handlers.file import *
+from .handlers.bulk import *
+from .handlers.watch import *
+from .handlers.export import *
+from .handlers.diff import *
+from .handlers.dedup import *
+from .handlers.lsp import *
+from .handlers.history import *
 
 
 ## ----------------------------------------------------------------------------
@@ -30,47 +38,94 @@ def cli_file_append(args):
         print(result, end='')
 
 def cli_file_update_toc(args):
-    result = file_update_toc(path=args.path)
+    if is_bulk_request(args.path):
+        sys.exit(file_bulk('update toc', args.path, recursive=args.recursive, jobs=args.jobs))
+    result = file_update_toc(path=args.path[0])
     if result is not None:
         print(result, end='')
 
 def cli_file_update_notoc(args):
-    result = file_update_notoc(path=args.path)
+    if is_bulk_request(args.path):
+        sys.exit(file_bulk('update notoc', args.path, recursive=args.recursive, jobs=args.jobs))
+    result = file_update_notoc(path=args.path[0])
     if result is not None:
         print(result, end='')
 
 
 def cli_file_refresh(args):
-    result = file_refresh(path=args.path)
+    if is_bulk_request(args.path):
+        sys.exit(file_bulk('refresh', args.path, recursive=args.recursive, jobs=args.jobs))
+    result = file_refresh(path=args.path[0])
     if result is not None:
         print(result, end='')
 
 def cli_file_migrate(args):
-    result = file_migrate(path=args.path)
+    if is_bulk_request(args.path):
+        sys.exit(file_bulk('migrate', args.path, recursive=args.recursive, jobs=args.jobs, snapshot=args.snapshot))
+    result = file_migrate(path=args.path[0], snapshot=args.snapshot)
+    if result is not None:
+        print(result, end='')
+
+def cli_file_compact(args):
+    result = file_compact(path=args.path)
+    if result is not None:
+        print(result, end='')
+
+def cli_file_convert(args):
+    result = file_convert(path=args.path, output=args.output)
+    if result is not None:
+        print(result, end='')
+
+def cli_file_shard(args):
+    result = file_shard(path=args.path, output=args.output, by=args.by, size=args.size, depth=args.depth, jobs=args.jobs)
+    if result is not None:
+        print(result, end='')
+
+def cli_file_unshard(args):
+    result = file_unshard(path=args.path, output=args.output)
+    if result is not None:
+        print(result, end='')
+
+def cli_file_merge(args):
+    result = file_merge(path=args.path, other=args.other, output=args.output)
     if result is not None:
         print(result, end='')
 
 
 
 def cli_block_write(args):
-    # Handle stdin if no query provided
+    # Handle stdin if no query provided (streamed into the file, not read whole)
+    stream = None
     if args.query is None and not sys.stdin.isatty():
-        args.query = sys.stdin.read()
+        stream = sys.stdin.buffer
 
     # Use default "Unnamed Article" if new_label is None
     new_label = args.new_label if args.new_label is not None else "Unnamed Article"
 
-    result = block_write(path=args.path, buid=args.buid, query=args.query, new_label=new_label, source=args.source, json=args.json, text=args.text)
+    result = block_write(path=args.path, buid=args.buid, query=args.query, new_label=new_label, source=args.source, json=args.json, text=args.text, journal=args.journal, stream=stream)
     if result is not None:
         print(result, end='')
 
 def cli_block_show(args):
-    result = block_show(path=args.path, buid=args.buid, label=args.label, json=args.json, text=args.text)
-    if result is not None:
+    result = block_show(path=args.path, buid=args.buid, label=args.label, json=args.json, text=args.text, ndjson=args.ndjson, fields=args.fields)
+    if isinstance(result, str):
+        print(result, end='')
+    elif result is not None:
+        ## Streamed output (--ndjson) , print each line as soon as it is produced
+        for line in result:
+            print(line, end='', flush=True)
+
+def cli_block_select(args):
+    result = block_select(path=args.path, query=args.query, json=args.json, text=args.text, ndjson=args.ndjson, fields=args.fields)
+    if isinstance(result, str):
         print(result, end='')
+    elif result is not None:
+        for line in result:
+            print(line, end='', flush=True)
 
 def cli_block_source(args):
-    result = block_source(path=args.path, buid=args.buid, source=args.source, title=args.title, content=args.content, filters=args.filters, json=args.json, text=args.text)
+    result = block_source(path=args.path, buid=args.buid, source=args.source, title=args.title, content=args.content, filters=args.filters, json=args.json, text=args.text, ttl=args.ttl, timeout=args.timeout, max_output=args.max_output, snapshot=args.snapshot,
+                          crawl=args.crawl, max_depth=args.max_depth, match=args.match, jobs=args.jobs, per_host=args.per_host, delay=args.delay, max_pages=args.max_pages)
     if result is not None:
         print(result, end='')
 
@@ -79,7 +134,7 @@ def cli_link_write(args):
     # Use default "Unnamed Article" if new_label is None
     new_label = args.new_label if args.new_label is not None else "NewLink"
 
-    result = link_write(path=args.path, buid=args.buid, uuid=args.uuid, new_label=new_label, json=args.json, text=args.text)
+    result = link_write(path=args.path, buid=args.buid, uuid=args.uuid, new_label=new_label, json=args.json, text=args.text, journal=args.journal)
     if result is not None:
         print(result, end='')
 
@@ -89,6 +144,115 @@ def cli_link_show(args):
         print(result, end='')
 
 
+def cli_export(args):
+    result = export(path=args.path, format=args.format, out=args.out, jobs=args.jobs, force=args.force)
+    if result is not None:
+        print(result, end='')
+
+def cli_diff(args):
+    result = diff(old=args.old, new=args.new, by=args.by, lines=args.lines, json=args.json)
+    if result is not None:
+        print(result, end='')
+
+def cli_dedup(args):
+    result = dedup(path=args.path, threshold=args.threshold, merge=args.merge, shingle=args.shingle, permutations=args.permutations, json=args.json)
+    if result is not None:
+        print(result, end='')
+
+def cli_snapshot(args):
+    result = snapshot(path=args.path, message=args.message)
+    if result is not None:
+        print(result, end='')
+
+def cli_history(args):
+    result = history(path=args.path, buid=args.buid, json=args.json)
+    if result is not None:
+        print(result, end='')
+
+def cli_restore(args):
+    result = restore(path=args.path, snapshot=args.snapshot, buid=args.buid, output=args.output)
+    if result is not None:
+        print(result, end='')
+
+def cli_lsp(args):
+    sys.exit(lsp())
+
+def cli_watch(args):
+    result = watch(path=args.path, debounce=args.debounce, poll=args.poll, interval=args.interval)
+    if result is not None:
+        print(result, end='')
+
+
+def dispatch(args):
+    """Call the trampoline function of the parsed command"""
+    if args.command == "file":
+        if args.subcommand == "new":
+            cli_file_new(args)
+        if args.subcommand == "append":
+            cli_file_append(args)
+        if args.subcommand == "update":
+            if args.update_target == "toc":
+                cli_file_update_toc(args)
+            if args.update_target == "notoc":
+                cli_file_update_notoc(args)
+        if args.subcommand == "refresh":
+            cli_file_refresh(args)
+        if args.subcommand == "migrate":
+            cli_file_migrate(args)
+        if args.subcommand == "convert":
+            cli_file_convert(args)
+        if args.subcommand == "compact":
+            cli_file_compact(args)
+        if args.subcommand == "shard":
+            cli_file_shard(args)
+        if args.subcommand == "unshard":
+            cli_file_unshard(args)
+        if args.subcommand == "merge":
+            cli_file_merge(args)
+
+
+    if args.command == "block":
+        if args.subcommand == "write":
+            cli_block_write(args)
+        elif args.subcommand == "show":
+            cli_block_show(args)
+        elif args.subcommand == "select":
+            cli_block_select(args)
+        elif args.subcommand == "source":
+            cli_block_source(args)
+
+
+    elif args.command == "link":
+        if args.subcommand == "write":
+            cli_link_write(args)
+        elif args.subcommand == "show":
+            cli_link_show(args)
+
+    elif args.command == "watch":
+        cli_watch(args)
+
+    elif args.command == "export":
+        cli_export(args)
+
+    elif args.command == "diff":
+        cli_diff(args)
+
+    elif args.command == "dedup":
+        cli_dedup(args)
+
+    elif args.command == "snapshot":
+        cli_snapshot(args)
+
+    elif args.command == "history":
+        cli_history(args)
+
+    elif args.command == "restore":
+        cli_restore(args)
+
+    elif args.command == "lsp":
+        cli_lsp(args)
+
+
 ## EOF EOF EOF TRAMPOLINE_FUNCTIONS 
 ## ----------------------------------------------------------------------------
 
@@ -122,12 +286,22 @@ def main():
           # Append a Dan Link to that article
           danotes link write test-sample/file.dan --new-label "New Link"
 
+          # Select Blocks by their attributes (label, source, header fields, lines, links), from an index of the document
+          danotes block select test-sample/new-format.dan 'source:*.html and label~"Request" and links>3'
+          danotes block select test-sample/new-format.dan 'lines>100 or not source' --ndjson --fields buid,label
+
           # (For EGB) Update a certain EGB block acording to source
           danotes block source test-sample/new-format.dan --buid 6
 
           # (For EGB) Update all EGB blocks according to their sources
           danotes block source test-sample/new-format.dan
 
+          # (For EGB) Run every command source again, ignoring their cached output
+          danotes block source test-sample/new-format.dan --ttl 0 --timeout 30
+
+          # (For EGB) Crawl a documentation site, one EGB block per page (fetched concurrently, saved at once)
+          danotes block source test-sample/new-format.dan --crawl "https://requests.readthedocs.io/en/latest/" --max-depth 2 --match "/en/latest/" --content "section"
+
           # (For EGB) Create a new EGB block with a certain source
 
           ## For webs
@@ -148,13 +322,61 @@ def main():
           danotes file update toc test-sample/file.dan
           danotes block write test-sample/file.dan
 
+          # Convert to the compact binary format and back (the Danom model is kept, the text is rendered again)
+          danotes file convert test-sample/file.dan test-sample/file.danb
+          danotes file convert test-sample/file.danb test-sample/file.dan
+          danotes file convert test-sample/file.dan test-sample/file.dan.zst
+
           # Update file without Toc Block and not individual Block Toc
           danotes file update notoc test-sample/file.dan
 
+          # Maintain a whole library of documents at once, on a process pool
+          danotes file migrate ~/vim-dan/ --recursive -j 8
+          danotes file refresh 'notes/**/*.dan' --recursive
+
+          # Keep the EGBs sourced from local files up to date while editing them
+          danotes watch test-sample/file.dan
+
+          # What changed between two runs of a documentation generator (Blocks matched by source)
+          danotes diff old/docs.dan new/docs.dan --by source --lines
+
+          # Near-duplicate Blocks of scraped documentation (report them, or keep one of each)
+          danotes dedup test-sample/file.dan --report
+          danotes dedup test-sample/file.dan --merge --threshold 0.9
+
+          # Language server for the editor (go to definition, references, symbols)
+          danotes lsp --stdio
+
+          # Publish as a static site (only the changed pages are rendered again)
+          danotes export test-sample/file.dan --format html --out site/
+
+          # Frequent/concurrent writers append to a journal, folded on the next save or explicitly
+          danotes block write test-sample/file.dan --buid 2 --query "Some text" --journal
+          danotes file compact test-sample/file.dan
+
+          # Combine two documents (the buids and links of the second one are renumbered)
+          danotes file merge test-sample/a.dan test-sample/b.dan -o test-sample/all.dan
+
+          # Cheap history: only the Blocks changed since the previous snapshot are stored (<path>.snapshots/)
+          danotes snapshot test-sample/file.dan -m "before cleanup"
+          danotes block source test-sample/file.dan --snapshot
+          danotes history test-sample/file.dan
+          danotes restore test-sample/file.dan --snapshot 3
+          danotes restore test-sample/file.dan --snapshot 3 --buid 2a
+
+          # Split a huge document into shards, any command takes the manifest instead of the file
+          danotes file shard test-sample/file.dan --by source --size 500
+          danotes block write test-sample/file.danm --buid 2 --query "Some text"
+          danotes file unshard test-sample/file.danm test-sample/file.dan
+
         """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
 
+    parser.add_argument("--profile", help="Print per-phase/per-block wall time, call counts and peak memory to stderr (also enabled with DANOTES_TRACE=table|json)", action="store_true")
+    parser.add_argument("--profile-format", choices=["table", "json"], default="table", help="Output format of the --profile report (default: table)")
+    parser.add_argument("--profile-dump", metavar="FILE", help="Dump the cProfile stats of the run to FILE (also enabled with DANOTES_TRACE_DUMP=FILE)")
+
     subparsers = parser.add_subparsers(dest="command", required=True, help="Top-level command")
 
 
@@ -169,6 +391,11 @@ def main():
     file_parser = subparsers.add_parser("file", help="Dan file Operations")
     file_subparsers = file_parser.add_subparsers(dest="subcommand", required=True)
 
+    ## Operations accepting several documents (see file_bulk)
+    def add_bulk_arguments(subparser):
+        subparser.add_argument("-r", "--recursive", help="Include the documents of subdirectories (and let '**' match them on glob patterns)", action="store_true")
+        subparser.add_argument("-j", "--jobs", type=int, help="Worker processes when several documents are given (default: one per CPU)")
+
 
     # file new
     file_new_parser = file_subparsers.add_parser("new", help=file_new.__doc__, description=file_new.__doc__)
@@ -187,7 +414,8 @@ def main():
 
     # file refresh
     file_refresh_parser = file_subparsers.add_parser("refresh", help=file_refresh.__doc__, description=file_refresh.__doc__)
-    file_refresh_parser.add_argument("path", help="Input file")
+    file_refresh_parser.add_argument("path", nargs="+", help="Input files, directories or glob patterns")
+    add_bulk_arguments(file_refresh_parser)
 
 
     # file update (subcommand group)
@@ -196,15 +424,48 @@ def main():
 
     # file update toc
     file_update_toc_parser = file_update_subparsers.add_parser("toc", help="Update TOC")
-    file_update_toc_parser.add_argument("path", help="Input file")
+    file_update_toc_parser.add_argument("path", nargs="+", help="Input files, directories or glob patterns")
+    add_bulk_arguments(file_update_toc_parser)
 
     # file update toc
     file_update_notoc_parser = file_update_subparsers.add_parser("notoc", help="Whole file except the Toc Block,for each file no Block Toc will be generated")
-    file_update_notoc_parser.add_argument("path", help="Input file")
+    file_update_notoc_parser.add_argument("path", nargs="+", help="Input files, directories or glob patterns")
+    add_bulk_arguments(file_update_notoc_parser)
 
     # file migrate
     file_migrate_parser = file_subparsers.add_parser("migrate", help=file_migrate.__doc__, description=file_migrate.__doc__)
-    file_migrate_parser.add_argument("path", help="Input file")
+    file_migrate_parser.add_argument("path", nargs="+", help="Input files, directories or glob patterns")
+    file_migrate_parser.add_argument("--snapshot", help="Snapshot each legacy file before migrating it (see danotes restore)", action="store_true")
+    add_bulk_arguments(file_migrate_parser)
+
+    # file convert
+    file_convert_parser = file_subparsers.add_parser("convert", help=file_convert.__doc__, description=file_convert.__doc__)
+    file_convert_parser.add_argument("path", help="Input file (.dan text, .danb binary or .dan.gz/.dan.zst compressed)")
+    file_convert_parser.add_argument("output", help="Output file (.danb extension for binary, .gz/.zst compressed, text otherwise)")
+
+    # file compact
+    file_compact_parser = file_subparsers.add_parser("compact", help=file_compact.__doc__, description=file_compact.__doc__)
+    file_compact_parser.add_argument("path", help="Input file")
+
+    # file shard
+    file_shard_parser = file_subparsers.add_parser("shard", help="Split a document into a manifest plus shard files", description=file_shard.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    file_shard_parser.add_argument("path", help="Input file")
+    file_shard_parser.add_argument("-o", "--output", help="Manifest to write (default: the input path with a .danm extension)")
+    file_shard_parser.add_argument("--by", choices=["range", "source"], default="range", help="Grouping of the Blocks into shards (default: range)")
+    file_shard_parser.add_argument("--size", type=int, default=1000, help="Maximum Blocks per shard (default: 1000)")
+    file_shard_parser.add_argument("--depth", type=int, default=1, help="Source directory components grouped together with --by source (default: 1)")
+    file_shard_parser.add_argument("-j", "--jobs", type=int, help="Shards written concurrently (default: as many as the thread pool allows)")
+
+    # file unshard
+    file_unshard_parser = file_subparsers.add_parser("unshard", help=file_unshard.__doc__, description=file_unshard.__doc__)
+    file_unshard_parser.add_argument("path", help="Manifest (.danm)")
+    file_unshard_parser.add_argument("output", help="Output file (.danb extension for binary, text otherwise)")
+
+    # file merge
+    file_merge_parser = file_subparsers.add_parser("merge", help="Merge the articles of another document into this one", description=file_merge.__doc__)
+    file_merge_parser.add_argument("path", help="Input file (its Header and Blocks come first, with their buids)")
+    file_merge_parser.add_argument("other", help="Document whose articles are appended, renumbered")
+    file_merge_parser.add_argument("-o", "--output", help="Output file (default: the input file)")
 
 
     ## EOF EOF EOF FILE 
@@ -230,8 +491,9 @@ def main():
 
 
     block_write_parser.add_argument("--source", help="Path source of the Block (for tree hierarchy)")
-    block_write_parser.add_argument("-q", "--query", help="Text to Input (If not present defaults to stdin)")
+    block_write_parser.add_argument("-q", "--query", help="Text to Input (If not present defaults to stdin, streamed into the file in chunks)")
     block_write_parser.add_argument("-n", "--new-label", help="Text Label of the New Block Target (for when creating a new block)")
+    block_write_parser.add_argument("--journal", help="Append the edit to <path>.journal instead of rewriting the file (O(1), for frequent/concurrent writers)", action="store_true")
 
 
     block_write_parser.add_argument("path", help="Input file")
@@ -241,6 +503,8 @@ def main():
     block_show_parser_outputtype = block_show_parser.add_mutually_exclusive_group()
     block_show_parser_outputtype.add_argument("--json", help="Output to stdout as Danom Object", action="store_true")
     block_show_parser_outputtype.add_argument("--text", help="Output to stdout as formated dan text", action="store_true")
+    block_show_parser_outputtype.add_argument("--ndjson", help="Stream to stdout one JSON Block per line as the file is parsed", action="store_true")
+    block_show_parser.add_argument("--fields", help="Comma separated Block keys to serialize with --json/--ndjson (buid,label,content,links_target,title_marked,source,title_cmd,content_cmd,filters)")
 
     block_show_parser_filterby = block_show_parser.add_mutually_exclusive_group()
     block_show_parser_filterby.add_argument("-b", "--buid", help="Target Block by buid")
@@ -249,6 +513,18 @@ def main():
     block_show_parser.add_argument("path", help="Input file")
 
 
+    # block select
+    block_select_parser = block_subparsers.add_parser("select", help="Select the Blocks matching a query on their attributes", description=block_select.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    block_select_parser_outputtype = block_select_parser.add_mutually_exclusive_group()
+    block_select_parser_outputtype.add_argument("--json", help="Output to stdout the selected Blocks as Danom Object", action="store_true")
+    block_select_parser_outputtype.add_argument("--text", help="Output to stdout the selected Blocks as formated dan text", action="store_true")
+    block_select_parser_outputtype.add_argument("--ndjson", help="Stream to stdout one JSON Block per line", action="store_true")
+    block_select_parser.add_argument("--fields", help="Comma separated Block keys to serialize with --json/--ndjson (buid,label,content,links_target,title_marked,source,title_cmd,content_cmd,filters)")
+
+    block_select_parser.add_argument("path", help="Input file")
+    block_select_parser.add_argument("query", help="Query on the Block attributes, e.g. 'source:*.html and label~\"Request\" and links>3'")
+
+
     # block source
     block_source_parser = block_subparsers.add_parser("source", help=block_source.__doc__, description=block_source.__doc__)
     block_source_parser_outputtype = block_source_parser.add_mutually_exclusive_group()
@@ -263,7 +539,18 @@ def main():
     block_source_parser.add_argument("--source", help="Path/URL/cmd source of the Generated Content")
     block_source_parser.add_argument("--title", help="Title parsing rules")
     block_source_parser.add_argument("--content", help="Content parsing rules")
-    block_source_parser.add_argument("--filters", help="Pandoc filters to be applied (comma separated string to be read from ./danotes/filters/user/ or ./danotes/filters/builtin/")
+    block_source_parser.add_argument("--filters", help="Filters to be applied (comma separated). Native ones (strip-nav, normalize-headings, collapse-whitespace) run in-process, the rest are Pandoc Lua filters read from ./danotes/filters/user/ or ./danotes/filters/builtin/")
+    block_source_parser.add_argument("--ttl", type=float, help="Seconds the output of command sources is reused (default: DANOTES_COMMAND_TTL or 86400, 0 runs them again)")
+    block_source_parser.add_argument("--timeout", type=float, help="Seconds a command source may run before being killed (default: 60)")
+    block_source_parser.add_argument("--max-output", type=int, help="Bytes of output kept from a command source, it is killed past them (default: 16 MiB)")
+    block_source_parser.add_argument("--snapshot", help="Snapshot the document before sourcing (see danotes history / restore)", action="store_true")
+    block_source_parser.add_argument("--crawl", metavar="URL", help="Crawl the site under URL, creating an EGB Block per page (all saved at once)")
+    block_source_parser.add_argument("--max-depth", type=int, default=2, help="Links away from the --crawl URL followed (default: 2)")
+    block_source_parser.add_argument("--match", help="Only crawl the URLs matching this regular expression (the --crawl URL always is)")
+    block_source_parser.add_argument("-j", "--jobs", type=int, help="Pages fetched and extracted at a time (default: 8)")
+    block_source_parser.add_argument("--per-host", type=int, default=2, help="Concurrent requests per host (default: 2)")
+    block_source_parser.add_argument("--delay", type=float, default=0.1, help="Seconds between two requests to the same host, or its robots.txt Crawl-delay if longer (default: 0.1)")
+    block_source_parser.add_argument("--max-pages", type=int, default=1000, help="Pages crawled at most (default: 1000)")
     ## EOF EOF EOF BLOCK 
     ## ----------------------------------------------------------------------------
 
@@ -291,6 +578,7 @@ def main():
     link_write_parser.add_argument("path", help="File to be modified , if not set would output to stdout")
 
     link_write_parser.add_argument("-n", "--new-label", help="Text Label of the New Link")
+    link_write_parser.add_argument("--journal", help="Append the new link to <path>.journal instead of rewriting the file (O(1), for frequent/concurrent writers)", action="store_true")
 
 
     # link show
@@ -316,41 +604,111 @@ def main():
 
 
     ## ----------------------------------------------------------------------------
-    # @section PARSE_AND_DISPATCH
+    # @section WATCH
 
-    args = parser.parse_args()
+    watch_parser = subparsers.add_parser("watch", help="Refresh the EGB Blocks sourced from local files when those change", description=watch.__doc__)
+    watch_parser.add_argument("path", help="Input file")
+    watch_parser.add_argument("--debounce", type=float, default=0.5, help="Seconds without changes before a burst is processed and saved (default: 0.5)")
+    watch_parser.add_argument("--poll", help="Poll the files instead of using inotify", action="store_true")
+    watch_parser.add_argument("--interval", type=float, default=1.0, help="Polling interval in seconds (default: 1.0)")
 
-    if args.command == "file":
-        if args.subcommand == "new":
-            cli_file_new(args)
-        if args.subcommand == "append":
-            cli_file_append(args)
-        if args.subcommand == "update":
-            if args.update_target == "toc":
-                cli_file_update_toc(args)
-            if args.update_target == "notoc":
-                cli_file_update_notoc(args)
-        if args.subcommand == "refresh":
-            cli_file_refresh(args)
-        if args.subcommand == "migrate":
-            cli_file_migrate(args)
+    ## EOF EOF EOF WATCH
+    ## ----------------------------------------------------------------------------
 
 
-    if args.command == "block":
-        if args.subcommand == "write":
-            cli_block_write(args)
-        elif args.subcommand == "show":
-            cli_block_show(args)
-        elif args.subcommand == "source":
-            cli_block_source(args)
+    ## ----------------------------------------------------------------------------
+    # @section EXPORT
 
+    export_parser = subparsers.add_parser("export", help="Export the document as a static site (one page per Block)", description=export.__doc__)
+    export_parser.add_argument("path", help="Input file")
+    export_parser.add_argument("--format", choices=["html", "md"], default="html", help="Pages format (default: html)")
+    export_parser.add_argument("--out", help="Output directory (default: the input path without extension, plus -html/-md)")
+    export_parser.add_argument("-j", "--jobs", type=int, help="Worker processes rendering the pages (default: one per CPU)")
+    export_parser.add_argument("--force", help="Render every page again, even if unchanged since the last export", action="store_true")
 
-    elif args.command == "link":
-        if args.subcommand == "write":
-            cli_link_write(args)
-        elif args.subcommand == "show":
-            cli_link_show(args)
+    ## EOF EOF EOF EXPORT
+    ## ----------------------------------------------------------------------------
+
+
+    ## ----------------------------------------------------------------------------
+    # @section DIFF
+
+    diff_parser = subparsers.add_parser("diff", help="Compare two documents Block by Block", description=diff.__doc__)
+    diff_parser.add_argument("old", help="Old document")
+    diff_parser.add_argument("new", help="New document")
+    diff_parser.add_argument("--by", choices=["buid", "source"], default="buid", help="Match the Blocks by buid or by source (default: buid)")
+    diff_parser.add_argument("--lines", help="Show the line diff of the content of the modified Blocks", action="store_true")
+    diff_parser.add_argument("--json", help="One JSON object per changed Block", action="store_true")
+
+    ## EOF EOF EOF DIFF
+    ## ----------------------------------------------------------------------------
+
+
+    ## ----------------------------------------------------------------------------
+    # @section DEDUP
+
+    dedup_parser = subparsers.add_parser("dedup", help="Find (and merge) near-duplicate Blocks", description=dedup.__doc__)
+    dedup_parser.add_argument("path", help="Input file")
+    dedup_mode = dedup_parser.add_mutually_exclusive_group()
+    dedup_mode.add_argument("--report", help="Only report the clusters of duplicates (default)", action="store_true")
+    dedup_mode.add_argument("--merge", help="Keep the first Block of each cluster, removing the others", action="store_true")
+    dedup_parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity of two duplicates (default: 0.8)")
+    dedup_parser.add_argument("--shingle", type=int, default=3, help="Words per shingle (default: 3)")
+    dedup_parser.add_argument("--permutations", type=int, default=128, help="Values of the MinHash signatures (default: 128)")
+    dedup_parser.add_argument("--json", help="One JSON object per cluster", action="store_true")
+
+    ## EOF EOF EOF DEDUP
+    ## ----------------------------------------------------------------------------
+
+
+    ## ----------------------------------------------------------------------------
+    # @section HISTORY
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Snapshot the document (only the changed Blocks are stored)", description=snapshot.__doc__)
+    snapshot_parser.add_argument("path", help="Input file")
+    snapshot_parser.add_argument("-m", "--message", help="Description of the snapshot")
+
+    history_parser = subparsers.add_parser("history", help="List the snapshots of the document", description=history.__doc__)
+    history_parser.add_argument("path", help="Input file")
+    history_parser.add_argument("-b", "--buid", help="Only the snapshots where this Block changed")
+    history_parser.add_argument("--json", help="One JSON object per snapshot", action="store_true")
+
+    restore_parser = subparsers.add_parser("restore", help="Restore the document, or one of its Blocks, from a snapshot", description=restore.__doc__)
+    restore_parser.add_argument("path", help="Input file")
+    restore_parser.add_argument("-s", "--snapshot", type=int, required=True, help="Snapshot id (see danotes history)")
+    restore_target = restore_parser.add_mutually_exclusive_group()
+    restore_target.add_argument("-b", "--buid", help="Restore only this Block")
+    restore_target.add_argument("-o", "--output", help="Write the snapshot to this file instead of restoring the document")
+
+    ## EOF EOF EOF HISTORY
+    ## ----------------------------------------------------------------------------
+
+
+    ## ----------------------------------------------------------------------------
+    # @section LSP
+
+    lsp_parser = subparsers.add_parser("lsp", help="Language server for link navigation (JSON-RPC over stdio)", description=lsp.__doc__)
+    lsp_parser.add_argument("--stdio", help="Communicate over stdin/stdout (the only transport, accepted for editors passing it)", action="store_true")
+
+    ## EOF EOF EOF LSP 
+    ## ----------------------------------------------------------------------------
+
+
+
+
+    ## ----------------------------------------------------------------------------
+    # @section PARSE_AND_DISPATCH
+
+    args = parser.parse_args()
 
+    profile_from_env(args.profile_format if args.profile else None, args.profile_dump)
+    try:
+        with PROFILER.phase(f"command: {args.command} {getattr(args, 'subcommand', '')}".strip()):
+            dispatch(args)
+    finally:
+        if PROFILER.enabled:
+            PROFILER.stop()
+            PROFILER.report()
 
     ## EOF EOF EOF PARSE_AND_DISPATCH 
     ## ----------------------------------------------------------------------------
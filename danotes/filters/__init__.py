@@ -0,0 +1,2 @@
+from .registry import *
+from .native import *
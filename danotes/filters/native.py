@@ -0,0 +1,63 @@
+"""
+Builtin native filters (run in-process, no pandoc -L needed)
+"""
+
+import re
+from .registry import register_filter
+
+
+## ----------------------------------------------------------------------------
+# @section HTML_FILTERS
+# @description Receive the selected bs4 Tag and modify it in place
+
+NAV_TAGS = ('nav', 'header', 'footer', 'aside')
+
+
+@register_filter('strip-nav', stage='html')
+def strip_nav(root):
+    """Remove navigation chrome: <nav>, <header>, <footer>, <aside> and role="navigation" elements"""
+    for tag in root.find_all(NAV_TAGS):
+        tag.decompose()
+    for tag in root.find_all(attrs={'role': 'navigation'}):
+        tag.decompose()
+    return root
+
+
+@register_filter('normalize-headings', stage='html')
+def normalize_headings(root):
+    """Shift the heading levels so the top-most heading found becomes <h1>"""
+    headings = root.find_all(re.compile(r'^h[1-6]$'))
+    if not headings:
+        return root
+
+    shift = min(int(tag.name[1]) for tag in headings) - 1
+    if shift:
+        for tag in headings:
+            tag.name = f'h{int(tag.name[1]) - shift}'
+    return root
+
+## EOF EOF EOF HTML_FILTERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section TEXT_FILTERS
+# @description Receive the list of lines of the content, return the new list
+
+@register_filter('collapse-whitespace', stage='text')
+def collapse_whitespace(lines: list) -> list:
+    """Strip trailing whitespace and collapse runs of blank lines into a single one"""
+    output = []
+    for line in lines:
+        line = line.rstrip()
+        if not line and output and not output[-1]:
+            continue
+        output.append(line)
+    return output
+
+## EOF EOF EOF TEXT_FILTERS
+## ----------------------------------------------------------------------------
+
+
+__all__ = ['strip_nav', 'normalize_headings', 'collapse_whitespace']
@@ -0,0 +1,94 @@
+"""
+Filter Registry Implementation
+
+Resolves the `filters` names of an EGB once per run:
+    - Native filters: python callables run in-process
+        - stage 'html' : receive the selected bs4 Tag, modify it in place (before pandoc)
+        - stage 'text' : receive the list of output lines, return the new list (after pandoc)
+    - Lua filters: ./danotes/filters/user/*.lua (preferred) or ./danotes/filters/builtin/*.lua , passed to pandoc with -L
+User native filters can be dropped as ./danotes/filters/user/*.py using @register_filter
+"""
+
+import importlib.util
+from importlib import resources
+
+
+class FilterRegistry():
+    """Name -> filter lookups, discovered and cached once per run"""
+    ## Core methods -------------------
+    def __init__(self):
+        self.native = {}
+        self.lua = None
+
+    def __repr__(self):
+        return f"FilterRegistry(native={list(self.native)}, lua={self.lua})"
+
+    ## Modification methods -----------
+    def register(self, name: str, stage: str = 'text'):
+        """Decorator registering a native python filter under a name"""
+        if stage not in ('html', 'text'):
+            raise ValueError(f"{stage=} must be 'html' or 'text'")
+
+        def decorator(func):
+            self.native[name] = (stage, func)
+            return func
+        return decorator
+
+    def discover(self):
+        """Scan the filter directories once (user filters take precedence over builtin ones)"""
+        if self.lua is not None:
+            return self
+
+        self.lua = {}
+        for package in ("danotes.filters.builtin", "danotes.filters.user"):
+            for resource in resources.files(package).iterdir():
+                if resource.name.endswith('.lua') and resource.is_file():
+                    with resources.as_file(resource) as path:
+                        self.lua[resource.name[:-len('.lua')]] = str(path)
+                elif resource.name.endswith('.py') and resource.is_file():
+                    with resources.as_file(resource) as path:
+                        spec = importlib.util.spec_from_file_location(f"danotes.filters.user.{resource.name[:-len('.py')]}", path)
+                        module = importlib.util.module_from_spec(spec)
+                        spec.loader.exec_module(module)
+        return self
+
+    ## Getter Methods -----------------
+    def resolve(self, filters: str) -> tuple[list, list, list]:
+        """
+        Split a comma separated filters string into (html_filters, lua_paths, text_filters)
+        Native filters win over Lua filters with the same name
+        """
+        self.discover()
+        html_filters, lua_paths, text_filters = [], [], []
+
+        if not filters:
+            return (html_filters, lua_paths, text_filters)
+
+        for filter_name in filters.split(','):
+            filter_name = filter_name.strip()
+            if not filter_name:
+                continue
+            if filter_name in self.native:
+                stage, func = self.native[filter_name]
+                if stage == 'html':
+                    html_filters.append(func)
+                else:
+                    text_filters.append(func)
+            elif filter_name in self.lua:
+                lua_paths.append(self.lua[filter_name])
+            else:
+                print(f"[Warning]: Filter {filter_name=} not found in danotes/filters/user/ or danotes/filters/builtin/")
+
+        return (html_filters, lua_paths, text_filters)
+
+
+## Registry in use for the whole run
+FILTER_REGISTRY = FilterRegistry()
+
+
+def register_filter(name: str, stage: str = 'text'):
+    """Register a native filter on the run registry (usable from danotes/filters/user/*.py)"""
+    return FILTER_REGISTRY.register(name, stage)
+
+
+__all__ = ['FilterRegistry', 'FILTER_REGISTRY', 'register_filter']
@@ -1,22 +1,45 @@
+import sys
 from ..model import *
 
 
-def block_write(path, buid=None, query=None, new_label=None, source=None, json=False, text=False):
+@locked_document
+def block_write(path, buid=None, query=None, new_label=None, source=None, json=False, text=False, journal=False, stream=None):
     """Write a determined Dan Block Object. 
     If --new-label , it will create a New Block on the next available <buid>.
     If not --new-label , but --query , it will append on the last block
     If target Block already exists will append text to it
     If target Block doesnt exist give an error
     If target Block --buid 1 , will update the Toc Block (General Toc)
+    If --journal , the edit is appended to <path>.journal without loading the file (see danotes file compact)
+    stream: binary file (e.g. piped stdin) whose text is the query, streamed into the file without loading it when possible
     """
-    print(f"Writing {json=} {text=} {buid=} {path=} {query=} {new_label=} {source=} ")
+    print(f"Writing {json=} {text=} {buid=} {path=} {query=} {new_label=} {source=} {journal=} {stream=}")
 
     if not is_valid_dan_format(path):
         raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
 
-    danom = Danom()
-    danom.load(path)
-    danom.get_links_target()
+    if stream is not None:
+        ## Bounded memory whatever the size of the text (see danotes.model.ingest)
+        if not (json or text or journal) and buid not in ('0', '1'):
+            streamed = stream_append(path, buid, stream)
+            if streamed is not None:
+                print(f"Streamed {streamed[1]} bytes into {streamed[0]=}", file=sys.stderr)
+                return streamed[0]
+        query = stream.read().decode('utf-8')
+
+    if journal:
+        if json or text:
+            raise ValueError("--journal does not load the file, it cannot be combined with --json or --text")
+        if query:
+            entry = journal_append(path, 'append_query', buid=buid, query=query)
+        elif not buid:
+            entry = journal_append(path, 'new_block', label=new_label, source=source)
+        else:
+            return buid
+        return entry['buid']
+
+    ## Sharded documents only load the shards of the Blocks involved
+    danom = load_document(path, lazy=True)
 
 
     ## Adding the source for hierarchy
@@ -65,19 +88,34 @@ def block_write(path, buid=None, query=None, new_label=None, source=None, json=F
 
 
 
-def block_show(path, buid=None, label=None, json=False, text=False):
+@locked_document
+def block_show(path, buid=None, label=None, json=False, text=False, ndjson=False, fields=None):
     """Show/update a determined Dan Block Object
     If no --json and --text are given. Update in place the determined block
     If no --buid or --label are given. Show all the document from buid=0 to last
+    If --ndjson , stream one JSON Block per line as the file is parsed
+    If --fields , only serialize those Block keys (e.g. buid,label,links_target)
     """
-    print(f"Showing {json=} {text=} {buid=} {label=} {path=}")
+    print(f"Showing {json=} {text=} {ndjson=} {fields=} {buid=} {label=} {path=}", file=sys.stderr)
 
     if not is_valid_dan_format(path):
         raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
 
-    danom = Danom()
-    danom.load(path)
-    danom.get_links_target()
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+    ## Streaming output, the Toc Block needs the whole danom so it goes the regular way
+    if ndjson and buid != '1':
+        return iter_block_ndjson(path, buid=buid, label=label, fields=fields)
+
+    ## A single Block of a .danb is decoded alone through the offset table (the Toc Block needs the whole danom)
+    if buid not in (None, '1') and label is None and (json or text) and is_danb(path) and not read_journal(path)[0]:
+        block = read_danb_block(path, buid)
+        if block is None:
+            raise ValueError(f"{buid=} does not exist.")
+        return block.to_json(fields=fields) if json else block.to_text()
+
+    danom = load_document(path, lazy=buid is not None or label is not None)
 
 
     ## Selecting target by block or whole danom
@@ -101,29 +139,146 @@ def block_show(path, buid=None, label=None, json=False, text=False):
             target = danom
 
     # Outputting info in the desired format
-    if json:
-        return target.to_json()
+    if ndjson:
+        return target.to_ndjson(fields) + '\n'
+    elif json:
+        return target.to_json(fields=fields)
     elif text:
         return target.to_text()
     else:
+        ## Updating in place renders the target again (a Block, or the whole Danom)
+        target.mark_dirty()
         danom.to_file(path)
     # @todo update_tags_file(path)
         return f"{path} danom has been successfully updated.\n"
 
 
+def block_select(path, query, json=False, text=False, ndjson=False, fields=None):
+    """Select the Blocks matching a query, e.g. 'source:*.html and label~"Request" and links>3'
+    Attributes: buid, label, title_marked, source, title_cmd, content_cmd, filters, lines, links, position
+    Operators: field:glob field~regex field=value field!=value field>n (>=, <, <=) , and/or/not and parentheses
+    The query runs on the attribute index of the document (<path>.index, rebuilt when the document changes),
+    only the selected Blocks are read. Without --json/--text/--ndjson , a summary line per Block (buid, lines, links, label, source)
+    """
+    print(f"Selecting {query=} {json=} {text=} {ndjson=} {fields=} {path=}", file=sys.stderr)
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+    rows, total = select_rows(path, query)
+    print(f"{len(rows)} of {total} Blocks match", file=sys.stderr)
+
+    if ndjson:
+        return (block.to_ndjson(fields) + '\n' for block in iter_selected_blocks(path, rows))
+    elif json:
+        return Danom(iter_selected_blocks(path, rows)).to_json(fields=fields)
+    elif text:
+        return ''.join(block.to_text() for block in iter_selected_blocks(path, rows))
+    if not rows:
+        return ''
+    return '\n'.join(format_row(row) for row in rows) + '\n'
+
+
+def iter_block_ndjson(path, buid=None, label=None, fields=None):
+    """Generator streaming the selected Blocks as NDJSON lines while the file is parsed
+    block_show returns it unread (its locked_document lock is released by then), so the journal lock is taken
+    here, for as long as the stream is read
+    """
+    if not has_journal(path):
+        yield from scan_block_ndjson(path, buid=buid, label=label, fields=fields)
+        return
+    with journal_lock(path):
+        yield from scan_block_ndjson(path, buid=buid, label=label, fields=fields)
+
+
+def scan_block_ndjson(path, buid=None, label=None, fields=None):
+    if buid is not None and label is not None:
+        raise ValueError("Cannot specify both buid and label.")
+
+    ## Pending edits of the write-ahead journal are shown too
+    entries, _ = read_journal(path)
+    ## A single Block of a .dan.zst only needs the frame holding it decompressed
+    if buid is not None and not entries and compression_of(path) == 'zstd':
+        block = read_zstd_block(path, buid)
+        if block is None:
+            raise ValueError(f"{buid=} does not exist.")
+        if block is not False:
+            yield block.to_ndjson(fields) + '\n'
+            return
+    ## A single Block of a .danb only needs its frame decoded, found through the offset table
+    if buid is not None and not entries and is_danb(path):
+        block = read_danb_block(path, buid)
+        if block is None:
+            raise ValueError(f"{buid=} does not exist.")
+        yield block.to_ndjson(fields) + '\n'
+        return
+
+    blocks = Danom.iter_load(path)
+    if entries:
+        blocks = iter_fold_journal(blocks, entries)
+
+    for block in blocks:
+        if buid is not None and block.buid != buid:
+            continue
+        if label is not None and block.label != label:
+            continue
+        yield block.to_ndjson(fields) + '\n'
+        if buid is not None or label is not None:
+            return
 
+    if buid is not None:
+        raise ValueError(f"{buid=} does not exist.")
+    if label is not None:
+        raise ValueError(f"{label=} does not exist.")
 
-def block_source(path, buid=None, source=None, title=None, content=None, filters=None, json=False, text=False):
+
+
+@locked_document
+def block_source(path, buid=None, source=None, title=None, content=None, filters=None, json=False, text=False, ttl=None, timeout=None, max_output=None, snapshot=False,
+                 crawl=None, max_depth=CRAWL_MAX_DEPTH, match=None, jobs=None, per_host=CRAWL_PER_HOST, delay=CRAWL_DELAY, max_pages=CRAWL_MAX_PAGES):
     """Sourcing a block or the whole document (Updating according to source information)
+    The output of command sources is reused for --ttl seconds (0 runs them again), commands are killed after --timeout seconds or --max-output bytes
+    If --snapshot , the document is snapshotted before sourcing (see danotes history / restore)
+    If --crawl URL , the pages of the site under URL (up to --max-depth links away, matching --match) are fetched concurrently
+    and each one becomes an EGB Block (--title/--content/--filters extraction), all of them saved at once.
+    Pages already sourced on the document update their Block
     """
-    print(f"Sourcing the block {path} {buid=} {source=} {title=} {content=} {filters=} {json=} {text=}")
+    print(f"Sourcing the block {path} {buid=} {source=} {title=} {content=} {filters=} {json=} {text=} {ttl=} {timeout=} {max_output=} {snapshot=} {crawl=}")
+    options = {'ttl': ttl, 'timeout': timeout, 'max_bytes': max_output}
 
     if not is_valid_dan_format(path):
         raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
 
-    danom = Danom()
-    danom.load(path)
-    danom.get_links_target()
+    if snapshot:
+        take_snapshot(path, "before block source")
+
+    if crawl:
+        if source or buid is not None:
+            raise ValueError("--crawl creates its own Blocks, it does not take --source or --buid")
+        pages = crawl_site(crawl, max_depth=max_depth, match=match, jobs=jobs, per_host=per_host, delay=delay, max_pages=max_pages)
+        blocks = extract_pages(pages, path, title_cmd=title, content_cmd=content, filters=filters, jobs=jobs)
+
+        danom = load_document(path)
+        ## Sources written by hand may not be normalized, and a directory is the same page as its index
+        sourced = {page_key(block.source): block for block in danom if block.source}
+        created = 0
+        for block in blocks:
+            current = sourced.get(page_key(block.source))
+            if current is not None:
+                current.label, current.content = block.label, block.content
+                current.title_cmd, current.content_cmd, current.filters = block.title_cmd, block.content_cmd, block.filters
+                continue
+            block.buid = danom.get_next_available_buid()
+            danom.append(block)
+            created += 1
+
+        danom.to_file(path)
+        return f"{len(pages)} pages crawled from {crawl}: {created} Blocks created, {len(blocks) - created} updated on {path}.\n"
+
+    danom = load_document(path, lazy=bool(source))
 
     ## Create a new Block if source is been inputed
     if source:
@@ -135,10 +290,15 @@ def block_source(path, buid=None, source=None, title=None, content=None, filters
             block.content_cmd = content
         if filters:
             block.filters = filters
-        block.update_content(path)
+        block.update_content(path, **options)
+    elif buid is not None:
+        block = danom.get_block_by_buid(buid)
+        if block is None:
+            raise ValueError(f"{buid=} does not exist.")
+        block.update_content(path, **options)
     else:
         for block in danom:
-            block.update_content(path)
+            block.update_content(path, **options)
 
     danom.to_file(path)
     # @todo update_tags_file(path)
@@ -0,0 +1,142 @@
+import os
+import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ..model import *
+from .file import file_refresh, file_update_toc, file_update_notoc, file_migrate
+
+
+## File operations that can be run over many documents, and the handler run for each one
+BULK_OPERATIONS = {
+    'refresh': file_refresh,
+    'update toc': file_update_toc,
+    'update notoc': file_update_notoc,
+    'migrate': file_migrate,
+}
+## Documents picked from directories (legacy vim-dan documents are always .dan text)
+BULK_SUFFIXES = ('.dan', '.danb', '.danm', '.dan.gz', '.dan.zst')
+LEGACY_SUFFIXES = ('.dan',)
+GLOB_CHARS = '*?['
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def is_bulk_request(paths: list) -> bool:
+    """Return if the paths name more than a single document (several paths, a directory or a glob pattern)"""
+    if len(paths) != 1:
+        return True
+    path = paths[0]
+    return os.path.isdir(path) or (any(char in path for char in GLOB_CHARS) and not os.path.exists(path))
+
+
+def iter_directory(path, recursive: bool, suffixes: tuple):
+    """Documents of a directory (and its subdirectories if recursive), sorted by path
+    Shard directories (<stem>.shards/), snapshot stores and hidden ones are skipped, shards are processed through their manifest
+    """
+    for root, dirs, files in os.walk(path):
+        if recursive:
+            dirs[:] = sorted(name for name in dirs if not name.endswith(('.shards', SNAPSHOTS_SUFFIX)) and not name.startswith('.'))
+        else:
+            dirs[:] = []
+        for name in sorted(files):
+            if name.endswith(suffixes):
+                yield os.path.join(root, name)
+
+
+def expand_paths(paths: list, recursive: bool = False, suffixes: tuple = BULK_SUFFIXES) -> list:
+    """Documents named by files, directories and glob patterns ('**' matches subdirectories if recursive)
+    Files are taken as given, each document is listed once
+    """
+    documents = []
+    seen = set()
+    for path in paths:
+        if any(char in path for char in GLOB_CHARS) and not os.path.exists(path):
+            matches = sorted(glob.glob(path, recursive=recursive))
+            if not matches:
+                print(f"[Warning]: {path} does not match any file", file=sys.stderr)
+        else:
+            matches = [path]
+
+        for match in matches:
+            candidates = iter_directory(match, recursive, suffixes) if os.path.isdir(match) else [match]
+            for candidate in candidates:
+                key = os.path.realpath(candidate)
+                if key not in seen:
+                    seen.add(key)
+                    documents.append(candidate)
+    return documents
+
+
+def run_bulk_job(job: tuple) -> tuple:
+    """Run a file operation over a document (process pool worker). job = (operation, path, options of the handler)
+    Returns (path, error message or None, seconds), errors are reported instead of raised
+    """
+    operation, path, options = job
+    start = time.perf_counter()
+    try:
+        BULK_OPERATIONS[operation](path, **options)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return path, error, time.perf_counter() - start
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def file_bulk(operation, paths, recursive=False, jobs=None, **options):
+    """Run a file operation (refresh, update toc, update notoc, migrate) over every document named by
+    paths (files, directories, glob patterns) on a process pool of --jobs workers
+    Progress is streamed to stderr as each document finishes, a failing document does not stop the others
+    options are passed to the handler of each document (e.g. snapshot=True for migrate)
+    Returns the exit status: 0 if every document succeeded, 1 otherwise
+    """
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f"{operation=} Expected any of {list(BULK_OPERATIONS)}")
+
+    suffixes = LEGACY_SUFFIXES if operation == 'migrate' else BULK_SUFFIXES
+    documents = expand_paths(paths, recursive=recursive, suffixes=suffixes)
+    if not documents:
+        raise ValueError(f"{paths} No documents found (expected {', '.join(suffixes)} files, use --recursive for subdirectories)")
+
+    workers = min(jobs or os.cpu_count() or 1, len(documents))
+    print(f"Running file {operation} over {len(documents)} documents with {workers} workers", file=sys.stderr)
+
+    start = time.perf_counter()
+    failed = []
+    pending = [(operation, path, options) for path in documents]
+
+    def report(done, result):
+        path, error, elapsed = result
+        if error is None:
+            print(f"[{done}/{len(documents)}] ok {path} ({elapsed:.2f}s)", file=sys.stderr)
+        else:
+            failed.append((path, error))
+            print(f"[{done}/{len(documents)}] FAILED {path} ({elapsed:.2f}s): {error}", file=sys.stderr)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_bulk_job, job) for job in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                report(done, future.result())
+    else:
+        for done, job in enumerate(pending, 1):
+            report(done, run_bulk_job(job))
+
+    elapsed = time.perf_counter() - start
+    print(f"file {operation}: {len(documents) - len(failed)} of {len(documents)} documents succeeded, {len(failed)} failed ({elapsed:.2f}s)")
+    for path, error in failed:
+        print(f"  {path}: {error}")
+    return 1 if failed else 0
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['file_bulk', 'is_bulk_request', 'expand_paths']
@@ -0,0 +1,33 @@
+import sys
+from ..model import *
+
+
+@locked_document
+def dedup(path, threshold=0.8, merge=False, shingle=3, permutations=128, json=False):
+    """Find the near-duplicate Blocks of a document (MinHash signatures of their content plus LSH), and report them
+    If --merge , only the first Block of each cluster is kept and the links to the others point to it
+    """
+    print(f"Deduplicating {path=} {threshold=} {merge=} {shingle=} {permutations=}", file=sys.stderr)
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+    if merge and is_manifest(path):
+        raise ValueError(f"{path} is a shard manifest, unshard it to merge its duplicates (see file unshard)")
+
+    danom = load_document(path)
+    clusters = find_duplicates(danom, threshold=threshold, permutations=permutations, size=shingle)
+    duplicates = sum(len(cluster.duplicates) for cluster in clusters)
+
+    if merge and clusters:
+        merge_duplicates(danom, clusters)
+        danom.to_file(path)
+
+    if json:
+        return clusters_to_json(clusters)
+
+    output = [format_clusters(clusters)] if clusters else []
+    if merge:
+        output.append(f"{len(clusters)} clusters, {duplicates} duplicate Blocks removed from {path}.")
+    else:
+        output.append(f"{len(clusters)} clusters, {duplicates} duplicate Blocks (use --merge to remove them).")
+    return '\n'.join(output) + '\n'
@@ -0,0 +1,35 @@
+import sys
+from ..model import *
+
+
+def diff(old, new, by='buid', lines=False, json=False):
+    """Compare two documents Block by Block: added, removed, relabelled and modified (header fields or content) Blocks
+    Blocks are matched by buid, or by source (--by source) for regenerated EGB documents where buids may shift
+    If --lines , the line diff of the content of each modified Block is shown too
+    """
+    print(f"Comparing {old=} {new=} {by=} {lines=}", file=sys.stderr)
+
+    for path in (old, new):
+        if not is_valid_dan_format(path):
+            raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+
+    changes, unchanged = diff_documents(old, new, by=by)
+    line_diffs = {}
+    if lines:
+        line_diffs = {change.new.position: diff_lines for change, diff_lines in iter_line_diffs(old, new, changes)}
+
+    ## One JSON object per changed Block
+    if json:
+        output = []
+        for change in changes:
+            diff_lines = line_diffs.get(change.new.position) if lines and change.status == 'modified' else None
+            output.append(change_to_json(change, diff_lines) + '\n')
+        return ''.join(output)
+
+    output = [f"--- {old}", f"+++ {new}"]
+    for change in changes:
+        output.append(format_change(change))
+        if change.status == 'modified' and change.new.position in line_diffs:
+            output.extend(line_diffs[change.new.position][2:])
+    output.append(diff_summary(changes, unchanged))
+    return '\n'.join(output) + '\n'
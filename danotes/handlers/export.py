@@ -0,0 +1,75 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from ..model import *
+from ..model.export import INDEX_NAME
+
+
+## Fewer changed pages than this are rendered in this process, starting the pool would cost more
+POOL_MIN_PAGES = 64
+
+
+def export(path, format='html', out=None, jobs=None, force=False):
+    """Export the document as a static site: one page per Block, and an index page with the Document TOC
+    Links between Blocks become hyperlinks. Only the pages whose Block (or its neighbours) changed since
+    the last export to the same --out directory are rendered again, on a process pool of --jobs workers
+    If --force , every page is rendered again
+    """
+    print(f"Exporting {path=} {format=} {out=} {jobs=} {force=}", file=sys.stderr)
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"{format=} Expected any of {EXPORT_FORMATS}")
+    if out is None:
+        out = f"{os.path.splitext(path)[0]}-{format}"
+
+    danom = load_document(path)
+    if danom.get_block_by_buid('1') is not None:
+        danom.update_toc_block()
+
+    os.makedirs(out, exist_ok=True)
+    previous_pages = {} if force else read_export_manifest(out, format)
+    pages = {}
+    pending = []
+
+    ## Article pages, each one with its neighbours for the navigation
+    articles = [block for block in danom if block.buid not in ('0', '1')]
+    for i, block in enumerate(articles):
+        previous = articles[i - 1] if i > 0 else None
+        following = articles[i + 1] if i + 1 < len(articles) else None
+        record = page_record(block, previous, following)
+        name = page_name(block.buid, format)
+        pages[name] = record_hash(record, format)
+        if previous_pages.get(name) != pages[name] or not os.path.exists(os.path.join(out, name)):
+            pending.append((out, format, record))
+
+    if len(pending) >= POOL_MIN_PAGES and jobs != 1:
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(write_page, pending, chunksize=max(1, len(pending) // (workers * 4))):
+                pass
+    else:
+        for job in pending:
+            write_page(job)
+
+    ## Index page (Document TOC)
+    title = danom[0].label if danom and danom[0].buid == '0' else os.path.basename(path)
+    toc_block = danom.get_block_by_buid('1')
+    toc_lines = list(toc_block.content) if toc_block is not None else []
+    index_name = f"{INDEX_NAME}.{format}"
+    pages[index_name] = record_hash({'title': title, 'toc': toc_lines}, format)
+    if previous_pages.get(index_name) != pages[index_name] or not os.path.exists(os.path.join(out, index_name)):
+        with atomic_writer(os.path.join(out, index_name), 'w') as file:
+            file.write(render_index(title, toc_lines, format))
+
+    ## Pages of Blocks that are gone
+    removed = [name for name in previous_pages if name not in pages]
+    for name in removed:
+        try:
+            os.unlink(os.path.join(out, name))
+        except FileNotFoundError:
+            pass
+
+    write_export_manifest(out, format, pages)
+    return f"{path} has been successfully exported to {out} ({len(pending)} of {len(articles)} pages rendered, {len(removed)} removed).\n"
@@ -1,3 +1,4 @@
+from pathlib import Path
 from ..model import *
 
 def file_new(path, json=False, text=True):
@@ -22,45 +23,147 @@ def file_append(path, query):
     """Append text to a .dan formated file without parsing the Danom (dumber but faster on huge files)"""
     append_after_third_last_line(path, query)
 
+@locked_document
 def file_update_toc(path):
     """Alias for danotes block write --buid 1"""
-    danom = Danom()
-    danom.load(path)
-    danom.get_links_target()
+    ## Sharded documents assemble the Toc Block from the manifest, only the head shard is saved
+    danom = load_document(path, lazy=True)
     danom.update_toc_block()
     danom.to_file(path)
     # @todo update_tags_file(path)
     return f"{path} toc block has been succesfully update alongside its danom.\n"
 
+@locked_document
 def file_update_notoc(path):
     """Will update the whole file without putting any article toc and not altering Toc Block (useful for vim-dan-generator .dan files) """
-    danom = Danom()
-    danom.load(path)
+    danom = load_document(path)
     danom.to_file_notoc(path)
     # @todo update_tags_file(path)
 
     return f"{path} has been succesfully updated without Block Tocs and Toc Block.\n"
 
+@locked_document
 def file_refresh(path):
     """Alias for danotes block write which updates all the file"""
-    danom = Danom()
-    danom = danom.load(path)
-    danom.get_links_target()
+    danom = load_document(path)
+    ## Refresh renders every Block again (normalizing figlets, Article TOCs and footers)
+    danom.mark_dirty()
     danom.to_file(path)
     # @todo update_tags_file(path)
     return f"{path} danom has been successfully updated.\n"
 
 
 
-def file_migrate(path):
-    """Migrate from vim-dan old syntax to danotes"""
-    transform_legacy_title(path) 
-
-    danom = Danom()
-    danom = danom.load(path)
-    danom = danom.update_from_legacy()
-    danom.to_file_notoc(path)
+def file_migrate(path, snapshot=False):
+    """Migrate from vim-dan old syntax to danotes
+    The legacy file is read once and the migrated Blocks are written as they are parsed (see migrate_legacy)
+    If --snapshot , the legacy file is snapshotted first (see danotes restore)
+    """
+    ## Migrating twice would shift the buids again
+    if is_valid_dan_format(path):
+        raise ValueError(f"{path} is already in danotes syntax, nothing to migrate")
+    if snapshot:
+        take_snapshot(path, "before file migrate")
+    migrate_legacy(path)
 
     # @todo update_tags_file(path)
 
     return f"{path} has been successfully migrated to new danotes syntax.\n"
+
+
+
+def file_convert(path, output):
+    """Convert between .dan text, .danb binary and .dan.gz/.dan.zst compressed documents (format picked by the output extension)
+    The Danom model is kept losslessly, the text is rendered again (it may not be the source byte for byte),
+    except from .dan to .dan.gz/.dan.zst where the text is compressed as it is
+    """
+    print(f"Converting {path=} {output=}")
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+
+    danom = load_document(path)
+    danom.to_file_notoc(output, article_toc=True)
+
+    return f"{path} has been successfully converted to {output}.\n"
+
+
+
+@locked_document
+def file_compact(path):
+    """Apply the pending edits of the write-ahead journal (<path>.journal) to the file"""
+    print(f"Compacting {path=}")
+
+    entries, _ = read_journal(path)
+    if not entries:
+        return f"{path} has no pending journal entries.\n"
+
+    danom = Danom()
+    danom.load(path)
+    danom.to_file(path)
+
+    return f"{path} has been successfully compacted ({len(entries)} journal entries applied).\n"
+
+
+
+def file_shard(path, output=None, by='range', size=1000, depth=1, jobs=None):
+    """Split a document into a manifest (.danm) plus shard files, loaded and saved one shard at a time by the other commands
+    --by range : consecutive runs of --size Blocks
+    --by source: Blocks grouped by the first --depth components of their source directory
+    """
+    print(f"Sharding {path=} {output=} {by=} {size=} {depth=} {jobs=}")
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+    if is_manifest(path):
+        raise ValueError(f"{path} is already sharded")
+
+    if output is None:
+        output = str(Path(path).with_suffix('.danm'))
+
+    danom = Danom()
+    danom.load(path)
+    manifest = shard_danom(danom, output, by=by, size=size, depth=depth, workers=jobs)
+
+    return f"{path} has been successfully sharded into {output} ({len(manifest['shards'])} shards).\n"
+
+
+
+def file_unshard(path, output):
+    """Join the shards of a manifest (.danm) back into a single document (.danb extension for binary)"""
+    print(f"Unsharding {path=} {output=}")
+
+    if not is_manifest(path):
+        raise ValueError(f"{path} is not a shard manifest")
+
+    danom = load_document(path)
+    danom.to_file(output)
+
+    return f"{path} has been successfully unsharded into {output}.\n"
+
+
+
+@locked_document
+def file_merge(path, other, output=None):
+    """Merge the articles of another document into this one (or into --output), renumbering their buids
+    after the highest buid of the document and rewriting their links. The Toc Block tree is built again from both
+    """
+    print(f"Merging {path=} {other=} {output=}")
+
+    for document in (path, other):
+        if not is_valid_dan_format(document):
+            raise ValueError(f"{document} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+    if output is None:
+        output = path
+    if is_manifest(output):
+        raise ValueError(f"{output} is a shard manifest, merge into a single document and shard it again (see file unshard)")
+
+    danom = load_document(path)
+    incoming = load_document(other)
+    merged, mapping = merge_danoms(danom, incoming, incoming_path=other, output_path=output)
+    merged.to_file(output)
+
+    if not mapping:
+        return f"{other} has no articles to merge, {output} has been saved unchanged.\n"
+    buids = list(mapping.values())
+    return f"{other} has been successfully merged into {output} ({len(mapping)} Blocks, buids {buids[0]} to {buids[-1]}).\n"
@@ -0,0 +1,69 @@
+import sys
+from ..model import *
+
+
+@locked_document
+def snapshot(path, message=None):
+    """Snapshot the document on its content-addressed store (<path>.snapshots/), only the changed Blocks are stored"""
+    print(f"Snapshotting {path=} {message=}", file=sys.stderr)
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+
+    entry = take_snapshot(path, message)
+    if entry is None:
+        return f"No changes on {path} since snapshot {read_snapshots(path)[-1]['id']}.\n"
+    return f"Snapshot {entry['id']} of {path}: {len(entry['changed'])} of {entry['blocks']} Blocks changed, {entry['stored']} bytes stored.\n"
+
+
+def history(path, buid=None, json=False):
+    """List the snapshots of the document, oldest first
+    If --buid , only the snapshots where that Block changed
+    """
+    entries = read_snapshots(path)
+    if buid is not None:
+        entries = [entry for entry in entries if buid in entry['changed'] or buid in entry['removed']]
+
+    if json:
+        return ''.join(snapshot_to_json(entry) for entry in entries)
+    if not entries:
+        return f"No snapshots of {path} (see danotes snapshot).\n"
+    return '\n'.join(format_snapshot(entry) for entry in entries) + '\n'
+
+
+@locked_document
+def restore(path, snapshot, buid=None, output=None):
+    """Restore the document (or a single Block of it if --buid) as it was on a snapshot
+    The current document is snapshotted first, so a restore can be undone by restoring that snapshot
+    If --output , the snapshot is written there and the document is not touched
+    """
+    print(f"Restoring {path=} {snapshot=} {buid=} {output=}", file=sys.stderr)
+
+    if buid is not None and output is not None:
+        raise ValueError("--output restores the whole document, it does not take a --buid")
+
+    ## A missing snapshot (or Block) fails before anything is snapshotted or written
+    if buid is None:
+        fold_snapshots(read_snapshots(path), snapshot)
+    else:
+        block = snapshot_block(path, snapshot, buid)
+
+    if output is None:
+        before = take_snapshot(path, f"before restoring snapshot {snapshot}" + (f" buid={buid}" if buid is not None else ''))
+        if before is not None:
+            print(f"Snapshot {before['id']} taken before restoring", file=sys.stderr)
+
+    if buid is None:
+        written = restore_snapshot(path, snapshot, output)
+        return f"{output or path} has been restored to snapshot {snapshot} ({written} bytes).\n"
+
+    danom = load_document(path)
+    for position, current in enumerate(danom):
+        if current.buid == buid:
+            danom[position] = block
+            break
+    else:
+        print(f"[Warning]: {buid=} is not on {path} anymore, it is restored as the last Block")
+        danom.append(block)
+    danom.to_file(path)
+    return f"Block {buid} of {path} has been restored to snapshot {snapshot}.\n"
@@ -1,12 +1,19 @@
 from ..model import *
 
-def link_write(path, buid, uuid, new_label=None, json=False, text=True):
-    """Write a determined Dan Link Object"""
-    print(f"Writing {json=} {text=} {buid=} {uuid=} {new_label=} {path=}")
+@locked_document
+def link_write(path, buid, uuid, new_label=None, json=False, text=True, journal=False):
+    """Write a determined Dan Link Object
+    If --journal , the new link is appended to <path>.journal without loading the file (see danotes file compact)
+    """
+    print(f"Writing {json=} {text=} {buid=} {uuid=} {new_label=} {path=} {journal=}")
+
+    if journal:
+        if uuid:
+            raise ValueError(f"Feature not implemented")
+        entry = journal_append(path, 'new_link', buid=buid, label=new_label)
+        return entry['buid']
 
-    danom = Danom()
-    danom = danom.load(path)
-    danom.get_links_target()
+    danom = load_document(path, lazy=True)
 
     if uuid:
         # @todo
@@ -30,14 +37,14 @@ def link_write(path, buid, uuid, new_label=None, json=False, text=True):
     return iid
 
 
+@locked_document
 def link_show(path, buid, uuid, label, json=False, text=True):
     """For a block show/update the LinkTarget list of that Block
     For the Document show/update all the LinkTarget for each Block
     """
     print(f"Showing {json=} {text=} {buid=} {uuid=} {label=} {path=}")
 
-    danom = Danom()
-    danom = danom.load(path)
+    danom = load_document(path, lazy=buid is not None or label is not None)
 
     ## Selecting target by block or whole danom
     match (buid, label):
@@ -66,5 +73,7 @@ def link_show(path, buid, uuid, label, json=False, text=True):
     elif text:
         return target.to_text()
     else:
+        ## Updating in place renders the target again (a Block, or the whole Danom)
+        target.mark_dirty()
         danom.to_file(path)
         return f"{path} danom has been successfully updated.\n"
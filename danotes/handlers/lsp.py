@@ -0,0 +1,11 @@
+import sys
+from ..lsp import LanguageServer
+
+
+def lsp():
+    """Language server for .dan documents over stdio (JSON-RPC, Content-Length framed)
+    Keeps the open documents in memory, applying the incremental edits of the editor, and answers
+    go to definition (Link Source -> Link Target / Block), references, document and workspace symbols
+    """
+    print("danotes language server on stdio", file=sys.stderr)
+    return LanguageServer().serve()
@@ -0,0 +1,91 @@
+import os
+import sys
+from contextlib import nullcontext
+from ..model import *
+from ..watcher import make_watcher, wait_debounced
+
+
+def watch(path, debounce=0.5, poll=False, interval=1.0, max_batches=None):
+    """Watch the local files (text or .html) EGB Blocks are sourced from, re-running the extraction only for the affected Blocks.
+    Bursts of changes are debounced, and every debounce window is saved once.
+    Changes of the document itself (e.g. a new EGB from block source) are picked up too.
+    """
+    print(f"Watching {path=} {debounce=} {poll=} {interval=}", file=sys.stderr)
+
+    if not is_valid_dan_format(path):
+        raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. If the path is correct you may want to fix it")
+    if is_manifest(path):
+        raise ValueError(f"{path} is a shard manifest, watch a single file document (see danotes file unshard)")
+
+    document = os.path.realpath(path)
+    danom = load_watched(path)
+    sources = watched_sources(danom, path)
+    watcher = make_watcher(list(sources) + [document], poll=poll, interval=interval)
+    print(f"Watching {len(sources)} source files of {sum(len(buids) for buids in sources.values())} Blocks ({watcher!r})", file=sys.stderr)
+
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            changed = wait_debounced(watcher, debounce)
+
+            ## Some other command saved the document, its EGBs may have changed too
+            if is_stale(danom, path):
+                danom = load_watched(path)
+                sources = watched_sources(danom, path)
+                watcher.watch(list(sources) + [document])
+
+            buids = [buid for source in changed if source in sources for buid in sources[source]]
+            if not buids:
+                continue
+
+            with journal_lock(path) if has_journal(path) else nullcontext():
+                ## Re-checked under the lock, a writer may have saved while we were waiting
+                if is_stale(danom, path):
+                    danom = load_watched(path)
+                    sources = watched_sources(danom, path)
+                    buids = [buid for source in changed if source in sources for buid in sources[source]]
+
+                for buid in buids:
+                    block = danom.get_block_by_buid(buid)
+                    block.update_content(path)
+                danom.to_file(path)
+
+            batches += 1
+            print(f"{path} refreshed Blocks {buids} from {sorted(changed & set(sources))}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    return f"{path} watch finished after {batches} saves.\n"
+
+
+
+def load_watched(path) -> Danom:
+    danom = Danom()
+    danom.load(path)
+    return danom
+
+
+def watched_sources(danom, path) -> dict:
+    """Map each local source file (realpath) to the buids of the Blocks sourced from it"""
+    sources = {}
+    for block in danom:
+        local_source = block.local_source(path)
+        if local_source:
+            sources.setdefault(os.path.realpath(local_source), []).append(block.buid)
+    return sources
+
+
+def is_stale(danom, path) -> bool:
+    """True if the document (or its journal) changed since the Danom was loaded/saved"""
+    if danom.origin is None:
+        return True
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return True
+    if (stat.st_size, stat.st_mtime_ns) != (danom.origin['size'], danom.origin['mtime_ns']):
+        return True
+    entries, _ = read_journal(path)
+    return bool(entries)
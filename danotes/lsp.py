@@ -0,0 +1,393 @@
+"""
+Language server for .dan documents (`danotes lsp`), JSON-RPC over stdio
+
+Each open document is kept in memory as its lines, plus the Dan objects found on each line
+(Block Opening Tags, </B> footers, Link Sources <L=buid#iid> and Link Targets <I=buid#iid>).
+Incremental edits from the editor only parse the lines they touch, and the lookup indexes
+(buid -> Block, (buid, iid) -> Link Target, link -> Link Sources) are rebuilt from the per-line
+entries on the first request after an edit, the document is never parsed again as a whole.
+
+Requests answered:
+    textDocument/definition      Link Source -> its Link Target (or the Block Opening Tag if it has no iid)
+    textDocument/references      Link Target / Block / Link Source -> every Link Source pointing to it
+    textDocument/documentSymbol  Blocks (labels), with their Link Targets as children
+    workspace/symbol             Blocks and Link Targets of the open documents matching the query
+"""
+
+import re
+import sys
+import json
+
+
+BLOCK_OTAG_PATTERN = re.compile(r'<B=([0-9a-zA-Z]+)>(.*?)(?: \(X\))?\r?$')
+BLOCK_CTAG_PATTERN = re.compile(r'^</B>')
+LINK_PATTERN = re.compile(r'<L=([0-9a-zA-Z]+)(?:#([0-9a-zA-Z]+))?>(.*?)</L>|<I=([0-9a-zA-Z]+)#([0-9a-zA-Z]+)>(.*?)</I>')
+
+## LSP constants
+SYNC_INCREMENTAL = 2
+SYMBOL_MODULE = 2
+SYMBOL_FIELD = 8
+METHOD_NOT_FOUND = -32601
+INVALID_REQUEST = -32600
+INTERNAL_ERROR = -32603
+SERVER_NOT_INITIALIZED = -32002
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def read_message(stream) -> dict | None:
+    """Read a JSON-RPC message framed with a Content-Length header. None at the end of the stream"""
+    length = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.decode('ascii').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value.strip())
+    if length is None:
+        raise ValueError("JSON-RPC message without Content-Length")
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_message(stream, message: dict):
+    body = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    stream.write(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+    stream.flush()
+
+
+def parse_line(line: str):
+    """Dan objects of a line: None, or (block, closes, links)
+    block : (buid, label, start, end) of a Block Opening Tag
+    closes: True for a </B> footer line
+    links : [(kind 'L'|'I', buid, iid, label, start, end)]
+    """
+    block = None
+    match = BLOCK_OTAG_PATTERN.search(line)
+    if match:
+        block = (match.group(1), match.group(2), match.start(), match.end())
+    closes = bool(BLOCK_CTAG_PATTERN.match(line))
+    links = []
+    if '<' in line:
+        for match in LINK_PATTERN.finditer(line):
+            if match.group(1) is not None:
+                links.append(('L', match.group(1), match.group(2), match.group(3), match.start(), match.end()))
+            else:
+                links.append(('I', match.group(4), match.group(5), match.group(6), match.start(), match.end()))
+    if block is None and not closes and not links:
+        return None
+    return (block, closes, links)
+
+
+def to_units(line: str, index: int, encoding: str) -> int:
+    """Python str index on a line -> LSP character offset"""
+    if encoding == 'utf-16' and not line.isascii():
+        return len(line[:index].encode('utf-16-le')) // 2
+    return index
+
+
+def from_units(line: str, units: int, encoding: str) -> int:
+    """LSP character offset on a line -> Python str index"""
+    if encoding == 'utf-16' and not line.isascii():
+        return len(line.encode('utf-16-le')[:units * 2].decode('utf-16-le', errors='ignore'))
+    return min(units, len(line))
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section DOCUMENT_INDEX
+
+class DocumentIndex():
+    """Lines of an open document, the Dan objects of each line, and the lookup indexes built from them"""
+
+    ## Core methods -------------------
+    def __init__(self, uri: str, text: str, encoding: str = 'utf-16'):
+        self.uri = uri
+        self.encoding = encoding
+        self.lines = text.split('\n')
+        self.entries = [parse_line(line) for line in self.lines]
+        self.indexed = False
+
+    def __repr__(self):
+        return f"DocumentIndex(uri={self.uri!r}, lines={len(self.lines)})"
+
+    ## Modification methods -----------
+    def apply_change(self, change: dict):
+        """Apply a TextDocumentContentChangeEvent (a range edit, or the whole text if it has no range)"""
+        if 'range' not in change:
+            self.lines = change['text'].split('\n')
+            self.entries = [parse_line(line) for line in self.lines]
+            self.indexed = False
+            return self
+
+        start_line, start_char = self.offset(change['range']['start'])
+        end_line, end_char = self.offset(change['range']['end'])
+
+        text = self.lines[start_line][:start_char] + change['text'] + self.lines[end_line][end_char:]
+        new_lines = text.split('\n')
+        ## Only the lines touched by the edit are parsed
+        self.lines[start_line:end_line + 1] = new_lines
+        self.entries[start_line:end_line + 1] = [parse_line(line) for line in new_lines]
+        self.indexed = False
+        return self
+
+    ## Getter Methods -----------------
+    def offset(self, position: dict) -> tuple[int, int]:
+        """LSP position -> (line, str index), positions past the end are the end of the document"""
+        if position['line'] >= len(self.lines):
+            return (len(self.lines) - 1, len(self.lines[-1]))
+        line = self.lines[position['line']]
+        return (position['line'], from_units(line, position['character'], self.encoding))
+
+    def index(self):
+        """Lookup indexes, rebuilt from the per-line entries after an edit"""
+        if self.indexed:
+            return self
+        self.blocks = {}          ## buid -> (line, start, end, label)
+        self.targets = {}         ## (buid, iid) -> (line, start, end, label)
+        self.sources = {}         ## (buid, iid or None) -> [(line, start, end)]
+        self.block_ranges = []    ## [buid, label, first line, last line, tag (start, end), [(line, start, end, iid, label)]]
+
+        for number, entry in enumerate(self.entries):
+            if entry is None:
+                continue
+            block, closes, links = entry
+            if block is not None:
+                buid, label, start, end = block
+                self.blocks.setdefault(buid, (number, start, end, label))
+                self.block_ranges.append([buid, label, number, number, (start, end), []])
+            for kind, buid, iid, label, start, end in links:
+                if kind == 'I':
+                    self.targets.setdefault((buid, iid), (number, start, end, label))
+                    if self.block_ranges:
+                        self.block_ranges[-1][5].append((number, start, end, iid, label))
+                else:
+                    self.sources.setdefault((buid, iid), []).append((number, start, end))
+            if closes and self.block_ranges:
+                self.block_ranges[-1][3] = number
+
+        self.indexed = True
+        return self
+
+    def object_at(self, position: dict):
+        """The Dan object under the cursor: ('L'|'I', buid, iid) for links, ('B', buid, None) on a Block Opening Tag"""
+        if position['line'] >= len(self.lines):
+            return None
+        entry = self.entries[position['line']]
+        if entry is None:
+            return None
+        line = self.lines[position['line']]
+        character = from_units(line, position['character'], self.encoding)
+        block, _, links = entry
+        for kind, buid, iid, _, start, end in links:
+            if start <= character <= end:
+                return (kind, buid, iid)
+        if block is not None and block[2] <= character <= block[3]:
+            return ('B', block[0], None)
+        return None
+
+    def location(self, line: int, start: int, end: int) -> dict:
+        return {'uri': self.uri, 'range': self.range(line, start, line, end)}
+
+    def range(self, start_line: int, start: int, end_line: int, end: int) -> dict:
+        return {
+            'start': {'line': start_line, 'character': to_units(self.lines[start_line], start, self.encoding)},
+            'end': {'line': end_line, 'character': to_units(self.lines[end_line], end, self.encoding)},
+        }
+
+    ## Output methods -----------------
+    def definition(self, position: dict) -> list:
+        target = self.object_at(position)
+        if target is None or target[0] != 'L':
+            return []
+        self.index()
+        _, buid, iid = target
+        if iid is not None and (buid, iid) in self.targets:
+            line, start, end, _ = self.targets[(buid, iid)]
+            return [self.location(line, start, end)]
+        if buid in self.blocks:
+            line, start, end, _ = self.blocks[buid]
+            return [self.location(line, start, end)]
+        return []
+
+    def references(self, position: dict, include_declaration: bool = True) -> list:
+        target = self.object_at(position)
+        if target is None:
+            return []
+        self.index()
+        _, buid, iid = target
+        output = []
+        if include_declaration:
+            if iid is not None and (buid, iid) in self.targets:
+                output.append(self.location(*self.targets[(buid, iid)][:3]))
+            elif iid is None and buid in self.blocks:
+                output.append(self.location(*self.blocks[buid][:3]))
+        output.extend(self.location(*source) for source in self.sources.get((buid, iid), ()))
+        return output
+
+    def document_symbols(self) -> list:
+        self.index()
+        output = []
+        for buid, label, first, last, (start, end), targets in self.block_ranges:
+            children = [{
+                'name': target_label or iid,
+                'detail': f"{buid}#{iid}",
+                'kind': SYMBOL_FIELD,
+                'range': self.range(line, target_start, line, target_end),
+                'selectionRange': self.range(line, target_start, line, target_end),
+            } for line, target_start, target_end, iid, target_label in targets]
+            output.append({
+                'name': label or buid,
+                'detail': f"buid={buid}",
+                'kind': SYMBOL_MODULE,
+                'range': self.range(first, 0, last, len(self.lines[last])),
+                'selectionRange': self.range(first, start, first, end),
+                'children': children,
+            })
+        return output
+
+    def workspace_symbols(self, query: str) -> list:
+        self.index()
+        query = query.lower()
+        output = []
+        for buid, label, first, _, (start, end), targets in self.block_ranges:
+            if query in label.lower():
+                output.append({'name': label, 'kind': SYMBOL_MODULE, 'location': self.location(first, start, end)})
+            for line, target_start, target_end, iid, target_label in targets:
+                if query in target_label.lower():
+                    output.append({'name': target_label, 'kind': SYMBOL_FIELD, 'containerName': label, 'location': self.location(line, target_start, target_end)})
+        return output
+
+## EOF EOF EOF DOCUMENT_INDEX
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section LANGUAGE_SERVER
+
+class LanguageServer():
+    """JSON-RPC dispatch of the LSP messages over the open DocumentIndex's"""
+
+    ## Core methods -------------------
+    def __init__(self, stdin=None, stdout=None):
+        self.stdin = stdin or sys.stdin.buffer
+        self.stdout = stdout or sys.stdout.buffer
+        self.documents = {}
+        self.encoding = 'utf-16'
+        self.initialized = False
+        self.shutdown = False
+
+    def serve(self) -> int:
+        """Answer messages until exit (or the end of stdin). Returns the process exit code"""
+        while True:
+            message = read_message(self.stdin)
+            if message is None:
+                return 0 if self.shutdown else 1
+            if message.get('method') == 'exit':
+                return 0 if self.shutdown else 1
+            self.handle(message)
+
+    def handle(self, message: dict):
+        method = message.get('method')
+        request_id = message.get('id')
+        handler = getattr(self, 'on_' + method.replace('/', '_').replace('$', ''), None) if method else None
+
+        if request_id is None:
+            ## Notifications have no answer, unknown ones are ignored and a failing one must not stop the server
+            if handler is not None and (self.initialized or method == 'initialized'):
+                try:
+                    handler(message.get('params') or {})
+                except Exception as e:
+                    print(f"[Warning]: {method} failed {e!r}", file=sys.stderr)
+            return
+
+        if not self.initialized and method != 'initialize':
+            return self.reply_error(request_id, SERVER_NOT_INITIALIZED, "initialize was not received")
+        if self.shutdown:
+            return self.reply_error(request_id, INVALID_REQUEST, "shutdown was received")
+        if handler is None:
+            return self.reply_error(request_id, METHOD_NOT_FOUND, f"{method} is not supported")
+        try:
+            result = handler(message.get('params') or {})
+        except Exception as e:
+            print(f"[Warning]: {method} failed {e!r}", file=sys.stderr)
+            return self.reply_error(request_id, INTERNAL_ERROR, str(e))
+        write_message(self.stdout, {'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+    def reply_error(self, request_id, code: int, text: str):
+        write_message(self.stdout, {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': text}})
+
+    def document(self, params: dict) -> DocumentIndex:
+        uri = params['textDocument']['uri']
+        if uri not in self.documents:
+            raise ValueError(f"{uri=} is not open (textDocument/didOpen was not received)")
+        return self.documents[uri]
+
+    ## Lifecycle ----------------------
+    def on_initialize(self, params: dict) -> dict:
+        ## Python str indexes are code points, so utf-32 avoids any conversion if the editor supports it
+        encodings = ((params.get('capabilities') or {}).get('general') or {}).get('positionEncodings') or []
+        self.encoding = 'utf-32' if 'utf-32' in encodings else 'utf-16'
+        self.initialized = True
+        return {
+            'capabilities': {
+                'positionEncoding': self.encoding,
+                'textDocumentSync': {'openClose': True, 'change': SYNC_INCREMENTAL},
+                'definitionProvider': True,
+                'referencesProvider': True,
+                'documentSymbolProvider': True,
+                'workspaceSymbolProvider': True,
+            },
+            'serverInfo': {'name': 'danotes'},
+        }
+
+    def on_initialized(self, params: dict):
+        pass
+
+    def on_shutdown(self, params: dict):
+        self.shutdown = True
+        return None
+
+    ## Document synchronization -------
+    def on_textDocument_didOpen(self, params: dict):
+        item = params['textDocument']
+        self.documents[item['uri']] = DocumentIndex(item['uri'], item['text'], self.encoding)
+
+    def on_textDocument_didChange(self, params: dict):
+        document = self.document(params)
+        for change in params['contentChanges']:
+            document.apply_change(change)
+
+    def on_textDocument_didClose(self, params: dict):
+        self.documents.pop(params['textDocument']['uri'], None)
+
+    ## Requests -----------------------
+    def on_textDocument_definition(self, params: dict) -> list:
+        return self.document(params).definition(params['position'])
+
+    def on_textDocument_references(self, params: dict) -> list:
+        include_declaration = (params.get('context') or {}).get('includeDeclaration', True)
+        return self.document(params).references(params['position'], include_declaration)
+
+    def on_textDocument_documentSymbol(self, params: dict) -> list:
+        return self.document(params).document_symbols()
+
+    def on_workspace_symbol(self, params: dict) -> list:
+        output = []
+        for document in self.documents.values():
+            output.extend(document.workspace_symbols(params.get('query', '')))
+        return output
+
+## EOF EOF EOF LANGUAGE_SERVER
+## ----------------------------------------------------------------------------
+
+__all__ = ['DocumentIndex', 'LanguageServer', 'read_message', 'write_message']
@@ -4,10 +4,51 @@ from .link import LinkTarget, LinksTarget
 from .danom import Danom
 from .components import *
 from .utils import *
+from .extract import *
+from .danb import *
+from .journal import *
+from .shard import *
+from .export import *
+from .legacy import *
+from .diff import *
+from .merge import *
+from .dedup import *
+from .compress import *
+from .source import *
+from .ingest import *
+from .snapshot import *
+from .query import *
+from .crawl import *
 
 
 __all__ = [
     'Block', 'Danom', 'Content', 'Header', 'LinkTarget', 'LinksTarget',
     'is_valid_dan_format', 'append_after_third_last_line',
-    'get_next_uid', 'transform_legacy_title' , 'check_yaml_line'
+    'get_next_uid', 'uid_to_int', 'transform_legacy_title' , 'check_yaml_line',
+    'render_figlet', 'atomic_writer',
+    'parse_html', 'sanitize_html', 'extract_html', 'html_to_plain',
+    'is_danb', 'read_danb_table', 'write_danb', 'iter_danb', 'read_danb_block',
+    'journal_path', 'has_journal', 'journal_lock', 'locked_document', 'read_last_buid',
+    'journal_append', 'read_journal', 'journal_consume', 'iter_fold_journal',
+    'ShardedDanom', 'TocEntry', 'is_manifest', 'read_manifest', 'write_manifest', 'iter_manifest', 'shard_key',
+    'load_document', 'shard_danom',
+    'EXPORT_FORMATS', 'page_name', 'convert_links', 'page_record', 'record_hash', 'read_export_manifest', 'write_export_manifest',
+    'render_page', 'render_index', 'write_page',
+    'LEGACY_MODELINE_VARS', 'iter_legacy_lines', 'legacy_header', 'update_legacy_block', 'iter_legacy_blocks', 'migrate_legacy',
+    'DIFF_KEYS', 'BlockDigest', 'BlockChange', 'block_digest', 'read_digests', 'diff_digests', 'diff_documents',
+    'iter_line_diffs', 'format_change', 'change_to_json', 'diff_summary',
+    'allocate_buids', 'merge_danoms',
+    'DuplicateCluster', 'shingles', 'minhash', 'similarity', 'lsh_params', 'lsh_candidates',
+    'find_duplicates', 'merge_duplicates', 'format_clusters', 'clusters_to_json',
+    'COMPRESSED_SUFFIXES', 'compression_of', 'compression_for', 'open_decompressed', 'compressed_writer',
+    'read_zstd_block', 'read_compressed_last_buid',
+    'SOURCE_KINDS', 'COMMAND_TTL', 'COMMAND_TIMEOUT', 'COMMAND_MAX_BYTES', 'CommandResult', 'command_ttl',
+    'classify_source', 'run_command', 'run_cached_command',
+    'INGEST_CHUNK_SIZE', 'stream_append',
+    'SNAPSHOTS_SUFFIX', 'snapshot_store', 'read_snapshots', 'fold_snapshots', 'take_snapshot',
+    'restore_snapshot', 'snapshot_block', 'format_snapshot', 'snapshot_to_json',
+    'INDEX_FIELDS', 'QUERY_FIELDS', 'BlockRow', 'index_path', 'compile_query', 'load_index',
+    'select_rows', 'iter_selected_blocks', 'format_row',
+    'CRAWL_MAX_DEPTH', 'CRAWL_JOBS', 'CRAWL_PER_HOST', 'CRAWL_DELAY', 'CRAWL_MAX_PAGES', 'CrawledPage',
+    'normalize_url', 'page_key', 'HostLimiter', 'crawl_site', 'extract_page', 'extract_pages'
 ]
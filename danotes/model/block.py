@@ -10,12 +10,21 @@ import os
 from typing import Self
 import yaml
 import danotes.model
+from danotes.profiling import trace
 import subprocess
-from bs4 import BeautifulSoup, Comment
-from importlib import resources
+from danotes.filters import FILTER_REGISTRY
+
+## Keys that can be projected on Block.to_dict()
+BLOCK_FIELDS = ('buid', 'label', 'content', 'links_target', 'title_marked', 'source', 'title_cmd', 'content_cmd', 'filters')
+DEFAULT_FIELDS = ('buid', 'label', 'content', 'links_target')
+## Assigning any of these makes the Block dirty (rendered again on the next Danom.to_file)
+RENDERED_FIELDS = frozenset(('buid', 'label', 'content', 'title_marked', 'source', 'title_cmd', 'content_cmd', 'filters'))
 
 class Block():
     """DAN Block Elements that get printed out and displayed, they contain the Inline elements"""
+    ## No per-instance __dict__ , a 100k blocks document holds 100k of these
+    __slots__ = ('buid', 'label', 'content', '_links_target', 'title_marked', 'source', 'title_cmd', 'content_cmd', 'filters', '_span', '_source_kind')
+
     ## Core methods -------------------
     def __init__(
         self,
@@ -42,43 +51,88 @@ class Block():
         self.buid = buid
         self.label = label
         self.content = content
-        self.header = danotes.model.Header(self)
-        self.links_target = danotes.model.LinksTarget(self)
+        self._links_target = None
         self.title_marked = title_marked
         self.source = source
         self.title_cmd = title_cmd
         self.content_cmd = content_cmd
         self.filters = filters
+        self._span = None
+
+    def __setattr__(self, name, value):
+        if name in RENDERED_FIELDS:
+            object.__setattr__(self, '_span', None)
+        if name == 'source':
+            object.__setattr__(self, '_source_kind', None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def header(self) -> 'Header':
+        """Header of the Block (created on demand, it only holds the back-reference)"""
+        return danotes.model.Header(self)
+
+    @property
+    def links_target(self) -> 'LinksTarget':
+        """LinksTarget of the Block, extracted from the Content on first access and again only once the Content changes"""
+        links_target = self._links_target
+        if links_target is None or links_target.is_stale():
+            if links_target is None:
+                links_target = self._links_target = danotes.model.LinksTarget(self)
+            links_target.extract()
+        return links_target
+
+    @links_target.setter
+    def links_target(self, links_target: 'LinksTarget'):
+        """An assigned LinksTarget is taken as the one of the current Content"""
+        self._links_target = links_target.sync()
+
     def __repr__(self):
         content_preview = ', '.join([repr(line.strip()) for line in self.content[:3]])
         if len(self.content) > 3:
             content_preview += f', ...(+{len(self.content)-3} more lines)'
         return f"Block(buid='{self.buid}', label='{self.label}', content=[{content_preview}], links_target={repr(self.links_target)}, title_marked='{self.title_marked}', source='{self.source}', title_cmd='{self.title_cmd}', content_cmd='{self.content_cmd}, filters='{self.filters}')"
-    def to_dict(self) -> dict[str, any]:
-        """Convert the Block to a JSON-serializable dictionary."""
-        return {
-            'buid': self.buid,
-            'label': self.label,
-            'content': list(self.content),  # Convert Content to plain list
-            'links_target': [
-                {'label': lt.label, 'iid': lt.iid} 
-                for lt in self.links_target
-            ]
-        }
+    def to_dict(self, fields: list = None) -> dict[str, any]:
+        """Convert the Block to a JSON-serializable dictionary.
+        fields: projection of the keys to serialize (defaults to DEFAULT_FIELDS), any of BLOCK_FIELDS
+        """
+        if fields is None:
+            fields = DEFAULT_FIELDS
+
+        output = {}
+        for field in fields:
+            if field == 'content':
+                output['content'] = list(self.content)  # Convert Content to plain list
+            elif field == 'links_target':
+                output['links_target'] = [
+                    {'label': lt.label, 'iid': lt.iid}
+                    for lt in self.links_target
+                ]
+            elif field in BLOCK_FIELDS:
+                output[field] = getattr(self, field)
+            else:
+                raise ValueError(f"{field=} is not a Block field. Expected any of {BLOCK_FIELDS}")
+        return output
 
     ## Getter Methods -----------------
     def get_links_target(self):
-        """Get the LinksTarget property for the given Block"""
-        pattern = r'<I=([0-9a-zA-Z]+)#([0-9a-zA-Z]+)>(.*?)</I>'
-        
-        for line in self.content:
-            for match in re.finditer(pattern, line):
-                iid = match.group(2)
-                label = match.group(3)
-                self.links_target.append(danotes.model.LinkTarget(label, iid))
+        """Get the LinksTarget property for the given Block
+        Extracted lazily on access (see Block.links_target), calling this only makes sure it is up to date
+        """
+        self.links_target
         return self
 
     ## Test Methods -------------------
+    def is_clean(self, origin: dict) -> bool:
+        """
+        Return True if the Block text is still the span of bytes it was loaded from (or saved to) on origin
+        Any assignment of RENDERED_FIELDS, or mutation of its Content, makes it dirty
+        """
+        span = self._span
+        return (
+            span is not None and span[0] is origin
+            and isinstance(self.content, danotes.model.Content) and self.content.version == span[3]
+        )
+
     def is_path(self) -> bool:
         try:
             # Attempt to create a Path object (validates path syntax)
@@ -91,6 +145,26 @@ class Block():
     def is_web_url(self) -> bool:
         return bool(re.match(r'^(http|https|ftp)://', self.source))
 
+    def local_source(self, path) -> 'Path | None':
+        """Local file the Block is sourced from (relative sources are relative to the document path), None if it is not one"""
+        if not self.source or danotes.model.is_url(self.source) or danotes.model.is_a_dir_path(self.source):
+            return None
+        ## Regularize if it is a relative path
+        if not Path(self.source).is_absolute():
+            regularized_path = Path(path).parent.joinpath(Path(self.source))
+        else:
+            regularized_path = Path(self.source)
+        try:
+            return regularized_path if regularized_path.is_file() else None
+        except (OSError, ValueError):
+            return None
+
+    def source_kind(self, path) -> str:
+        """Kind of the Block source (see danotes.model.source), classified once for each source and document path"""
+        if self._source_kind is None or self._source_kind[0] != path:
+            self._source_kind = (path, danotes.model.classify_source(self.source, path))
+        return self._source_kind[1]
+
     def is_egb(self):
         """
         Return True if is a EGB Externally Generated Block
@@ -108,8 +182,9 @@ class Block():
     ## Helper Methods -----------------
     def get_next_available_iid(self) -> str:
         """Get the next available iid for a Link"""
-        if len(self.links_target):
-            iid = self.links_target[-1].iid
+        links_target = self.links_target
+        if len(links_target):
+            iid = links_target[-1].iid
         else:
             iid = '0'
         iid = danotes.model.get_next_uid(iid)
@@ -118,6 +193,16 @@ class Block():
 
 
     ## Modification methods -----------
+    def mark_clean(self, origin: dict, start: int, end: int):
+        """Record that the Block text is the [start, end) byte span of the origin file"""
+        self._span = (origin, start, end, getattr(self.content, 'version', None))
+        return self
+
+    def mark_dirty(self):
+        """Force the Block to be rendered again on the next Danom.to_file"""
+        self._span = None
+        return self
+
     def append_query(self, query: str):
         """Append query to the last line of the Block's content (same line)"""
         if self.content:
@@ -129,197 +214,123 @@ class Block():
     def append_link(self, new_label): 
         """Append a new Link to the Block, both inside the Content and on the LinksTarget"""
         iid = self.get_next_available_iid()
-        self.links_target.new_link(new_label, iid)
+        links_target = self.links_target
         self.append_query(f"<I={self.buid}#{iid}>{new_label}</I>")
+        ## The Link Target is added to the ones already extracted, instead of extracting them all again
+        links_target.new_link(new_label, iid)
 
         return self
 
-    def update_content(self, path):
+    def process_html(self, file, default_title: str, default_content: str = 'body'):
+        """Run the extraction stage of an html file, its filters, and set the label and content accordingly"""
+        html_filters, lua_paths, text_filters = FILTER_REGISTRY.resolve(self.filters)
+
+        title, content = danotes.model.extract_html(file, self.title_cmd, self.content_cmd, default_title=default_title, default_content=default_content)
+        for html_filter in html_filters:
+            html_filter(content)
+
+        lines = danotes.model.html_to_plain(content, lua_paths)
+        for text_filter in text_filters:
+            lines = text_filter(lines)
+
+        self.label = title
+        self.content.extend([''])
+        self.content.extend(lines)
+        return self
+
+    def apply_text_filters(self, lines: list) -> list:
+        """Run the native text filters of the Block over a list of lines"""
+        _, _, text_filters = FILTER_REGISTRY.resolve(self.filters)
+        for text_filter in text_filters:
+            lines = text_filter(lines)
+        return lines
+
+    @trace('Block.update_content', per_block=True)
+    def update_content(self, path, ttl: float = None, timeout: float = None, max_bytes: int = None):
         """
         Update the Content text :
             - for a EGB will check self.source self.title_cmd self.content_cmd
         And update the content accordingly
-        There is 3 conditions for a existing source to generate an EGB:
-            - Run the string and Exit Status 0 . Stdout as content (DANGEROUS Code Injection!!)
-            - If the String is an existing local path (if is a text file cat it , if is .html use pandoc)
+        The source kind is classified once (see Block.source_kind), and goes straight to its handler:
             - Is a URL (use wget, and if Exit Status 0 , apply pandoc with self.title_cmd , and self.content_cmd)
+            - If the String is an existing local path (if is a text file cat it , if is .html use pandoc)
+            - Else run the string and Exit Status 0 . Stdout as content (DANGEROUS Code Injection!!)
+              The output is cached for ttl seconds, the command is killed after timeout seconds or max_bytes of output
         """
+        kind = self.source_kind(path)
 
         ## If it is not an EGB leave it as it is
-        if not self.source or danotes.model.is_a_dir_path(self.source) and not danotes.model.is_url(self.source):
+        if kind == 'none':
             return self
-        
-        ## Re-instating the content from 0
-        self.content = danotes.model.Content()
 
-        process = subprocess.run(self.source, shell = True, capture_output= True, text = True)
+        if kind == 'command':
+            result = danotes.model.run_cached_command(
+                self.source,
+                ttl=ttl,
+                timeout=timeout or danotes.model.COMMAND_TIMEOUT,
+                max_bytes=max_bytes or danotes.model.COMMAND_MAX_BYTES,
+            )
+            ## A failing command keeps the previous content
+            if result.returncode != 0:
+                print(f"[Warning]: Was not possible to parse content from {path=} {self.source=} (exit status {result.returncode})")
+                return self
+            self.content = danotes.model.Content([''])
+            self.content.extend(self.apply_text_filters(result.stdout.splitlines()))
+            return self
 
-        if process.returncode == 0:
-            self.content.extend([''])
-            self.content.extend(process.stdout.splitlines())
+        ## Downloading if it is a url
+        if kind == 'url':
+            ## Re-instating the content from 0
+            self.content = danotes.model.Content()
+            try:
+                download_dir, filename = danotes.model.index_file(self.source, path)
+                file_path = download_dir / filename
+
+                with open(file_path, 'rb') as file:
+                    self.process_html(file, default_title=Path(filename).stem, default_content='body')
+                return self
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Failed to download or process file: {e.stderr}") from e
+            except FileNotFoundError as e:
+                raise RuntimeError(f"File not found: {file_path}") from e
+            except Exception as e:
+                raise RuntimeError(f"Unexpected error processing {self.source}: {str(e)}") from e
+
+        ## Case for local file
+        regularized_path = self.local_source(path)
+        if not regularized_path:
+            print(f"[Warning]: Was not possible to parse content from {path=} {self.source=}")
             return self
-        else:
-            ## Downloading if it is a url
-            if danotes.model.is_url(self.source):
-                try:
-                    download_dir, filename = danotes.model.index_file(self.source, path)
-                    file_path = download_dir / filename
-                    
-                    with open(file_path) as file:
-                        soup = BeautifulSoup(file, features="lxml")
-
-                        # Remove all JavaScript (<script> tags)
-                        for script in soup.find_all("script"):
-                            script.decompose()  # Remove the entire tag
-
-                        # Remove all inline styles and external CSS (<style> tags)
-                        for style in soup.find_all("style"):
-                            style.decompose()
-
-                        # Remove ALL 'style' attributes from any tag
-                        for tag in soup.find_all(True):  # True = match all tags
-                            if 'style' in tag.attrs:
-                                del tag.attrs['style']
-
-                        # Remove all HTML comments from the soup
-                        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-                            comment.extract()  # Remove the comment
-
-                        if self.title_cmd:
-                            title = soup.select(self.title_cmd)[0].get_text(strip=True)
-                        else:
-                            title = Path(filename).stem
-                        if self.content_cmd:
-                            content = soup.select(self.content_cmd)[0]
-                        else:
-                            content = soup.body
-
-                        if self.filters:
-                            filters = self.filters.split(',')
-                            filters_cmd = ''
-
-                            for filter_name in filters:
-                                # Check user filters first
-                                resource = resources.files("danotes.filters.user").joinpath(f"{filter_name}.lua")
-                                if resource.is_file():
-                                    with resources.as_file(resource) as path:
-                                        filters_cmd += f' -L {str(path)}'
-                                    continue  # skip checking builtin if found in user
-
-                                # Check builtin filters
-                                resource = resources.files("danotes.filters.builtin").joinpath(f"{filter_name}.lua")
-                                if resource.is_file():
-                                    with resources.as_file(resource) as path:
-                                        filters_cmd += f' -L {str(path)}'
-                        else:
-                            filters_cmd = ''
-
-
-                    cmd = f'echo "{content}" | pandoc -f html -t plain {filters_cmd}'
-                    process = subprocess.run(cmd, shell = True, capture_output= True, text = True)
-
-                    self.label = title
-
-                    self.content.extend([''])
-                    self.content.extend(process.stdout.splitlines())
-                    return self
-                except subprocess.CalledProcessError as e:
-                    raise RuntimeError(f"Failed to download or process file: {e.stderr}") from e
-                except FileNotFoundError as e:
-                    raise RuntimeError(f"File not found: {file_path}") from e
-                except Exception as e:
-                    raise RuntimeError(f"Unexpected error processing {self.source}: {str(e)}") from e
-            ## Case for local file
+
+        self.content = danotes.model.Content()
+        with open(regularized_path, 'rb') as file:
+            ## Case that local file an .html
+            if kind == 'html':
+                self.process_html(file, default_title=Path(self.source).stem, default_content=None)
+
+            ## If not dump its content
             else:
-                ## Regularize if it is a relative path
-                if not Path(self.source).is_absolute():
-                    regularized_path = Path(path).parent.joinpath(Path(self.source))
+                if self.title_cmd:
+                    title = self.title_cmd
                 else:
-                    regularized_path = Path(path).joinpath(Path(self.source))
-
-                if regularized_path.is_file():
-                    with open(regularized_path) as file:
-                        ## Case that local file an .html
-                        if re.match(r'\.(?:html|htm)', Path(self.source).suffix):
-                            soup = BeautifulSoup(file, features="lxml")
-
-                            # Remove all JavaScript (<script> tags)
-                            for script in soup.find_all("script"):
-                                script.decompose()  # Remove the entire tag
-
-                            # Remove all inline styles and external CSS (<style> tags)
-                            for style in soup.find_all("style"):
-                                style.decompose()
-
-                            # Remove ALL 'style' attributes from any tag
-                            for tag in soup.find_all(True):  # True = match all tags
-                                if 'style' in tag.attrs:
-                                    del tag.attrs['style']
-
-                            # Remove all HTML comments from the soup
-                            for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-                                comment.extract()  # Remove the comment
-
-
-                            if self.title_cmd:
-                                title = soup.select(self.title_cmd)[0].get_text(strip=True)
-                            else:
-                                title = Path(self.source).stem
-                            if self.content_cmd:
-                                content = soup.select(self.content_cmd)[0]
-                            else:
-                                content = soup
-
-                            if self.filters:
-                                filters = self.filters.split(',')
-
-                                for filter_name in filters:
-                                    # Check user filters first
-                                    resource = resources.files("danotes.filters.user").joinpath(f"{filter_name}.lua")
-                                    if resource.is_file():
-                                        with resources.as_file(resource) as path:
-                                            filters_cmd += f' -L {str(path)}'
-                                        continue  # skip checking builtin if found in user
-
-                                    # Check builtin filters
-                                    resource = resources.files("danotes.filters.builtin").joinpath(f"{filter_name}.lua")
-                                    if resource.is_file():
-                                        with resources.as_file(resource) as path:
-                                            filters_cmd += f' -L {str(path)}'
-                            else:
-                                filters_cmd = ''
-
-
-                            cmd = f'echo "{content}" | pandoc -f html -t plain {filters_cmd}'
-
-                            process = subprocess.run(cmd, shell = True, capture_output= True, text = True)
-                            
-                            self.label = title
-
-                            self.content.extend([''])
-                            self.content.extend(process.stdout.splitlines())
-
-                        ## If not dump its content
-                        else:
-                            if self.title_cmd:
-                                title = self.title_cmd
-                            else:
-                                title = Path(self.source).stem
-                            self.label = title
-                            self.content.extend([''])
-                            self.content.extend(file.read().splitlines())
-                        return self
-                else:
-                    print(f"[Warning]: Was not possible to parse content from {path=} {self.source=}")
-                    return self
+                    title = Path(self.source).stem
+                self.label = title
+                self.content.extend([''])
+                self.content.extend(self.apply_text_filters(file.read().decode('utf-8').splitlines()))
+        return self
 
 
     ## Output methods -----------------
-    def to_json(self, indent: int = 2) -> str:
+    def to_json(self, indent: int = 2, fields: list = None) -> str:
         """Serialize the Block to a JSON string."""
-        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+        return json.dumps(self.to_dict(fields), indent=indent, ensure_ascii=False)
 
-    def to_string(self) -> str:
+    def to_ndjson(self, fields: list = None) -> str:
+        """Serialize the Block to a single compact JSON line (NDJSON)"""
+        return json.dumps(self.to_dict(fields), ensure_ascii=False, separators=(',', ':'))
+
+    def to_string(self, article_toc: bool = True) -> str:
+        """article_toc=False leaves the Article TOC out (only its <T> tag), without extracting the Links Target"""
 
         ## First block cannot start with an empty line
         if self.buid != "0":
@@ -330,14 +341,18 @@ class Block():
         else:
             output = self.header.to_string()
 
-        output = output + self.links_target.to_string()
+        if article_toc:
+            output = output + self.links_target.to_string()
+        else:
+            output = output + "<T>"
         output = output + "\n"
         output = output + self.content.to_string()
         return output
 
-    def to_text(self) -> str:
+    @trace('Block.to_text', per_block=True)
+    def to_text(self, article_toc: bool = True) -> str:
         """Get the Content of the Block with a horizontal line <hr> at the end"""
-        output = self.to_string()
+        output = self.to_string(article_toc)
         output = output + '\n'   ## Adding tralining empty line (lower-padding)
         output = output + f'\n</B><L=1>To Document TOC</L> | <L={self.buid}>Back to Article Top</L>\n'
         return output + ('=' * 105)
@@ -10,13 +10,17 @@ import os
 from typing import Self
 import yaml
 import danotes.model
+from danotes.profiling import trace
 
 
 class Header:
     """Manages the header of a Block, from <B={buid}>{label} to <T>."""
+    __slots__ = ('block',)
+
     def __init__(self, block: 'Block'):
         self.block = block
 
+    @trace('Header.to_string')
     def to_string(self) -> str:
         """Get the Header of a Block as a contiguous string using Block's buid and label."""
         output = []
@@ -26,7 +30,7 @@ class Header:
         else:
             output.append(f"<B={self.block.buid}>{self.block.label}")
 
-        pyfiglet_string = pyfiglet.figlet_format(self.block.label)
+        pyfiglet_string = danotes.model.render_figlet(self.block.label)
         lines = [line.rstrip() for line in pyfiglet_string.split('\n')]
         output.extend(lines)
         # Remove the last two lines of pyfiglet output (empty or decorative)
@@ -52,7 +56,19 @@ class Header:
         return '\n'.join(output)
 
 class Content(list):
-    """List of the lines containing the content of a Block."""
+    """List of the lines containing the content of a Block.
+    Every mutation bumps self.version, so a Block can tell if its lines changed since it was loaded/saved
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+
+    def __reduce__(self):
+        ## Copies/pickles are rebuilt from the lines (list items would be restored before version exists)
+        return (self.__class__, (list(self),))
+
     def to_string(self) -> str:
         """Get the Content as a contiguous string."""
         return '\n'.join(self)
@@ -66,25 +82,72 @@ class Content(list):
         """
 
         for i, line in enumerate(self):  # Track index with enumerate()
-            # Shift Link Sources
-            matches = re.findall(r'<L=([a-zA-Z0-9]*)', line)
-            if matches:
-                for match in matches:
-                    buid = danotes.model.get_next_uid(match)
-                    pattern = fr'(?<=<L=){re.escape(match)}'
-                    line = re.sub(pattern, buid, line)  # Update line
-            
-            # Shift Link Targets (same approach)
-            matches = re.findall(r'<I=([a-zA-Z0-9]*)', line)
-            if matches:
-                for match in matches:
-                    buid = danotes.model.get_next_uid(match)
-                    pattern = fr'(?<=<I=){re.escape(match)}'
-                    line = re.sub(pattern, buid, line)
-            
-            self[i] = line  # Update the list with modified line
+            if '<' not in line:
+                continue
+            ## Link Sources and Link Targets in a single pass, so each buid is shifted once
+            ## (replacing them one after the other shifted <L=1> to 2 and then to 3, and <L=12> along with <L=1>)
+            shifted = LINK_BUID_PATTERN.sub(shift_link_buid, line)
+            if shifted != line:
+                self[i] = shifted  # Update the list with modified line
+        return self
+
+    def remap_links(self, mapping: dict, iids: dict = None):
+        """
+        Rewrite the buid of the Link Sources/Link Targets in content according to mapping {old buid: new buid},
+        every buid in a single pass (buids not in mapping are kept).
+        This is to be used in danotes file merge, along with the new buids of the merged Blocks
+        If iids {new buid: iids of its Link Targets}, a remapped Link Source <L=buid#iid> whose iid is not on the
+        new Block loses it, so it links to the whole Block (danotes block dedup, the new Block is another one)
+        """
+        if iids is None:
+            replace = lambda match: match.group(1) + mapping.get(match.group(2), match.group(2))
+            pattern = LINK_BUID_PATTERN
+        else:
+            replace = lambda match: remap_link_source(match, mapping, iids)
+            pattern = LINK_SOURCE_PATTERN
+        for i, line in enumerate(self):
+            if '<' not in line:
+                continue
+            remapped = pattern.sub(replace, line)
+            if remapped != line:
+                self[i] = remapped
         return self
 
 
+## Buid of a Link Source <L=buid or Link Target <I=buid
+LINK_BUID_PATTERN = re.compile(r'(<[LI]=)([a-zA-Z0-9]*)')
+
+def shift_link_buid(match) -> str:
+    return match.group(1) + danotes.model.get_next_uid(match.group(2))
+
+## Buid and optional iid of a Link Source <L=buid#iid
+LINK_SOURCE_PATTERN = re.compile(r'(<L=)([a-zA-Z0-9]*)(?:#([a-zA-Z0-9]+))?')
+
+def remap_link_source(match, mapping: dict, iids: dict) -> str:
+    buid, iid = match.group(2), match.group(3)
+    if buid not in mapping:
+        return match.group(0)
+    buid = mapping[buid]
+    if iid is None or iid not in iids.get(buid, ()):
+        return match.group(1) + buid
+    return f"{match.group(1)}{buid}#{iid}"
+
+
+def track_mutation(name: str):
+    """Wrap the list method `name` so calling it bumps Content.version"""
+    method = getattr(list, name)
+
+    def tracked(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+
+    tracked.__name__ = name
+    tracked.__doc__ = method.__doc__
+    return tracked
+
+for name in ('append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse', '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+    setattr(Content, name, track_mutation(name))
+
+
 
 __all__ = [ 'Header', 'Content']
@@ -0,0 +1,290 @@
+"""
+Compressed .dan documents (.dan.gz / .dan.zst), read and written transparently
+
+Compressed documents are detected by their magic bytes, and decompressed as a stream into the same
+line parser as plain ones (Danom.iter_parse), so a document is never decompressed whole in memory.
+The compression of a saved document is picked by the extension of its path (.gz / .zst).
+Clean Blocks are not copied from a compressed origin (there are no byte spans to seek), they are rendered.
+
+.zst documents are written as a sequence of independent zstd frames, each holding a run of whole Blocks
+(about ZSTD_FRAME_SIZE bytes of text), followed by two skippable frames that any zstd decoder ignores:
+    Block index : ZSTD_INDEX_MAGIC | size | b'DANI' | JSON [[buids of frame 0], [buids of frame 1], ...]
+    Seek table  : zstd seekable format (https://github.com/facebook/zstd/tree/dev/contrib/seekable_format)
+                  one (compressed size, decompressed size) entry per frame, the index frame included with
+                  a decompressed size of 0, and the footer u32 frame count | u8 descriptor | u32 0x8F92EAB1
+Reading a single Block (read_zstd_block) only decompresses the frame holding it.
+
+zstd support needs the optional `zstandard` package (pip install danotes[zstd]), gzip is in the standard library.
+"""
+
+import io
+import os
+import gzip
+import json
+import re
+import struct
+from pathlib import Path
+from contextlib import contextmanager
+import danotes.model
+
+try:
+    import zstandard
+except ImportError:     ## Optional dependency, only needed for .dan.zst documents
+    zstandard = None
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+## Compression of the documents saved with each extension
+COMPRESSED_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+## Decompressed bytes of Blocks per zstd frame (a frame is closed at the first Block boundary past it)
+ZSTD_FRAME_SIZE = 1 << 18
+
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_INDEX_MAGIC = 0x184D2A50
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_INDEX_ID = b'DANI'
+## Seek table descriptor bit, when set each entry carries a checksum
+ZSTD_CHECKSUM_FLAG = 0x80
+
+BLOCK_OTAG_PATTERN = re.compile(rb'^<B=([0-9a-zA-Z]+)>')
+
+SKIPPABLE_HEADER_STRUCT = struct.Struct('<II')
+SEEK_ENTRY_STRUCT = struct.Struct('<II')
+SEEK_FOOTER_STRUCT = struct.Struct('<IBI')
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def compression_of(path) -> str | None:
+    """Compression of an existing document ('gzip', 'zstd'), found from its magic bytes. None if it is not compressed"""
+    try:
+        with open(path, 'rb') as file:
+            magic = file.read(len(ZSTD_MAGIC))
+    except OSError:
+        return None
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def compression_for(path) -> str | None:
+    """Compression of a document about to be saved on path, picked by its extension"""
+    return COMPRESSED_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def require_zstandard(path):
+    if zstandard is None:
+        raise ValueError(f"{path} is a zstd compressed document, the zstandard package is needed (pip install danotes[zstd])")
+
+
+def skippable_frame(magic: int, payload: bytes) -> bytes:
+    return SKIPPABLE_HEADER_STRUCT.pack(magic, len(payload)) + payload
+
+
+class ZstdBlockWriter:
+    """Writes the Blocks of a document as zstd frames of whole Blocks, closed by the Block index and the seek table"""
+
+    def __init__(self, output, level: int = ZSTD_LEVEL, frame_size: int = ZSTD_FRAME_SIZE):
+        self.output = output
+        self.compressor = zstandard.ZstdCompressor(level=level, write_checksum=True)
+        self.frame_size = frame_size
+        self.pending = []       ## Rendered Blocks of the frame being filled
+        self.pending_size = 0
+        self.buids = []         ## Buids of the frame being filled
+        self.frames = []        ## [(compressed size, decompressed size)]
+        self.index = []         ## [[buids of each frame]]
+
+    def write_block(self, buid: str, data: bytes):
+        self.pending.append(data)
+        self.pending_size += len(data)
+        self.buids.append(buid)
+        if self.pending_size >= self.frame_size:
+            self.flush_frame()
+
+    def write(self, data: bytes):
+        """Bytes that are not a Block (e.g. what follows the last one), kept on the current frame"""
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+
+    def flush_frame(self):
+        if not self.pending:
+            return
+        frame = self.compressor.compress(b''.join(self.pending))
+        self.output.write(frame)
+        self.frames.append((len(frame), self.pending_size))
+        self.index.append(self.buids)
+        self.pending, self.pending_size, self.buids = [], 0, []
+
+    def close(self):
+        self.flush_frame()
+        index = skippable_frame(ZSTD_INDEX_MAGIC, ZSTD_INDEX_ID + json.dumps(self.index, separators=(',', ':')).encode('utf-8'))
+        self.output.write(index)
+        entries = self.frames + [(len(index), 0)]
+        table = b''.join(SEEK_ENTRY_STRUCT.pack(*entry) for entry in entries)
+        table += SEEK_FOOTER_STRUCT.pack(len(entries), 0, ZSTD_SEEKABLE_MAGIC)
+        self.output.write(skippable_frame(ZSTD_SKIPPABLE_MAGIC, table))
+
+
+class GzipBlockWriter:
+    """Same interface as ZstdBlockWriter over a single gzip member"""
+
+    def __init__(self, output, level: int = GZIP_LEVEL):
+        ## No name nor time on the gzip header, saving the same Danom twice gives the same bytes
+        self.file = gzip.GzipFile(filename='', fileobj=output, mode='wb', compresslevel=level, mtime=0)
+
+    def write_block(self, buid: str, data: bytes):
+        self.file.write(data)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+def read_seek_table(file) -> list | None:
+    """[(frame offset, compressed size, decompressed size)] of a seekable .zst file, None if it has no seek table"""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    if size < SKIPPABLE_HEADER_STRUCT.size + SEEK_FOOTER_STRUCT.size:
+        return None
+    file.seek(size - SEEK_FOOTER_STRUCT.size)
+    count, descriptor, magic = SEEK_FOOTER_STRUCT.unpack(file.read(SEEK_FOOTER_STRUCT.size))
+    if magic != ZSTD_SEEKABLE_MAGIC:
+        return None
+    entry_size = SEEK_ENTRY_STRUCT.size + (4 if descriptor & ZSTD_CHECKSUM_FLAG else 0)
+    table_size = SKIPPABLE_HEADER_STRUCT.size + count * entry_size + SEEK_FOOTER_STRUCT.size
+    if table_size > size:
+        return None
+    file.seek(size - table_size)
+    table = file.read(table_size)
+    magic, _ = SKIPPABLE_HEADER_STRUCT.unpack_from(table)
+    if magic != ZSTD_SKIPPABLE_MAGIC:
+        return None
+
+    frames = []
+    offset = 0
+    for i in range(count):
+        compressed, decompressed = SEEK_ENTRY_STRUCT.unpack_from(table, SKIPPABLE_HEADER_STRUCT.size + i * entry_size)
+        frames.append((offset, compressed, decompressed))
+        offset += compressed
+    return frames
+
+
+def read_zstd_index(file) -> tuple[list, list] | None:
+    """(data frames, [[buids of each frame]]) of a .zst document written by danotes, None if it has no Block index"""
+    frames = read_seek_table(file)
+    if not frames:
+        return None
+    offset, compressed, _ = frames[-1]
+    file.seek(offset)
+    frame = file.read(compressed)
+    if len(frame) < SKIPPABLE_HEADER_STRUCT.size:
+        return None
+    magic, length = SKIPPABLE_HEADER_STRUCT.unpack_from(frame)
+    payload = frame[SKIPPABLE_HEADER_STRUCT.size:SKIPPABLE_HEADER_STRUCT.size + length]
+    if magic != ZSTD_INDEX_MAGIC or not payload.startswith(ZSTD_INDEX_ID):
+        return None
+    index = json.loads(payload[len(ZSTD_INDEX_ID):])
+    if len(index) != len(frames) - 1:
+        return None
+    return (frames[:-1], index)
+
+
+def read_zstd_frame(file, offset: int, compressed: int, decompressed: int) -> bytes:
+    file.seek(offset)
+    return zstandard.ZstdDecompressor().decompress(file.read(compressed), max_output_size=decompressed)
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+@contextmanager
+def open_decompressed(path):
+    """Binary file object streaming the decompressed text of a .dan.gz/.dan.zst document (lines can be iterated)"""
+    compression = compression_of(path)
+    if compression == 'gzip':
+        with gzip.open(path, 'rb') as file:
+            yield file
+    elif compression == 'zstd':
+        require_zstandard(path)
+        with open(path, 'rb') as raw:
+            ## Every frame is read in order, the skippable ones (Block index, seek table) are ignored
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            with io.BufferedReader(reader) as file:
+                yield file
+    else:
+        raise ValueError(f"{path} is not a compressed document")
+
+
+@contextmanager
+def compressed_writer(path, compression: str = None):
+    """Atomically replace path with a compressed document. Yields a writer with write_block(buid, data) and write(data)"""
+    compression = compression or compression_for(path)
+    if compression == 'zstd':
+        require_zstandard(path)
+    elif compression != 'gzip':
+        raise ValueError(f"{path} Unknown compression. Expected a path ending in any of {', '.join(COMPRESSED_SUFFIXES)}")
+
+    with danotes.model.atomic_writer(path) as output:
+        writer = ZstdBlockWriter(output) if compression == 'zstd' else GzipBlockWriter(output)
+        yield writer
+        writer.close()
+
+
+def read_zstd_block(path, buid: str) -> 'Block | None | bool':
+    """Parse a single Block of a .dan.zst document, decompressing only the frame holding it
+    Returns False if the document has no Block index (not written by danotes), so it has to be parsed whole
+    """
+    require_zstandard(path)
+    with open(path, 'rb') as file:
+        found = read_zstd_index(file)
+        if found is None:
+            return False
+        frames, index = found
+        for (offset, compressed, decompressed), buids in zip(frames, index):
+            if buid not in buids:
+                continue
+            text = read_zstd_frame(file, offset, compressed, decompressed)
+            for block in danotes.model.Danom.iter_parse(io.BytesIO(text)):
+                if block.buid == buid:
+                    return block
+    return None
+
+
+def read_compressed_last_buid(path) -> str | None:
+    """Last buid of a compressed document. From the Block index of a danotes .zst (only it is read), else by scanning the text"""
+    if compression_of(path) == 'zstd':
+        require_zstandard(path)
+        with open(path, 'rb') as file:
+            found = read_zstd_index(file)
+        if found is not None:
+            buids = [buid for frame in found[1] for buid in frame]
+            return buids[-1] if buids else None
+
+    last = None
+    with open_decompressed(path) as file:
+        for line in file:
+            match = BLOCK_OTAG_PATTERN.match(line)
+            if match:
+                last = match.group(1).decode('utf-8')
+    return last
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['COMPRESSED_SUFFIXES', 'compression_of', 'compression_for', 'open_decompressed', 'compressed_writer',
+           'read_zstd_block', 'read_compressed_last_buid']
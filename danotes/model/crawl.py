@@ -0,0 +1,301 @@
+"""
+Concurrent crawler of a documentation site, turning its pages into EGB Blocks (block source --crawl)
+
+The crawl is breadth first: every page of a depth level is fetched concurrently (a pool of `jobs` threads),
+and the links of those pages make the next level, up to `max_depth` links away from the start URL.
+Only the pages of the same site under the directory of the start URL are followed (same scheme and host,
+and a path starting like the start one), optionally narrowed by a `match` regular expression on the URL.
+URLs are normalized (no fragment, lowercase scheme and host, no default port) and a directory index
+(/docs/index.html) is the same page as its directory (/docs/), so each page is fetched once (and makes a
+single Block), and a redirect to a page already fetched is dropped.
+
+Politeness, per host: at most `per_host` requests at a time, `delay` seconds between the start of two requests
+(or the Crawl-delay of its robots.txt if longer), and the paths disallowed by its robots.txt are not fetched.
+Non html responses, and links to the usual binary assets, are skipped.
+
+The fetched pages are kept on the downloaded tree of the document (see download_location), the same place
+a single URL source is downloaded to, and extracted with the title_cmd/content_cmd/filters of the Blocks.
+"""
+
+import io
+import re
+import time
+import threading
+import urllib.parse
+import urllib.request
+import urllib.robotparser
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from bs4 import BeautifulSoup, SoupStrainer
+import danotes.model
+
+
+CRAWL_MAX_DEPTH = 2
+CRAWL_JOBS = 8
+CRAWL_PER_HOST = 2
+## Seconds between the start of two requests to the same host
+CRAWL_DELAY = 0.1
+CRAWL_MAX_PAGES = 1000
+CRAWL_TIMEOUT = 30.0
+## Bytes read from a page at most (the rest is dropped)
+CRAWL_MAX_BYTES = 16 << 20
+CRAWL_USER_AGENT = 'danotes-crawler'
+CRAWL_HTML_TYPES = ('text/html', 'application/xhtml+xml')
+CRAWL_SKIPPED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.css', '.js', '.json', '.xml',
+                          '.pdf', '.zip', '.gz', '.tgz', '.tar', '.bz2', '.xz', '.woff', '.woff2', '.ttf', '.mp3', '.mp4')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+## Pages served for a directory URL
+INDEX_PAGES = ('index.html', 'index.htm')
+
+
+class CrawledPage(NamedTuple):
+    url: str        ## normalized URL the page was read from (after redirects)
+    html: bytes
+    depth: int
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def normalize_url(url: str) -> str | None:
+    """URL without fragment, lowercase scheme and host, without default port. None if it is not http(s)"""
+    url, _ = urllib.parse.urldefrag(url.strip())
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    netloc = parts.hostname.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def page_key(url: str) -> str:
+    """Key of the page of a URL: its normalized form, with a directory index (dir/index.html) as its directory (dir/)
+    Sources that are not http(s) URLs are their own key
+    """
+    normalized = normalize_url(url)
+    if normalized is None:
+        return url
+    parts = urllib.parse.urlsplit(normalized)
+    directory, _, name = parts.path.rpartition('/')
+    if name.lower() in INDEX_PAGES:
+        return urllib.parse.urlunsplit(parts._replace(path=directory + '/'))
+    return normalized
+
+
+def site_scope(root: str) -> tuple[str, str, str]:
+    """(scheme, host, path prefix) of the pages a crawl from root follows"""
+    parts = urllib.parse.urlsplit(root)
+    return (parts.scheme, parts.netloc, parts.path[:parts.path.rfind('/') + 1])
+
+
+def in_scope(url: str, scope: tuple, match) -> bool:
+    parts = urllib.parse.urlsplit(url)
+    if (parts.scheme, parts.netloc) != scope[:2] or not parts.path.startswith(scope[2]):
+        return False
+    if parts.path.lower().endswith(CRAWL_SKIPPED_SUFFIXES):
+        return False
+    return match is None or match.search(url) is not None
+
+
+def iter_links(html: bytes, url: str):
+    """Normalized absolute URLs of the <a href> of a page (resolved against its <base href> if any)"""
+    soup = BeautifulSoup(html, features="lxml", parse_only=SoupStrainer(['a', 'base']))
+    base = url
+    tag = soup.find('base', href=True)
+    if tag is not None:
+        base = urllib.parse.urljoin(url, tag['href'])
+    for tag in soup.find_all('a', href=True):
+        link = normalize_url(urllib.parse.urljoin(base, tag['href']))
+        if link is not None:
+            yield link
+
+
+class CrawlHost:
+    """Politeness state of a host: concurrent requests, start time of the next one, robots.txt rules"""
+
+    def __init__(self, per_host: int, delay: float):
+        self.slots = threading.Semaphore(per_host)
+        self.lock = threading.Lock()
+        self.delay = delay
+        self.next_start = 0.0
+        self.robots = None
+
+
+class HostLimiter:
+    """Per-host politeness limits shared by the crawler threads"""
+
+    def __init__(self, per_host: int = CRAWL_PER_HOST, delay: float = CRAWL_DELAY, timeout: float = CRAWL_TIMEOUT):
+        self.per_host = per_host
+        self.delay = delay
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def host(self, url: str) -> CrawlHost:
+        parts = urllib.parse.urlsplit(url)
+        with self.lock:
+            host = self.hosts.get(parts.netloc)
+            if host is None:
+                host = self.hosts[parts.netloc] = CrawlHost(self.per_host, self.delay)
+        with host.lock:
+            if host.robots is None:
+                host.robots = self.read_robots(f"{parts.scheme}://{parts.netloc}/robots.txt")
+                crawl_delay = host.robots.crawl_delay(CRAWL_USER_AGENT)
+                if crawl_delay:
+                    host.delay = max(host.delay, float(crawl_delay))
+        return host
+
+    def read_robots(self, url: str) -> urllib.robotparser.RobotFileParser:
+        """robots.txt rules of a host, allowing everything if it has none (or it cannot be read)"""
+        robots = urllib.robotparser.RobotFileParser(url)
+        try:
+            request = urllib.request.Request(url, headers={'User-Agent': CRAWL_USER_AGENT})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                lines = response.read(CRAWL_MAX_BYTES).decode('utf-8', errors='replace').splitlines()
+        except (OSError, ValueError):
+            lines = []
+        robots.parse(lines)
+        return robots
+
+    def allowed(self, url: str) -> bool:
+        return self.host(url).robots.can_fetch(CRAWL_USER_AGENT, url)
+
+    @contextmanager
+    def slot(self, url: str):
+        """Wait for a request slot of the host of url, and for the delay since the previous request started"""
+        host = self.host(url)
+        with host.slots:
+            with host.lock:
+                wait = host.next_start - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                host.next_start = time.monotonic() + host.delay
+            yield
+
+
+def fetch_page(url: str, limiter: HostLimiter) -> tuple[str, bytes] | None:
+    """(normalized final URL, html) of a page, None if it is disallowed, fails or is not html"""
+    if not limiter.allowed(url):
+        print(f"[Warning]: {url} is disallowed by robots.txt, skipped")
+        return None
+    request = urllib.request.Request(url, headers={'User-Agent': CRAWL_USER_AGENT})
+    try:
+        with limiter.slot(url):
+            with urllib.request.urlopen(request, timeout=limiter.timeout) as response:
+                content_type = response.headers.get_content_type()
+                if content_type not in CRAWL_HTML_TYPES:
+                    return None
+                return (normalize_url(response.geturl()) or url, response.read(CRAWL_MAX_BYTES))
+    except (OSError, ValueError) as e:
+        print(f"[Warning]: Could not fetch {url}: {e}")
+        return None
+
+
+def keep_page(page: CrawledPage, path):
+    """Write a crawled page on the downloaded tree of the document (where a URL source is read from)"""
+    directory, filename = danotes.model.download_location(page.url, path)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        with danotes.model.atomic_writer(directory / filename) as file:
+            file.write(page.html)
+    except OSError as e:
+        print(f"[Warning]: Could not keep {page.url} on {directory / filename}: {e}")
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def crawl_site(root: str, max_depth: int = CRAWL_MAX_DEPTH, match: str = None, jobs: int = CRAWL_JOBS,
+               per_host: int = CRAWL_PER_HOST, delay: float = CRAWL_DELAY, max_pages: int = CRAWL_MAX_PAGES) -> list:
+    """CrawledPages of the site under the directory of root, sorted by URL (so the pages of a directory are together)
+    The start URL is always fetched, the rest only if they match the `match` regular expression
+    """
+    start = normalize_url(root)
+    if start is None:
+        raise ValueError(f"{root=} Expected an http(s) URL to crawl")
+    if max_depth < 0:
+        raise ValueError(f"{max_depth=} Expected 0 (only the start page) or more")
+    try:
+        pattern = re.compile(match) if match else None
+    except re.error as e:
+        raise ValueError(f"{match=} is not a valid regular expression: {e}")
+
+    scope = site_scope(start)
+    limiter = HostLimiter(per_host=per_host, delay=delay)
+    ## Page keys, so a directory and its index page are fetched once
+    seen = {page_key(start)}
+    pages = {}
+    frontier = [start]
+    with ThreadPoolExecutor(max_workers=jobs or CRAWL_JOBS) as executor:
+        for depth in range(max_depth + 1):
+            if not frontier:
+                break
+            print(f"Crawling {len(frontier)} pages at {depth=}")
+            next_frontier = []
+            ## Results are taken in the order the links were found, so the crawl does not depend on the timing
+            for result in executor.map(lambda url: fetch_page(url, limiter), frontier):
+                if result is None:
+                    continue
+                url, html = result
+                ## A redirect to a page fetched already, or out of the site
+                if page_key(url) in pages or (depth and not in_scope(url, scope, None)):
+                    continue
+                pages[page_key(url)] = CrawledPage(url, html, depth)
+                seen.add(page_key(url))
+                if depth == max_depth:
+                    continue
+                for link in iter_links(html, url):
+                    if page_key(link) in seen or len(seen) >= max_pages or not in_scope(link, scope, pattern):
+                        continue
+                    seen.add(page_key(link))
+                    next_frontier.append(link)
+            frontier = next_frontier
+
+    if len(seen) >= max_pages:
+        print(f"[Warning]: The crawl of {root} stopped at {max_pages=}")
+    return [pages[url] for url in sorted(pages)]
+
+
+def extract_page(page: CrawledPage, title_cmd: str = '', content_cmd: str = '', filters: str = '') -> 'Block | None':
+    """Unnumbered EGB Block of a crawled page, extracted as a URL source is (None if its extraction fails)"""
+    name = Path(urllib.parse.urlsplit(page.url).path.rstrip('/')).stem or urllib.parse.urlsplit(page.url).hostname
+    block = danotes.model.Block(name, None, danotes.model.Content(), source=page.url,
+                                title_cmd=title_cmd or '', content_cmd=content_cmd or '', filters=filters or '')
+    try:
+        block.process_html(io.BytesIO(page.html), default_title=name, default_content='body')
+    except Exception as e:
+        print(f"[Warning]: Could not extract {page.url} ({title_cmd=} {content_cmd=}): {type(e).__name__}: {e}")
+        return None
+    return block
+
+
+def extract_pages(pages: list, path, title_cmd: str = '', content_cmd: str = '', filters: str = '', jobs: int = CRAWL_JOBS) -> list:
+    """Blocks of the crawled pages, in the order of the pages (the pages failing the extraction are left out)
+    The pages are kept on the downloaded tree of the document too
+    """
+    def extract(page):
+        keep_page(page, path)
+        return extract_page(page, title_cmd, content_cmd, filters)
+
+    ## The extraction runs pandoc processes, threads keep several of them busy
+    with ThreadPoolExecutor(max_workers=jobs or CRAWL_JOBS) as executor:
+        return [block for block in executor.map(extract, pages) if block is not None]
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['CRAWL_MAX_DEPTH', 'CRAWL_JOBS', 'CRAWL_PER_HOST', 'CRAWL_DELAY', 'CRAWL_MAX_PAGES', 'CrawledPage',
+           'normalize_url', 'page_key', 'HostLimiter', 'crawl_site', 'extract_page', 'extract_pages']
@@ -0,0 +1,174 @@
+"""
+Compact binary .danb format
+
+Stores the Danom model directly, so machine-managed documents load by decoding
+instead of regex parsing, and without the figlet art / footers / separators on disk.
+
+Layout (little endian):
+    Header   : b'DANB' | u8 version | u8 flags | u32 block_count | u64 table_offset
+    Frames   : one frame per Block (zlib compressed if flags & FLAG_ZLIB)
+    Table    : block_count x ( u64 frame_offset | u32 frame_length | u16 buid_length | buid )
+
+Frame payload:
+    str buid | str label | u8 title_marked | str source | str title_cmd | str content_cmd | str filters
+    u32 line_count | line_count x u32 line_length | lines utf-8 blob
+    (str = u32 length + utf-8 bytes)
+"""
+
+import struct
+import zlib
+import danotes.model
+from danotes.profiling import trace
+
+
+DANB_MAGIC = b'DANB'
+DANB_VERSION = 1
+FLAG_ZLIB = 0x01
+
+HEADER_STRUCT = struct.Struct('<4sBBIQ')
+TABLE_ENTRY_STRUCT = struct.Struct('<QIH')
+U32 = struct.Struct('<I')
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def is_danb(path) -> bool:
+    """Return if the file starts with the .danb magic bytes"""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(DANB_MAGIC)) == DANB_MAGIC
+    except OSError:
+        return False
+
+
+def pack_str(string: str) -> bytes:
+    data = (string or '').encode('utf-8')
+    return U32.pack(len(data)) + data
+
+
+def unpack_str(buffer: bytes, offset: int) -> tuple[str, int]:
+    (length,) = U32.unpack_from(buffer, offset)
+    offset += U32.size
+    return (buffer[offset:offset + length].decode('utf-8'), offset + length)
+
+
+def encode_block(block) -> bytes:
+    """Encode the model fields of a Block into a frame payload"""
+    lines = [line.encode('utf-8') for line in block.content]
+    return b''.join([
+        pack_str(block.buid),
+        pack_str(block.label),
+        bytes([1 if block.title_marked else 0]),
+        pack_str(block.source),
+        pack_str(block.title_cmd),
+        pack_str(block.content_cmd),
+        pack_str(block.filters),
+        U32.pack(len(lines)),
+        struct.pack(f'<{len(lines)}I', *[len(line) for line in lines]),
+        b''.join(lines),
+    ])
+
+
+def decode_block(payload: bytes) -> 'Block':
+    """Decode a frame payload into a Block"""
+    buid, offset = unpack_str(payload, 0)
+    label, offset = unpack_str(payload, offset)
+    title_marked = payload[offset] == 1
+    offset += 1
+    source, offset = unpack_str(payload, offset)
+    title_cmd, offset = unpack_str(payload, offset)
+    content_cmd, offset = unpack_str(payload, offset)
+    filters, offset = unpack_str(payload, offset)
+
+    (line_count,) = U32.unpack_from(payload, offset)
+    offset += U32.size
+    lengths = struct.unpack_from(f'<{line_count}I', payload, offset)
+    offset += 4 * line_count
+
+    content = danotes.model.Content()
+    for length in lengths:
+        content.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    return danotes.model.Block(label, buid, content, title_marked=title_marked, source=source, title_cmd=title_cmd, content_cmd=content_cmd, filters=filters)
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+@trace('write_danb')
+def write_danb(danom, path, compress: bool = True):
+    """Write the Danom blocks into a .danb file"""
+    flags = FLAG_ZLIB if compress else 0
+    table = []
+
+    ## Written next to path and swapped in at the end, a crash mid-write leaves the previous document whole
+    with danotes.model.atomic_writer(path) as file:
+        file.write(HEADER_STRUCT.pack(DANB_MAGIC, DANB_VERSION, flags, len(danom), 0))
+
+        for block in danom:
+            frame = encode_block(block)
+            if compress:
+                frame = zlib.compress(frame)
+            table.append((file.tell(), len(frame), block.buid.encode('utf-8')))
+            file.write(frame)
+
+        table_offset = file.tell()
+        for frame_offset, frame_length, buid in table:
+            file.write(TABLE_ENTRY_STRUCT.pack(frame_offset, frame_length, len(buid)))
+            file.write(buid)
+
+        file.seek(0)
+        file.write(HEADER_STRUCT.pack(DANB_MAGIC, DANB_VERSION, flags, len(danom), table_offset))
+
+
+def read_danb_table(file) -> tuple[int, list]:
+    """Read the header and block offset table of an open .danb file. Returns (flags, [(buid, offset, length)])"""
+    magic, version, flags, block_count, table_offset = HEADER_STRUCT.unpack(file.read(HEADER_STRUCT.size))
+    if magic != DANB_MAGIC:
+        raise ValueError("Invalid file type. Expected .danb magic bytes")
+    if version > DANB_VERSION:
+        raise ValueError(f"Unsupported .danb {version=}, this danotes reads up to {DANB_VERSION}")
+
+    file.seek(table_offset)
+    table = []
+    for _ in range(block_count):
+        frame_offset, frame_length, buid_length = TABLE_ENTRY_STRUCT.unpack(file.read(TABLE_ENTRY_STRUCT.size))
+        table.append((file.read(buid_length).decode('utf-8'), frame_offset, frame_length))
+    return (flags, table)
+
+
+def read_danb_frame(file, flags: int, frame_offset: int, frame_length: int) -> 'Block':
+    file.seek(frame_offset)
+    frame = file.read(frame_length)
+    if flags & FLAG_ZLIB:
+        frame = zlib.decompress(frame)
+    return decode_block(frame)
+
+
+def iter_danb(path):
+    """Generator decoding each Block of a .danb file in order"""
+    with open(path, 'rb') as file:
+        flags, table = read_danb_table(file)
+        for _, frame_offset, frame_length in table:
+            yield read_danb_frame(file, flags, frame_offset, frame_length)
+
+
+def read_danb_block(path, buid: str) -> 'Block | None':
+    """Decode a single Block through the offset table (the rest of frames are not read)"""
+    with open(path, 'rb') as file:
+        flags, table = read_danb_table(file)
+        for table_buid, frame_offset, frame_length in table:
+            if table_buid == buid:
+                return read_danb_frame(file, flags, frame_offset, frame_length)
+    return None
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['is_danb', 'read_danb_table', 'write_danb', 'iter_danb', 'read_danb_block']
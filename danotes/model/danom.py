@@ -7,83 +7,191 @@ import json
 import pyfiglet
 from pathlib import Path, PurePath
 import os
+import sys
 from typing import Self
 import yaml
 from treelib import Node, Tree
 import danotes.model
+from danotes.profiling import trace
 
 
 
+## Content lines up to this length are interned during load
+INTERN_MAX_LENGTH = 32
+## Horizontal separator closing each rendered Block
+SEPARATOR_BYTES = b'=' * 105
+## Clean Block spans are copied from the loaded file in chunks of this size
+COPY_CHUNK_SIZE = 1 << 20
+
+
+def copy_span(source, output, start: int, end: int) -> int:
+    """Copy the [start, end) bytes of the source file into output. Returns the bytes copied"""
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = source.read(min(COPY_CHUNK_SIZE, remaining))
+        if not data:
+            raise RuntimeError(f"{source.name} is shorter than expected, cannot copy bytes {start}-{end}")
+        output.write(data)
+        remaining -= len(data)
+    return end - start
+
+
 class Danom(list):
     """The Root Object for the Object Model of a .dan file DAN ObjectModel"""
 
+    ## Origin of the loaded Blocks, {'path', 'size', 'mtime_ns', 'tail'} (None if it was not loaded from a .dan file)
+    origin = None
+    ## Journal entries folded on load, {'path': document realpath, 'consumed': bytes of the journal}
+    journal = None
+
     ## Getter Methods -----------------
-    def load(self, path) -> Self:
-        ## Reading line by line the file parsing the Block Tags
-        with open(path, 'r', encoding='utf-8') as file:
-            inside_block = False
-            inside_header = True
-            inside_yaml = True
-            source = ''
-            title_cmd = ''
-            content_cmd = ''
-            filters = ''
-            content = danotes.model.Content()
-
-            while True:
-                line = file.readline()
-
-                if line == '':
-                    if inside_block:  # If file ends while still in a block, save it
-                        self.append(danotes.model.Block(label, buid, content, title_marked=title_marked, source=source, title_cmd=title_cmd, filters=filters, content_cmd=content_cmd))
-                    break
-
-                if inside_block == False:
-                    ## Checking for all the Block Opening Tags Line
-                    block_otag_match = re.search(r'(?<=<B=)([0-9a-zA-Z]+)>([^\n]+)', line)
-                    if block_otag_match:
-                        inside_block = True
-                        inside_header = True
-                        inside_yaml = True
-                        buid = block_otag_match.group(1)
-                        label_unfiltered = block_otag_match.group(2)
-                        ## Some of the block Opening Tags Line May be Marked
-                        label_match = re.search(r'(.*)( \(X\))', label_unfiltered)
-                        if label_match:
-                            label = label_match.group(1)
-                            title_marked = True
-                        else:
-                            label = label_unfiltered
-                            title_marked = False
-                        content = danotes.model.Content()
+    @staticmethod
+    def iter_load(path, origin: dict = None):
+        """Generator parsing the .dan file, yielding each Block as soon as its closing tag is read
+        If an origin dict is given, each Block records the span of bytes it was read from (see Danom.to_file)
+        A span starts where the previous one ended, and ends after the '=' separator following </B>,
+        same as the Block.to_text() pieces, so the ' (X)' marker after a separator belongs to the next Block
+        """
+        ## Binary documents are decoded, not parsed
+        if danotes.model.is_danb(path):
+            yield from danotes.model.iter_danb(path)
+            return
+        ## Sharded documents stream the Blocks of every shard in document order
+        if danotes.model.is_manifest(path):
+            yield from danotes.model.iter_manifest(path)
+            return
+        ## Compressed documents are parsed while they are decompressed, without spans (there is no offset to copy from)
+        if danotes.model.compression_of(path):
+            with danotes.model.open_decompressed(path) as file:
+                yield from Danom.iter_parse(file)
+            return
+
+        ## Reading line by line the file parsing the Block Tags (bytes, to keep track of the offsets)
+        with open(path, 'rb') as file:
+            if origin is not None:
+                stat = os.fstat(file.fileno())
+                origin.update(path=os.path.realpath(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns, tail=None)
+            yield from Danom.iter_parse(file, origin)
+
+    @staticmethod
+    def iter_parse(raw_lines, origin: dict = None):
+        """Generator parsing .dan text from an iterable of bytes lines (e.g. a binary file), see iter_load
+        Offsets on the origin spans are counted from the first line
+        """
+        inside_block = False
+        inside_header = True
+        inside_yaml = True
+        source = ''
+        title_cmd = ''
+        content_cmd = ''
+        filters = ''
+        lines = []
+        offset = 0
+        span_start = 0
+        pending = None       ## (block, footer_end) waiting for the separator line to close its span
+        crlf = False
+
+        raw_lines = iter(raw_lines)
+        while True:
+            raw = next(raw_lines, b'')
+            line_start = offset
+            offset += len(raw)
+
+            if pending is not None:
+                block, footer_end = pending
+                pending = None
+                if raw.startswith(SEPARATOR_BYTES):
+                    span_end = line_start + len(SEPARATOR_BYTES)
                 else:
-                    if inside_header == True:
-                        yaml_var = danotes.model.check_yaml_line(line)
-                        if yaml_var:
-                            # Extract variables if they exist, else set to None
-                            source = yaml_var.get('source', source)
-                            title_cmd = yaml_var.get('title_cmd', title_cmd)
-                            content_cmd = yaml_var.get('content_cmd', content_cmd)
-                            filters = yaml_var.get('filters', filters)
-                        else:
-                            if re.search(r'^<T>$', line):
-                                inside_header = False
+                    span_end = footer_end
+                ## Blocks with \r\n line endings are normalized by rendering them again
+                if origin is not None:
+                    if not crlf:
+                        block.mark_clean(origin, span_start, span_end)
+                    origin['tail'] = span_end
+                span_start = span_end
+                yield block
+
+            if raw == b'':
+                if inside_block:  # If file ends while still in a block, save it
+                    ## Deleting the trailing empty line (lower-padding) that is added
+                    lines.pop()
+                    yield danotes.model.Block(label, buid, danotes.model.Content(lines), title_marked=title_marked, source=source, title_cmd=title_cmd, filters=filters, content_cmd=content_cmd)
+                    if origin is not None:
+                        origin['tail'] = None
+                break
+
+            line = raw.decode('utf-8')
+            if line.endswith('\r\n'):
+                line = line[:-2] + '\n'
+                crlf = True
+
+            if inside_block == False:
+                ## Checking for all the Block Opening Tags Line
+                block_otag_match = re.search(r'(?<=<B=)([0-9a-zA-Z]+)>([^\n]+)', line)
+                if block_otag_match:
+                    inside_block = True
+                    inside_header = True
+                    inside_yaml = True
+                    crlf = raw.endswith(b'\r\n')
+                    buid = block_otag_match.group(1)
+                    label_unfiltered = block_otag_match.group(2)
+                    ## Some of the block Opening Tags Line May be Marked
+                    label_match = re.search(r'(.*)( \(X\))', label_unfiltered)
+                    if label_match:
+                        label = label_match.group(1)
+                        title_marked = True
                     else:
-                        if re.search(r'^</B>.*', line):
-                            inside_block = False
-                            self.append(danotes.model.Block(label, buid, content, title_marked=title_marked, source=source, title_cmd=title_cmd, filters=filters, content_cmd=content_cmd))   ## Create the Danom Block Object
-                            # Need to restart the vars
-                            source = ''
-                            title_cmd = ''
-                            content_cmd = ''
-                            filters = ''
-                        else:
-                            content.append(line.rstrip('\n')) 
-
+                        label = label_unfiltered
+                        title_marked = False
+                    lines = []
+            else:
+                if inside_header == True:
+                    yaml_var = danotes.model.check_yaml_line(line)
+                    if yaml_var:
+                        # Extract variables if they exist, else set to None
+                        source = yaml_var.get('source', source)
+                        title_cmd = yaml_var.get('title_cmd', title_cmd)
+                        content_cmd = yaml_var.get('content_cmd', content_cmd)
+                        filters = yaml_var.get('filters', filters)
+                    else:
+                        if re.search(r'^<T>$', line):
+                            inside_header = False
+                else:
+                    if re.search(r'^</B>.*', line):
+                        inside_block = False
+                        ## Deleting the trailing empty line (lower-padding) that is added
+                        lines.pop()
+                        block = danotes.model.Block(label, buid, danotes.model.Content(lines), title_marked=title_marked, source=source, title_cmd=title_cmd, filters=filters, content_cmd=content_cmd)   ## Create the Danom Block Object
+                        ## The rendered Block ends right before the newline of the footer if no separator follows
+                        pending = (block, offset - (1 if raw.endswith(b'\n') else 0))
+                        # Need to restart the vars
+                        source = ''
+                        title_cmd = ''
+                        content_cmd = ''
+                        filters = ''
+                    else:
+                        line = line.rstrip('\n')
+                        ## Short lines repeat a lot (blank/indented lines, code fences, keywords), share a single str
+                        if len(line) <= INTERN_MAX_LENGTH:
+                            line = sys.intern(line)
+                        lines.append(line)
 
-        ## Deleting the trailing empty line (lower-padding) that is added
-        for block in self:
-            block.content.pop()
+    @trace('Danom.load')
+    def load(self, path) -> Self:
+        """Parse a .dan file into the Danom"""
+        ## Byte spans are only meaningful for a Danom holding a single file
+        origin = {} if not self and self.origin is None else None
+        self.extend(self.iter_load(path, origin))
+        self.origin = origin if origin and origin.get('tail') is not None else None
+
+        ## Pending edits of the write-ahead journal (read after the document, so none is applied twice)
+        entries, consumed = danotes.model.read_journal(path)
+        if entries:
+            folded = list(danotes.model.iter_fold_journal(iter(self), entries))
+            self.extend(folded[len(self):])
+            self.journal = {'path': os.path.realpath(path), 'consumed': consumed}
         return self
 
 
@@ -100,7 +208,9 @@ class Danom(list):
                 return block
         return None
 
+    @trace('Danom.get_links_target')
     def get_links_target(self):
+        """Extract the LinksTarget of every Block now (they are extracted lazily on access otherwise)"""
         for block in self:
             block.get_links_target()
         return self
@@ -123,11 +233,17 @@ class Danom(list):
         if source:
             content.append(f'source: "{source}"')
 
-        new_block = danotes.model.Block(label = new_label, buid = buid, content = danotes.model.Content(content), source = source)
+        new_block = danotes.model.Block(label = new_label, buid = buid, content = danotes.model.Content(content), source = source or '')
         print(f'Creating new_block {new_block.title_marked=} {new_label=} {buid=} {source=}')
         self.append(new_block)
         return new_block
 
+    def mark_dirty(self):
+        """Force every Block to be rendered again on the next to_file (e.g. danotes file refresh)"""
+        for block in self:
+            block.mark_dirty()
+        return self
+
     def write_to_block(self, buid: str, query: str):
         """Write some query into a determined block of a given Danom"""
         block = self.get_block_by_buid(buid)
@@ -178,6 +294,11 @@ class Danom(list):
         new_block = self.create_new_danotes.model.Block("1", "Document TOC")
         return self
 
+    def toc_entries(self):
+        """Blocks listed on the Toc Block, in document order (anything with buid, label, source and title_marked)"""
+        return iter(self)
+
+    @trace('Danom.update_toc_block')
     def update_toc_block(self):
         """Update the Content of the special Block buid='1' (toc Block). With all the links formed""" 
 
@@ -189,9 +310,7 @@ class Danom(list):
         created_dirs = set()
 
 
-        # Reset it to an empty Content Object
-        self[1].content = danotes.model.Content()
-        for block in self:
+        for block in self.toc_entries():
 
             is_a_dir = False
             if danotes.model.is_a_dir_path(block.source):
@@ -231,131 +350,37 @@ class Danom(list):
             else:
                 tree.create_node(f"<L={block.buid}>{block.label}</L>", leaf_id, parent=current_path)
 
-            # Get the tree as a string
-            tree_string = tree.show(stdout = False)
+        # Get the tree as a string (once, after every Block is on the tree)
+        tree_string = tree.show(stdout = False)
+
+        # Optionally, convert the string to a list of lines
+        tree_lines = tree_string.split("\n")
 
-            # Optionally, convert the string to a list of lines
-            tree_lines = tree_string.split("\n")
-        self[1].content.extend(tree_lines) 
+        ## Only replaced when it changes, an unchanged Toc Block stays clean for Danom.to_file
+        if self[1].content != tree_lines:
+            self[1].content = danotes.model.Content(tree_lines)
         return self
 
+    @trace('Danom.update_from_legacy')
     def update_from_legacy(self):
         """Update the danom to last version from vim-dan-generator legacy version
         Pre-requisites: transform_legacy_title(path) 
         """
 
-        # Shift the blocks buid + 1 starting from danom[2] 
-        self[1].buid = '1'
+        ## Each Block is migrated on its own (see danotes.model.legacy, which streams the same transform)
         for i, block in enumerate(self):
-            if i < 2:
-                continue
-            new_buid = danotes.model.get_next_uid(block.buid)
-            block.buid = new_buid
-
-        # Shift all BUID's +1 for Link Sources/Link Targets on Content
-        for block in self:
-            block.content.shift_links_one_buid()
-
-        # Change B=1 label to Document TOC
-        self[1].label = 'Document TOC'
-
-        # Delete old figlet from content
-        
-        # Delete in Block TOC
-        for _ in range(6):
-            self[1].content.pop(0)
-
-        # Delete in each succesive block
-        for i, block in enumerate(self):
-            if i < 2:
-                continue
-            # Calculate the length of the figlet string
-            pyfiglet_string = pyfiglet.figlet_format(block.label)
-            lines = [line.rstrip() for line in pyfiglet_string.split('\n')]
-
-            no_lines = len(lines)
-
-            for _ in range(no_lines):
-                block.content.pop(0)
-
-        # Transform Header
-        # ---------
-
-        # Step 1) Parse modeline variables dynamically
-        modeline_vars = {
-            'dan_ext_list':       11,
-            'dan_kw_question_list':  12,
-            'dan_kw_nontext_list':   13,
-            'dan_kw_linenr_list':    14,
-            'dan_kw_warningmsg_list':15,
-            'dan_kw_colorcolumn_list':16,
-            'dan_kw_underlined_list':17,
-            'dan_kw_preproc_list':    18,
-            'dan_kw_comment_list':   19,
-            'dan_kw_identifier_list':20,
-            'dan_kw_ignore_list':    21,
-            'dan_kw_statement_list': 22,
-            'dan_kw_cursorline_list':23,
-            'dan_kw_tabline_list':   24,
-        }
-
-        parsed_lists = {}
-
-        for varname, index in modeline_vars.items():
-            line = self[0].content[index]
-            match = re.search(rf'g:{varname}\s*=\s*"([^"]*)"', line)
-            if match:
-                items = [item.strip() for item in match.group(1).split(',') if item.strip()]
-                parsed_lists[varname] = items
-            else:
-                print(f"Warning: Could not parse line for {varname}:")
-
-        # Step 2) Create the Header block
-        basename_no_ext = self[0].label
-        new_block = danotes.model.Block(basename_no_ext, "0", danotes.model.Content())
-
-
-        new_block.content.append("")
-
-        pyfiglet_string = pyfiglet.figlet_format("danotes", font="univers")
-        lines = [line.rstrip() for line in pyfiglet_string.split('\n') if line.strip()]
-        new_block.content.extend(lines)
-        new_block.content.append("")
-
-        new_block.content.append("")
-        new_block.content.append("The following lines are used by danotes, modify them only if you know !")
-        new_block.content.append("")
-
-        for key, _ in modeline_vars.items():
-            if key in parsed_lists:
-                items = parsed_lists[key]
-                value_str = ', '.join(f'"{item}"' for item in items)
-                new_block.content.append(f'{key}: [{value_str}]')
-            else:
-                new_block.content.append(f'{key}: []')
-
-        # Other metadata
-        new_block.content.append('dan_wrap_lines: 105')
-        new_block.content.append('dan_indexed_from:')
-        new_block.content.append('dan_parsed_on:')
-        new_block.content.append(f'dan_title: "{basename_no_ext}"')
-        new_block.content.append('dan_description:')
-        new_block.content.append('dan_tags: []')
-
-        self[0].content = new_block.content
-
-        # EOF EOF EOF Transform Header
-        # ---------
+            danotes.model.update_legacy_block(block, i)
 
         return self
 
 
 
     ## Output methods -----------------
-    def to_json(self, indent: int = 2) -> str:
-        """Convert the Danom to a JSON string."""
-        return json.dumps([block.to_dict() for block in self], indent=indent, ensure_ascii=False)
+    def to_json(self, indent: int = 2, fields: list = None) -> str:
+        """Convert the Danom to a JSON string. (fields: projection of Block keys)"""
+        return json.dumps([block.to_dict(fields) for block in self], indent=indent, ensure_ascii=False)
 
+    @trace('Danom.to_text')
     def to_text(self) -> str:
         """Convert the Danom to a text string.Note: <hr> horizontal separators will be added"""
         output = []
@@ -366,22 +391,161 @@ class Danom(list):
             output.append(block.to_text())
         return ''.join(output)    
 
-    def to_text_notoc(self) -> str:
-        """Same as to_text() but doesnt Update the Block Toc (use for conversions of vim-dan-generator)"""
+    @trace('Danom.to_text_notoc')
+    def to_text_notoc(self, article_toc: bool = False) -> str:
+        """Same as to_text() but doesnt Update the Block Toc (use for conversions of vim-dan-generator)
+        Nor the Article TOCs, unless article_toc=True
+        """
         output = []
         for block in self:
-            output.append(block.to_text())
+            output.append(block.to_text(article_toc))
         return ''.join(output)    
 
 
-    def to_file(self, path):
-        """Save the Danom rendered text to a file"""
-        text = self.to_text()
-        with open(path, 'w', encoding='utf-8') as file:
-            file.write(text) 
+    def open_origin(self):
+        """Open the file the Danom was loaded from, if it was not modified since. Returns a binary file or None"""
+        if self.origin is None:
+            return None
+        try:
+            file = open(self.origin['path'], 'rb')
+        except OSError:
+            return None
+        stat = os.fstat(file.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != (self.origin['size'], self.origin['mtime_ns']):
+            print(f"[Warning]: {self.origin['path']} was modified after being loaded, rendering all its blocks again", file=sys.stderr)
+            file.close()
+            return None
+        return file
+
+    def consume_journal(self, path):
+        """Once the document is saved, drop the journal entries that were folded into it"""
+        if self.journal and os.path.realpath(path) == self.journal['path']:
+            danotes.model.journal_consume(path, self.journal['consumed'])
+            self.journal = None
+
+    @trace('Danom.to_file')
+    def to_file(self, path, update_toc: bool = True, tail: bool = True):
+        """Save the Danom rendered text to a file (.danb paths are saved in binary format)
+        Clean Blocks (not modified since load) are copied verbatim from the loaded file, only dirty Blocks are rendered
+        The file is replaced atomically, and becomes the origin of the following saves
+        update_toc=False leaves the Toc Block as it is, tail=False drops what followed the last Block of the origin
+        (both used for the shards of a sharded document, see danotes.model.shard)
+        """
+        if danotes.model.is_manifest(path):
+            raise ValueError(f"{path} is a shard manifest, it is saved through the ShardedDanom loaded from it (see load_document)")
 
-    def to_file_notoc(self, path):
-        """Same as to_file() but withou altering Block Toc"""
-        text = self.to_text_notoc()
+        if Path(path).suffix == '.danb':
+            if len(self) > 1 and update_toc:
+                self.update_toc_block()
+            danotes.model.write_danb(self, path)
+            self.consume_journal(path)
+            return
+
+        if danotes.model.compression_for(path):
+            self.to_compressed_file(path, update_toc=update_toc)
+            return
+
+        source = self.open_origin()
+        origin = self.origin
+        written = []
+        position = 0
+        run = None      ## [start, end] of contiguous clean spans not copied yet
+
+        try:
+            with danotes.model.atomic_writer(path) as output:
+                for block in self:
+                    ## For Toc Block Update it before writting
+                    if block.buid == "1" and update_toc:
+                        self.update_toc_block()
+
+                    if source and block.is_clean(origin):
+                        _, start, end, _ = block._span
+                        if run and run[1] == start:
+                            run[1] = end
+                        else:
+                            if run:
+                                copy_span(source, output, *run)
+                            run = [start, end]
+                        written.append((block, position, position + end - start))
+                        position += end - start
+                    else:
+                        if run:
+                            copy_span(source, output, *run)
+                            run = None
+                        data = block.to_text().encode('utf-8')
+                        output.write(data)
+                        written.append((block, position, position + len(data)))
+                        position += len(data)
+
+                if run:
+                    copy_span(source, output, *run)
+                ## Whatever followed the last Block (e.g. a final newline)
+                if source and tail:
+                    position += copy_span(source, output, origin['tail'], origin['size'])
+        finally:
+            if source:
+                source.close()
+
+        ## Spans of the saved file, next saves only render what is modified from now on
+        stat = os.stat(path)
+        tail = written[-1][2] if written else 0
+        self.origin = {'path': os.path.realpath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'tail': tail}
+        for block, start, end in written:
+            block.mark_clean(self.origin, start, end)
+        self.consume_journal(path)
+
+    @trace('Danom.to_file_notoc')
+    def to_file_notoc(self, path, article_toc: bool = False):
+        """Same as to_file() but withou altering Block Toc (nor rendering the Article TOCs, unless article_toc=True)"""
+        if danotes.model.is_manifest(path):
+            raise ValueError(f"{path} is a shard manifest, it is saved through the ShardedDanom loaded from it (see load_document)")
+
+        if Path(path).suffix == '.danb':
+            danotes.model.write_danb(self, path)
+            self.consume_journal(path)
+            return
+
+        if danotes.model.compression_for(path):
+            self.to_compressed_file(path, update_toc=False, article_toc=article_toc)
+            return
+
+        text = self.to_text_notoc(article_toc)
         with open(path, 'w', encoding='utf-8') as file:
-            file.write(text) 
+            file.write(text)
+        ## The loaded spans do not describe the file anymore
+        if self.origin and os.path.realpath(path) == self.origin['path']:
+            self.origin = None
+        self.consume_journal(path) 
+
+    @trace('Danom.to_compressed_file')
+    def to_compressed_file(self, path, update_toc: bool = True, article_toc: bool = True):
+        """Save the Danom rendered text compressed, gzip or zstd picked by the path extension (.gz / .zst)
+        Every Block is compressed as it is written, the text is never held whole in memory
+        Clean Blocks of a .dan text origin (and what followed its last Block) are copied from it as to_file() does,
+        so compressing a .dan file keeps its text byte for byte
+        """
+        source = self.open_origin()
+        origin = self.origin
+        try:
+            with danotes.model.compressed_writer(path) as output:
+                for block in self:
+                    if block.buid == "1" and update_toc:
+                        self.update_toc_block()
+                    if source and block.is_clean(origin):
+                        _, start, end, _ = block._span
+                        source.seek(start)
+                        output.write_block(block.buid, source.read(end - start))
+                    else:
+                        output.write_block(block.buid, block.to_text(article_toc).encode('utf-8'))
+                ## Whatever followed the last Block (e.g. a final newline)
+                if source:
+                    copy_span(source, output, origin['tail'], origin['size'])
+        finally:
+            if source:
+                source.close()
+
+        ## A compressed file has no spans to copy from, the following saves render every Block
+        for block in self:
+            block.mark_dirty()
+        self.origin = None
+        self.consume_journal(path)
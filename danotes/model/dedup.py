@@ -0,0 +1,225 @@
+"""
+Near-duplicate Block detection (MinHash signatures plus locality-sensitive hashing)
+
+The content of each Block is reduced to its set of word shingles (`size` consecutive words), and the set
+to a MinHash signature of `permutations` values: the fraction of equal values of two signatures estimates
+the Jaccard similarity of the two sets. Signatures are computed with one permutation hashing (each shingle
+is hashed once, its hash picks a bin and the bin keeps its minimum, empty bins are filled from the next
+non empty one), so the cost is linear in the number of shingles instead of shingles * permutations.
+
+Candidate pairs come from LSH banding: signatures are cut in bands of rows, and Blocks sharing a whole band
+land on the same bucket. Only the Blocks sharing a bucket are compared, which keeps the search sub-quadratic.
+Pairs whose estimated similarity reaches the threshold are joined in clusters, the first Block of a cluster
+(document order) is the one kept when the duplicates are merged, and only the Blocks at least `threshold`
+similar to it are its duplicates (a chain of similar pairs does not make the two ends duplicates).
+"""
+
+import re
+import zlib
+import json
+from typing import NamedTuple
+import danotes.model
+
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_PERMUTATIONS = 128
+DEFAULT_SHINGLE_SIZE = 3
+## Blocks skipped by the detection (the Header and the Toc Block)
+DEDUP_SKIPPED_BUIDS = ('0', '1')
+
+MASK64 = (1 << 64) - 1
+EMPTY_BIN = MASK64
+## Offset added to a value borrowed by an empty bin per bin of distance (densification)
+DENSIFY_OFFSET = 1 << 40
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class DuplicateCluster(NamedTuple):
+    keep: 'danotes.model.Block'     ## first Block of the cluster on the document
+    duplicates: list                ## [(Block, estimated similarity with keep)]
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+class WordCodes(dict):
+    """{word: crc32 of the word}, each distinct word is hashed once"""
+    def __missing__(self, word):
+        code = self[word] = zlib.crc32(word.encode('utf-8'))
+        return code
+
+
+def shingles(lines, size: int = DEFAULT_SHINGLE_SIZE, codes: WordCodes = None) -> set:
+    """Hashes of the `size` consecutive words shingles of the lines (a shorter text is a single shingle)
+    A shingle is the tuple of the codes of its words (hashes of int tuples are not salted, so they do not
+    change between runs). codes: WordCodes shared by the Blocks of a document
+    """
+    if codes is None:
+        codes = WordCodes()
+    words = list(map(codes.__getitem__, WORD_PATTERN.findall('\n'.join(lines).lower())))
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {hash(tuple(words))}
+    return set(map(hash, zip(*(words[i:] for i in range(size)))))
+
+
+def minhash(hashes: set, permutations: int = DEFAULT_PERMUTATIONS) -> tuple:
+    """MinHash signature of a set of shingle hashes (one permutation hashing with densification)"""
+    bins = [EMPTY_BIN] * permutations
+    for value in hashes:
+        ## Mixing, so the bits of the hash spread over the bins
+        value = (value & MASK64) * 0x9E3779B97F4A7C15 & MASK64
+        value ^= value >> 29
+        index = value % permutations
+        value //= permutations
+        if value < bins[index]:
+            bins[index] = value
+
+    ## Empty bins borrow the value of the next non empty bin (circular), shifted by the distance to it
+    if EMPTY_BIN in bins and len(hashes) > 0:
+        signature = list(bins)
+        for index in range(permutations):
+            if bins[index] != EMPTY_BIN:
+                continue
+            distance = 1
+            while bins[(index + distance) % permutations] == EMPTY_BIN:
+                distance += 1
+            signature[index] = bins[(index + distance) % permutations] + distance * DENSIFY_OFFSET
+        return tuple(signature)
+    return tuple(bins)
+
+
+def similarity(signature_a: tuple, signature_b: tuple) -> float:
+    """Estimated Jaccard similarity of the shingle sets of two signatures"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+
+def lsh_params(threshold: float, permutations: int) -> tuple:
+    """(bands, rows) of the banding: the similarity where a pair becomes likely to be a candidate,
+    (1/bands)^(1/rows), is the closest one below the threshold (missed duplicates cost more than false candidates)"""
+    best = (permutations, 1)
+    best_gap = None
+    for rows in range(1, permutations + 1):
+        if permutations % rows:
+            continue
+        bands = permutations // rows
+        gap = threshold - (1 / bands) ** (1 / rows)
+        if gap >= 0 and (best_gap is None or gap < best_gap):
+            best, best_gap = (bands, rows), gap
+    return best
+
+
+def lsh_candidates(signatures: list, bands: int, rows: int) -> set:
+    """Pairs (i, j), i < j, of signatures sharing at least one band
+    Each member of a bucket is paired with its first member only, so a bucket of n identical boilerplate
+    Blocks gives n - 1 pairs instead of n^2 / 2 (the clusters are joined transitively anyway)
+    """
+    candidates = set()
+    for band in range(bands):
+        buckets = {}
+        start = band * rows
+        for i, signature in enumerate(signatures):
+            buckets.setdefault(signature[start:start + rows], []).append(i)
+        for members in buckets.values():
+            for member in members[1:]:
+                candidates.add((members[0], member))
+    return candidates
+
+
+def find_root(parents: list, i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def find_duplicates(danom, threshold: float = DEFAULT_THRESHOLD, permutations: int = DEFAULT_PERMUTATIONS, size: int = DEFAULT_SHINGLE_SIZE) -> list:
+    """DuplicateClusters of the Blocks whose content is at least `threshold` similar (estimated Jaccard
+    similarity of their word shingles), in document order. Blocks without words are not compared"""
+    if not 0 < threshold <= 1:
+        raise ValueError(f"{threshold=} Expected a similarity in (0, 1]")
+
+    blocks = []
+    signatures = []
+    codes = WordCodes()
+    for block in danom:
+        if block.buid in DEDUP_SKIPPED_BUIDS:
+            continue
+        hashes = shingles(block.content, size, codes)
+        if hashes:
+            blocks.append(block)
+            signatures.append(minhash(hashes, permutations))
+
+    bands, rows = lsh_params(threshold, permutations)
+    parents = list(range(len(blocks)))
+    for i, j in lsh_candidates(signatures, bands, rows):
+        if similarity(signatures[i], signatures[j]) >= threshold:
+            root_i, root_j = find_root(parents, i), find_root(parents, j)
+            if root_i != root_j:
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+
+    members = {}
+    for i in range(len(blocks)):
+        members.setdefault(find_root(parents, i), []).append(i)
+    clusters = []
+    for root, indexes in sorted(members.items()):
+        if len(indexes) < 2:
+            continue
+        ## The union is transitive (a~b and b~c joins c even if a and c differ), only the Blocks similar
+        ## enough to the one kept are its duplicates
+        duplicates = [(blocks[i], similarity(signatures[root], signatures[i])) for i in indexes[1:]]
+        duplicates = [(block, score) for block, score in duplicates if score >= threshold]
+        if duplicates:
+            clusters.append(DuplicateCluster(blocks[root], duplicates))
+    return clusters
+
+
+def merge_duplicates(danom, clusters: list) -> dict:
+    """Remove the duplicates of each cluster from the danom, the links to them point to the Block kept
+    Returns {removed buid: kept buid}"""
+    mapping = {}
+    for cluster in clusters:
+        for block, _ in cluster.duplicates:
+            mapping[block.buid] = cluster.keep.buid
+    if not mapping:
+        return mapping
+    danom[:] = [block for block in danom if block.buid not in mapping]
+    ## The Link Targets of a removed Block are not on the Block kept, links to them point to the whole Block
+    iids = {cluster.keep.buid: {target.iid for target in cluster.keep.links_target} for cluster in clusters}
+    for block in danom:
+        block.content.remap_links(mapping, iids)
+    return mapping
+
+
+def format_clusters(clusters: list) -> str:
+    output = []
+    for number, cluster in enumerate(clusters, 1):
+        output.append(f"Cluster {number}: keep {cluster.keep.buid:<6} {cluster.keep.label}")
+        for block, score in cluster.duplicates:
+            output.append(f"  {score:.2f}  {block.buid:<6} {block.label}")
+    return '\n'.join(output)
+
+
+def clusters_to_json(clusters: list) -> str:
+    output = []
+    for cluster in clusters:
+        output.append(json.dumps({
+            'keep': {'buid': cluster.keep.buid, 'label': cluster.keep.label},
+            'duplicates': [{'buid': block.buid, 'label': block.label, 'similarity': round(score, 4)} for block, score in cluster.duplicates],
+        }, ensure_ascii=False) + '\n')
+    return ''.join(output)
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['DuplicateCluster', 'shingles', 'minhash', 'similarity', 'lsh_params', 'lsh_candidates',
+           'find_duplicates', 'merge_duplicates', 'format_clusters', 'clusters_to_json']
@@ -0,0 +1,201 @@
+"""
+Block-level structural diff between two .dan documents
+
+Each Block is reduced to a digest (label, a hash of its header fields and a hash of its content) while
+the documents are streamed, so the comparison is linear in the number of Blocks and only the digests are
+kept in memory. Blocks are matched by buid, or by source (EGB Blocks, regenerated documentation keeps its
+sources while buids may shift). Line diffs are only computed for the modified Blocks, on a second pass
+that keeps the content of those Blocks alone.
+"""
+
+import sys
+import json
+import difflib
+import hashlib
+from typing import NamedTuple
+import danotes.model
+
+
+DIFF_KEYS = ('buid', 'source')
+## Header fields of a Block hashed together (a change on any of them makes the Block modified)
+DIFF_HEADER_FIELDS = ('source', 'title_cmd', 'content_cmd', 'filters', 'title_marked')
+DIFF_STATUSES = ('added', 'removed', 'relabelled', 'modified')
+DIFF_SYMBOLS = {'added': 'A', 'removed': 'D', 'relabelled': 'R', 'modified': 'M'}
+
+
+class BlockDigest(NamedTuple):
+    buid: str
+    label: str
+    header: str         ## hash of DIFF_HEADER_FIELDS
+    content: str        ## hash of the content lines
+    position: int       ## index of the Block on its document
+
+
+class BlockChange(NamedTuple):
+    status: str                     ## any of DIFF_STATUSES
+    old: 'BlockDigest | None'
+    new: 'BlockDigest | None'
+    changes: tuple                  ## changed parts of a matched Block: 'buid', 'label', 'header', 'content'
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def digest(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def block_digest(block, position: int) -> BlockDigest:
+    header = '\0'.join(str(getattr(block, field)) for field in DIFF_HEADER_FIELDS)
+    return BlockDigest(block.buid, block.label, digest(header), digest('\n'.join(block.content)), position)
+
+
+def iter_document(path):
+    """Stream the Blocks of a document (any format), with the pending edits of its journal"""
+    blocks = danotes.model.Danom.iter_load(path)
+    entries, _ = danotes.model.read_journal(path)
+    if entries:
+        blocks = danotes.model.iter_fold_journal(blocks, entries)
+    return blocks
+
+
+def match_keys(digests: list, sources: list, by: str) -> list:
+    """Key each Block is matched with. by='source' matches EGB Blocks by their source (the n-th Block of a
+    repeated source with the n-th one), Blocks without a source are matched by buid"""
+    if by == 'buid':
+        return [('buid', entry.buid) for entry in digests]
+    keys = []
+    seen = {}
+    for entry, source in zip(digests, sources):
+        if source:
+            seen[source] = seen.get(source, 0) + 1
+            keys.append(('source', source, seen[source]))
+        else:
+            keys.append(('buid', entry.buid))
+    return keys
+
+
+def read_digests(path, by: str) -> dict:
+    """{match key: BlockDigest} of a document, in document order"""
+    digests = []
+    sources = []
+    for position, block in enumerate(iter_document(path)):
+        digests.append(block_digest(block, position))
+        sources.append(block.source)
+    keys = match_keys(digests, sources, by)
+    output = {}
+    for key, entry in zip(keys, digests):
+        if key in output:
+            print(f"[Warning]: {path} has repeated {key[0]} {key[1]!r}, only the first Block is compared", file=sys.stderr)
+            continue
+        output[key] = entry
+    return output
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def diff_digests(old: dict, new: dict) -> list:
+    """BlockChanges between the digests of two documents (see read_digests)
+    Changed and added Blocks are listed in the order of the new document, removed ones after them
+    """
+    output = []
+    for key, new_digest in new.items():
+        old_digest = old.get(key)
+        if old_digest is None:
+            output.append(BlockChange('added', None, new_digest, ()))
+            continue
+        changes = tuple(part for part in ('label', 'header', 'content') if getattr(old_digest, part) != getattr(new_digest, part))
+        if not changes:
+            ## Matched by source, a Block whose buid shifted alone is unchanged
+            continue
+        if old_digest.buid != new_digest.buid:
+            changes = ('buid',) + changes
+        if 'header' in changes or 'content' in changes:
+            output.append(BlockChange('modified', old_digest, new_digest, changes))
+        else:
+            output.append(BlockChange('relabelled', old_digest, new_digest, changes))
+    for key, old_digest in old.items():
+        if key not in new:
+            output.append(BlockChange('removed', old_digest, None, ()))
+    return output
+
+
+def diff_documents(old_path, new_path, by: str = 'buid') -> tuple:
+    """Compare two documents Block by Block. Returns (BlockChanges, number of unchanged Blocks)"""
+    if by not in DIFF_KEYS:
+        raise ValueError(f"{by=} Expected any of {DIFF_KEYS}")
+    old = read_digests(old_path, by)
+    new = read_digests(new_path, by)
+    changes = diff_digests(old, new)
+    matched = sum(1 for key in new if key in old)
+    unchanged = matched - sum(1 for change in changes if change.old is not None and change.new is not None)
+    return changes, unchanged
+
+
+def read_contents(path, positions: set) -> dict:
+    """{position: content lines} of the Blocks at the given positions of a document"""
+    output = {}
+    if not positions:
+        return output
+    last = max(positions)
+    for position, block in enumerate(iter_document(path)):
+        if position in positions:
+            output[position] = list(block.content)
+        if position >= last:
+            break
+    return output
+
+
+def iter_line_diffs(old_path, new_path, changes: list):
+    """Generator of (BlockChange, unified diff lines) for the modified Blocks whose content changed"""
+    modified = [change for change in changes if change.status == 'modified' and 'content' in change.changes]
+    old_contents = read_contents(old_path, {change.old.position for change in modified})
+    new_contents = read_contents(new_path, {change.new.position for change in modified})
+    for change in modified:
+        lines = difflib.unified_diff(
+            old_contents.get(change.old.position, []), new_contents.get(change.new.position, []),
+            fromfile=f"a/{change.old.buid} {change.old.label}", tofile=f"b/{change.new.buid} {change.new.label}", lineterm='')
+        yield change, list(lines)
+
+
+def format_change(change: BlockChange) -> str:
+    """One line of the diff report: status symbol, buid and label (old -> new if they changed), changed parts"""
+    symbol = DIFF_SYMBOLS[change.status]
+    if change.old is None or change.new is None:
+        entry = change.new or change.old
+        return f"{symbol} {entry.buid:<6} {entry.label}"
+    buid = change.new.buid if 'buid' not in change.changes else f"{change.old.buid}->{change.new.buid}"
+    label = change.new.label if 'label' not in change.changes else f"{change.old.label} -> {change.new.label}"
+    parts = [part for part in change.changes if part in ('header', 'content')]
+    return f"{symbol} {buid:<6} {label}" + (f"  ({', '.join(parts)})" if parts else '')
+
+
+def change_to_json(change: BlockChange, diff_lines: list = None) -> str:
+    output = {
+        'status': change.status,
+        'old': {'buid': change.old.buid, 'label': change.old.label} if change.old else None,
+        'new': {'buid': change.new.buid, 'label': change.new.label} if change.new else None,
+        'changes': list(change.changes),
+    }
+    if diff_lines is not None:
+        output['diff'] = diff_lines
+    return json.dumps(output, ensure_ascii=False)
+
+
+def diff_summary(changes: list, unchanged: int) -> str:
+    counts = {status: 0 for status in DIFF_STATUSES}
+    for change in changes:
+        counts[change.status] += 1
+    return ', '.join(f"{counts[status]} {status}" for status in DIFF_STATUSES) + f", {unchanged} unchanged"
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['DIFF_KEYS', 'BlockDigest', 'BlockChange', 'block_digest', 'read_digests', 'diff_digests', 'diff_documents',
+           'iter_line_diffs', 'format_change', 'change_to_json', 'diff_summary']
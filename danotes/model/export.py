@@ -0,0 +1,230 @@
+"""
+Static site export of a Danom: one page per Block (html or md) plus an index page with the Document TOC
+
+Link sources <L=buid#iid>label</L> become hyperlinks to the page of the Block (and the anchor of the
+Link Target), and Link Targets <I=buid#iid>label</I> become anchors. The index page is the TOC Block tree
+(see Danom.update_toc_block), every page links back to it, to its previous/next Block and shows its
+source directories as breadcrumbs.
+
+Pages only depend on their own Block and neighbours, so each one is rendered from a plain record
+(picklable, rendered on a process pool) and skipped if the hash of its record did not change since the
+last export, recorded on <out>/.danotes-export-<format>.json (one per format, so an html and a md export
+can share a directory)
+"""
+
+import os
+import re
+import json
+import html
+import hashlib
+from pathlib import PurePath
+import danotes.model
+
+
+EXPORT_FORMATS = ('html', 'md')
+## Bumped whenever the page templates change, so the next export renders every page again
+EXPORT_VERSION = 1
+EXPORT_MANIFEST = '.danotes-export-{fmt}.json'
+INDEX_NAME = 'index'
+
+LINK_PATTERN = re.compile(r'<L=([0-9a-zA-Z]+)(?:#([0-9a-zA-Z]+))?>(.*?)</L>|<I=([0-9a-zA-Z]+)#([0-9a-zA-Z]+)>(.*?)</I>')
+## Characters with a meaning for markdown inline syntax
+MD_SPECIAL_PATTERN = re.compile(r'([\\`*_\[\]<>#|])')
+
+HTML_STYLE = """body { max-width: 60rem; margin: 2rem auto; padding: 0 1rem; font-family: sans-serif; }
+pre { white-space: pre-wrap; font-size: 0.95rem; }
+nav, footer { font-size: 0.9rem; margin: 1rem 0; }
+.source { color: #666; }"""
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+{style}
+</style>
+</head>
+<body id="top">
+{nav}
+{body}
+<footer><a href="{index}">To Document TOC</a> | <a href="#top">Back to Article Top</a></footer>
+</body>
+</html>
+"""
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def page_name(buid: str, fmt: str) -> str:
+    """File name of the page of a Block. Uppercase buid characters are escaped ('2S' -> '2_s.html'),
+    so pages do not collide on case-insensitive filesystems. The Header and Toc Blocks are the index page"""
+    if buid in ('0', '1'):
+        return f"{INDEX_NAME}.{fmt}"
+    return re.sub(r'[A-Z]', lambda match: '_' + match.group(0).lower(), buid) + '.' + fmt
+
+
+def escape(text: str, fmt: str) -> str:
+    if fmt == 'html':
+        return html.escape(text, quote=False)
+    return MD_SPECIAL_PATTERN.sub(r'\\\1', text)
+
+
+def link(label: str, href: str, fmt: str) -> str:
+    if fmt == 'html':
+        return f'<a href="{html.escape(href)}">{label}</a>'
+    return f'[{label}]({href})'
+
+
+def anchor(label: str, iid: str, fmt: str) -> str:
+    if fmt == 'html':
+        return f'<a id="{iid}">{label}</a>'
+    return f'<a id="{iid}"></a>{label}'
+
+
+def convert_links(line: str, fmt: str) -> str:
+    """Escape a line of .dan text, turning Link Sources into hyperlinks and Link Targets into anchors"""
+    output = []
+    position = 0
+    for match in LINK_PATTERN.finditer(line):
+        output.append(escape(line[position:match.start()], fmt))
+        if match.group(1) is not None:
+            href = page_name(match.group(1), fmt) + (f"#{match.group(2)}" if match.group(2) else '')
+            output.append(link(escape(match.group(3), fmt), href, fmt))
+        else:
+            output.append(anchor(escape(match.group(6), fmt), match.group(5), fmt))
+        position = match.end()
+    output.append(escape(line[position:], fmt))
+    return ''.join(output)
+
+
+def source_crumbs(source: str) -> list:
+    """Directories of the source of a Block, as shown on the TOC Block tree"""
+    if not source:
+        return []
+    source = os.path.normpath(source)
+    if not danotes.model.is_a_dir_path(source):
+        source = PurePath(source).parent.as_posix()
+    return [part for part in source.strip('/').split('/') if part and part != '.']
+
+
+def page_record(block, previous=None, following=None) -> dict:
+    """Everything the page of a Block is rendered from (plain data, sent to the export workers)
+    previous/following: the Blocks before and after it on the document, linked from the navigation
+    """
+    return {
+        'buid': block.buid,
+        'label': block.label,
+        'source': block.source,
+        'links_target': [(link_target.iid, link_target.label) for link_target in block.links_target],
+        'content': list(block.content),
+        'crumbs': source_crumbs(block.source),
+        'prev': (previous.buid, previous.label) if previous is not None else None,
+        'next': (following.buid, following.label) if following is not None else None,
+    }
+
+
+def record_hash(record: dict, fmt: str) -> str:
+    data = json.dumps([EXPORT_VERSION, fmt, record], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def export_manifest_path(out: str, fmt: str) -> str:
+    return os.path.join(out, EXPORT_MANIFEST.format(fmt=fmt))
+
+
+def read_export_manifest(out: str, fmt: str) -> dict:
+    """{page name: hash} of the last export of `fmt` to `out` (empty if there is none, or of another version)"""
+    try:
+        with open(export_manifest_path(out, fmt), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('format') != fmt or manifest.get('version') != EXPORT_VERSION:
+        return {}
+    return manifest.get('pages', {})
+
+
+def write_export_manifest(out: str, fmt: str, pages: dict):
+    with danotes.model.atomic_writer(export_manifest_path(out, fmt), 'w') as file:
+        json.dump({'format': fmt, 'version': EXPORT_VERSION, 'pages': pages}, file, ensure_ascii=False, separators=(',', ':'))
+
+
+def md_lines(lines: list) -> list:
+    """Converted lines as markdown: hard line breaks, and leading spaces kept (the .dan text is laid out by lines)"""
+    output = []
+    for line in lines:
+        stripped = line.lstrip(' ')
+        output.append('&nbsp;' * (len(line) - len(stripped)) + stripped + ('  ' if stripped else ''))
+    return output
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def render_nav(record: dict, fmt: str) -> str:
+    """Navigation of a page: link to the Document TOC, source breadcrumbs, previous and next Blocks"""
+    index = INDEX_NAME + '.' + fmt
+    parts = [link('Document TOC', index, fmt)] + [escape(crumb, fmt) for crumb in record['crumbs']]
+    output = ' / '.join(parts)
+    if record.get('prev'):
+        output += ' | ' + link('← ' + escape(record['prev'][1], fmt), page_name(record['prev'][0], fmt), fmt)
+    if record.get('next'):
+        output += ' | ' + link(escape(record['next'][1], fmt) + ' →', page_name(record['next'][0], fmt), fmt)
+    if fmt == 'html':
+        return f'<nav>{output}</nav>'
+    return output
+
+
+def render_page(record: dict, fmt: str) -> str:
+    """Page of a Block record (see page_record)"""
+    label = escape(record['label'], fmt)
+    article_toc = [link(escape(label_target, fmt), f"#{iid}", fmt) for iid, label_target in record['links_target']]
+    lines = [convert_links(line, fmt) for line in record['content']]
+
+    if fmt == 'html':
+        body = [f"<h1>{label}</h1>"]
+        if record['source']:
+            body.append(f'<p class="source">source: {html.escape(record["source"])}</p>')
+        if article_toc:
+            body.append('<ul>\n' + '\n'.join(f"<li>{item}</li>" for item in article_toc) + '\n</ul>')
+        body.append('<pre>\n' + '\n'.join(lines) + '\n</pre>')
+        return HTML_PAGE.format(title=html.escape(record['label']), style=HTML_STYLE, nav=render_nav(record, fmt), body='\n'.join(body), index=INDEX_NAME + '.html')
+
+    output = ['<a id="top"></a>', '', render_nav(record, fmt), '', f"# {label}", '']
+    if record['source']:
+        output.extend([f"source: `{record['source']}`", ''])
+    if article_toc:
+        output.extend([f"- {item}" for item in article_toc] + [''])
+    output.extend(md_lines(lines))
+    output.extend(['', '---', '', f"{link('To Document TOC', INDEX_NAME + '.md', fmt)} | {link('Back to Article Top', '#top', fmt)}", ''])
+    return '\n'.join(output)
+
+
+def render_index(title: str, toc_lines: list, fmt: str) -> str:
+    """Index page: the Document TOC tree, each leaf linking to its page"""
+    lines = [convert_links(line, fmt) for line in toc_lines]
+    if fmt == 'html':
+        body = f"<h1>{html.escape(title)}</h1>\n<pre>\n" + '\n'.join(lines) + '\n</pre>'
+        return HTML_PAGE.format(title=html.escape(title), style=HTML_STYLE, nav='<nav>Document TOC</nav>', body=body, index=INDEX_NAME + '.html')
+    return '\n'.join([f"# {escape(title, fmt)}", ''] + md_lines(lines) + [''])
+
+
+def write_page(job: tuple) -> str:
+    """Render and write a page (process pool worker). job = (out, fmt, record). Returns the page name"""
+    out, fmt, record = job
+    name = page_name(record['buid'], fmt)
+    with danotes.model.atomic_writer(os.path.join(out, name), 'w') as file:
+        file.write(render_page(record, fmt))
+    return name
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['EXPORT_FORMATS', 'page_name', 'convert_links', 'page_record', 'record_hash', 'read_export_manifest', 'write_export_manifest', 'render_page', 'render_index', 'write_page']
@@ -0,0 +1,172 @@
+"""
+HTML extraction stage for EGB (Externally Generated Blocks)
+"""
+
+import re
+from bs4 import BeautifulSoup, Comment, Tag
+from bs4.filter import ElementFilter
+import subprocess
+from danotes.profiling import trace
+
+
+## ----------------------------------------------------------------------------
+# @section SELECTOR_FIRST_PARSING
+# @description Only build the BeautifulSoup subtrees that title_cmd/content_cmd
+#   are going to select, instead of the whole document
+
+
+## Tag, tag.class, tag#id, .class, #id (any combination of classes and one id)
+SIMPLE_SELECTOR_PATTERN = re.compile(r'^([a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)$')
+
+
+def parse_simple_selector(selector: str) -> 'tuple[str | None, set, str | None] | None':
+    """
+    Parse a simple CSS selector into (name, classes, id)
+    Returns None if the selector is combined (descendants, attributes, pseudo-classes ...)
+    as those cannot be decided at tag creation time
+    """
+    selector = selector.strip()
+    match = SIMPLE_SELECTOR_PATTERN.match(selector)
+    if not selector or not match:
+        return None
+
+    name = match.group(1).lower() if match.group(1) else None
+    classes = set()
+    id_ = None
+    for part in re.findall(r'[.#][\w-]+', match.group(2)):
+        if part[0] == '.':
+            classes.add(part[1:])
+        elif id_ is None:
+            id_ = part[1:]
+        else:
+            return None
+    return (name, classes, id_)
+
+
+class SelectorFilter(ElementFilter):
+    """Parse-time filter keeping only the top-most subtrees matched by simple selectors"""
+    def __init__(self, rules: list):
+        super().__init__()
+        self.rules = rules
+
+    @property
+    def includes_everything(self) -> bool:
+        return False
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        attrs = attrs or {}
+        for rule_name, rule_classes, rule_id in self.rules:
+            if rule_name and rule_name != name.lower():
+                continue
+            if rule_id and attrs.get('id') != rule_id:
+                continue
+            if rule_classes and not rule_classes.issubset(str(attrs.get('class', '')).split()):
+                continue
+            return True
+        return False
+
+    def allow_string_creation(self, string) -> bool:
+        return False
+
+
+def parse_html(file, title_cmd: str = '', content_cmd: str = '') -> BeautifulSoup:
+    """
+    Parse an html file with lxml
+    If every needed selector is simple, only the matching subtrees are built
+    Otherwise (or with no content_cmd, which needs the whole document) fall back to a full parse
+    """
+    selectors = [selector for selector in (title_cmd, content_cmd) if selector]
+    rules = [parse_simple_selector(selector) for selector in selectors]
+
+    if content_cmd and all(rules):
+        return BeautifulSoup(file, features="lxml", parse_only=SelectorFilter(rules))
+    return BeautifulSoup(file, features="lxml")
+
+## EOF EOF EOF SELECTOR_FIRST_PARSING
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section SANITIZER
+
+
+SANITIZE_DROP_TAGS = ('script', 'style')
+
+
+def sanitize_html(root):
+    """
+    Remove <script>, <style>, HTML comments and 'style' attributes in a single traversal
+    Subtrees of dropped tags are never visited
+    """
+    if isinstance(root, Tag) and root.attrs:
+        root.attrs.pop('style', None)
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in list(node.children):
+            if isinstance(child, Comment):
+                child.extract()
+            elif isinstance(child, Tag):
+                if child.name in SANITIZE_DROP_TAGS:
+                    child.decompose()
+                else:
+                    if child.attrs:
+                        child.attrs.pop('style', None)
+                    stack.append(child)
+    return root
+
+## EOF EOF EOF SANITIZER
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section EXTRACTION
+
+@trace('extract_html')
+def extract_html(file, title_cmd: str = '', content_cmd: str = '', default_title: str = '', default_content: str = 'body'):
+    """
+    Extraction stage of an html source. Returns (title, content)
+        - title: text of the first title_cmd match (or default_title)
+        - content: sanitized first content_cmd match (or soup.body / soup if default_content is None)
+    """
+    soup = parse_html(file, title_cmd, content_cmd)
+
+    if title_cmd:
+        title = sanitize_html(soup.select(title_cmd)[0]).get_text(strip=True)
+    else:
+        title = default_title
+
+    if content_cmd:
+        content = soup.select(content_cmd)[0]
+    elif default_content:
+        content = getattr(soup, default_content)
+    else:
+        content = soup
+
+    if content is not None:
+        sanitize_html(content)
+
+    return (title, content)
+
+
+@trace('html_to_plain (pandoc)')
+def html_to_plain(content, lua_paths: list = None) -> list:
+    """Convert an html subtree to plain text lines with a single pandoc process (Lua filters applied with -L)"""
+    cmd = ['pandoc', '-f', 'html', '-t', 'plain']
+    for lua_path in lua_paths or []:
+        cmd.extend(['-L', lua_path])
+
+    try:
+        process = subprocess.run(cmd, input=str(content), capture_output=True, text=True)
+    except FileNotFoundError:
+        print("[Warning]: pandoc is not installed, html content could not be converted")
+        return []
+    return process.stdout.splitlines()
+
+## EOF EOF EOF EXTRACTION
+## ----------------------------------------------------------------------------
+
+__all__ = ['parse_simple_selector', 'parse_html', 'sanitize_html', 'extract_html', 'html_to_plain']
@@ -0,0 +1,170 @@
+"""
+Streaming ingestion of large text (e.g. piped stdin) into a Block of a .dan document
+
+Appending a query through the Danom loads the whole document, holds the text in memory several times
+(the read string, the last line of the Content, the rendered Block) and renders the document again.
+stream_append() instead scans the document once for the byte offset where the text of the Block ends
+(the end of its last Content line, right before the lower-padding line and </B>), and writes the new
+document as: the bytes before that offset, the text read in chunks, and the bytes after it.
+Memory is bounded by INGEST_CHUNK_SIZE whatever the size of the text, and the result is the same file
+Block.append_query() plus Danom.to_file() would write (Link Targets of the text show on the Article TOC
+once the Block is rendered again, e.g. danotes file refresh). The text is decoded as strict UTF-8 with
+universal newlines on the way, so bytes that are not UTF-8 fail before the document is replaced.
+
+Only plain .dan text documents are streamed into, stream_append() returns None for the rest (.danb,
+compressed, shard manifests, \r\n Blocks, Blocks without Content lines) so the caller can load the Danom.
+"""
+
+import os
+import re
+import codecs
+import danotes.model
+
+
+INGEST_CHUNK_SIZE = 1 << 16
+## Same tags Danom.iter_parse looks for (on bytes)
+BLOCK_OTAG_PATTERN = re.compile(rb'(?<=<B=)([0-9a-zA-Z]+)>([^\n]+)')
+ARTICLE_TOC_TAG_PATTERN = re.compile(rb'^<T>\r?$')
+BLOCK_CTAG_PATTERN = re.compile(rb'^</B>')
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def find_append_offset(path, buid: str = None) -> tuple[str, int] | None:
+    """(buid, byte offset) where the text appended to a Block goes, the last Block if buid is None
+    None if the Block does not exist or its text cannot be appended in place
+    """
+    found = None
+    with open(path, 'rb') as file:
+        inside_block = False
+        inside_header = False
+        offset = 0
+        previous = None         ## (start, raw) of the two last lines of the Block Content
+        last = None
+        for raw in file:
+            start = offset
+            offset += len(raw)
+            if not inside_block:
+                match = BLOCK_OTAG_PATTERN.search(raw)
+                if match:
+                    inside_block, inside_header = True, True
+                    block_buid = match.group(1).decode('utf-8')
+                    previous = last = None
+            elif inside_header:
+                if ARTICLE_TOC_TAG_PATTERN.match(raw.rstrip(b'\n')):
+                    inside_header = False
+            elif BLOCK_CTAG_PATTERN.match(raw):
+                inside_block = False
+                if buid is None or block_buid == buid:
+                    ## The last Content line, followed by the (empty) lower-padding line
+                    if previous is None or last[1] != b'\n' or previous[1].endswith(b'\r\n'):
+                        found = (block_buid, None)
+                    else:
+                        found = (block_buid, last[0] - 1)
+                    if buid is not None:
+                        break
+            else:
+                previous, last = last, (start, raw)
+
+    if found is None or found[1] is None:
+        return None
+    return found
+
+
+def iter_chunks(stream, size: int = INGEST_CHUNK_SIZE):
+    """Chunks of a binary stream, as they are read"""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_text_chunks(chunks):
+    """UTF-8 chunks of the text of binary chunks, with universal newlines (\r\n and \r become \n) as the
+    text read by a loaded Danom has. Raises ValueError if the bytes are not valid UTF-8
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+    carriage = False        ## The previous chunk ended in \r, a \n starting this one is the same newline
+    for chunk in chunks:
+        try:
+            text = decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise ValueError(f"The streamed text is not valid UTF-8: {e}")
+        if carriage and text.startswith('\n'):
+            text = text[1:]
+        if text:
+            carriage = text.endswith('\r')
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if text:
+            yield text.encode('utf-8')
+    try:
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError as e:
+        raise ValueError(f"The streamed text is not valid UTF-8, it ends within a character: {e}")
+
+
+def copy_range(source, output, start: int, end: int):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = source.read(min(INGEST_CHUNK_SIZE, remaining))
+        if not data:
+            raise RuntimeError(f"{source.name} is shorter than expected, cannot copy bytes {start}-{end}")
+        output.write(data)
+        remaining -= len(data)
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def stream_append(path, buid: str, stream) -> tuple[str, int] | None:
+    """Append the text of a binary stream to the last line of a Block (the last Block if buid is None),
+    without loading the document. Returns (buid, bytes appended), or None if the document has to be loaded instead
+    (nothing is read from the stream then)
+    """
+    if danotes.model.is_danb(path) or danotes.model.is_manifest(path) or danotes.model.compression_of(path):
+        return None
+
+    ## An empty stream is no query at all (e.g. block write --new-label from a script), peeked without consuming it
+    if hasattr(stream, 'peek') and not stream.peek(1):
+        return None
+
+    ## Pending journal edits go first, as they would on a loaded Danom
+    entries, _ = danotes.model.read_journal(path)
+    if entries:
+        danotes.model.Danom().load(path).to_file(path)
+
+    found = find_append_offset(path, buid)
+    if found is None:
+        return None
+    buid, insert = found
+
+    ## Decoded and encoded again, so invalid bytes fail (leaving the document untouched) instead of being written
+    chunks = iter_text_chunks(iter_chunks(stream))
+    first = next(chunks, b'')
+    if not first:
+        return (buid, 0)
+
+    written = 0
+    with open(path, 'rb') as source, danotes.model.atomic_writer(path) as output:
+        size = os.fstat(source.fileno()).st_size
+        copy_range(source, output, 0, insert)
+        output.write(first)
+        written += len(first)
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+        copy_range(source, output, insert, size)
+    return (buid, written)
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['INGEST_CHUNK_SIZE', 'stream_append']
@@ -0,0 +1,260 @@
+"""
+Write-ahead edit journal of a .dan document (<path>.journal)
+
+Writers append one small operation per line (NDJSON) under an exclusive flock of the journal,
+without loading the Danom, so their cost does not depend on the document size.
+Danom.load() folds the pending operations into the model, and a Danom.to_file() on the
+document drops the folded prefix of the journal (operations appended meanwhile are kept).
+
+Operations (buids are resolved when the entry is written, `last` is the last buid of the document after it):
+    {"op": "append_query", "buid": "5", "query": "...", "last": "9", "ts": 1700000000.0}
+    {"op": "new_block", "buid": "a", "label": "...", "source": "...", "last": "a", "ts": ...}
+    {"op": "new_link", "buid": "5", "label": "...", "last": "a", "ts": ...}
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import functools
+from contextlib import contextmanager
+import danotes.model
+
+try:
+    import fcntl
+except ImportError:     ## Not available on Windows, journal writers are not serialized there
+    fcntl = None
+
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_OPS = ('append_query', 'new_block', 'new_link')
+## Bytes read per step when scanning a file backwards
+TAIL_CHUNK_SIZE = 8192
+
+BLOCK_OTAG_PATTERN = re.compile(rb'(?m)^<B=([0-9a-zA-Z]+)>')
+
+## Journal locks held by this process {journal path: [file, depth]} (flock is per open file, not per process)
+HELD_LOCKS = {}
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def journal_path(path) -> str:
+    """Path of the journal of a document"""
+    return os.path.realpath(path) + JOURNAL_SUFFIX
+
+
+def has_journal(path) -> bool:
+    return os.path.exists(journal_path(path))
+
+
+@contextmanager
+def journal_lock(path):
+    """
+    Exclusive lock of the journal of the document (created if needed). Yields the journal opened in 'a+b' mode
+    Reentrant within the process, so a locked handler can append to its own journal
+    """
+    jpath = journal_path(path)
+    if jpath in HELD_LOCKS:
+        HELD_LOCKS[jpath][1] += 1
+        try:
+            yield HELD_LOCKS[jpath][0]
+        finally:
+            HELD_LOCKS[jpath][1] -= 1
+        return
+
+    file = open(jpath, 'a+b')
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        HELD_LOCKS[jpath] = [file, 1]
+        try:
+            yield file
+        finally:
+            del HELD_LOCKS[jpath]
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    finally:
+        file.close()
+
+
+def locked_document(func):
+    """
+    Decorator for handlers that load, modify and save the document `path` (first argument)
+    If the document has a journal, its lock is held for the whole call: full writers are serialized
+    with each other and with journal writers, so no update is lost
+    """
+    @functools.wraps(func)
+    def wrapper(path, *args, **kwargs):
+        if not has_journal(path):
+            return func(path, *args, **kwargs)
+        with journal_lock(path):
+            return func(path, *args, **kwargs)
+    return wrapper
+
+
+def read_tail_line(file) -> bytes:
+    """Last complete line (ending in \\n) of an open binary file, b'' if none"""
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    tail = b''
+    while True:
+        ## A partial line being written has no \n yet, it is skipped
+        last_newline = tail.rfind(b'\n')
+        if last_newline != -1:
+            previous = tail.rfind(b'\n', 0, last_newline)
+            if previous != -1 or position == 0:
+                return tail[previous + 1:last_newline]
+        if position == 0:
+            return b''
+        step = min(TAIL_CHUNK_SIZE, position)
+        position -= step
+        file.seek(position)
+        tail = file.read(step) + tail
+
+
+def read_last_buid(path) -> str:
+    """Last buid of a .dan document, found from the end of the file (O(1) on the document size)"""
+    if danotes.model.is_danb(path):
+        with open(path, 'rb') as file:
+            _, table = danotes.model.read_danb_table(file)
+        if not table:
+            raise ValueError(f"{path} has no Blocks")
+        return table[-1][0]
+    if danotes.model.compression_of(path):
+        last = danotes.model.read_compressed_last_buid(path)
+        if last is None:
+            raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. No Block Opening Tag found")
+        return last
+
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        tail = b''
+        while position > 0:
+            step = min(TAIL_CHUNK_SIZE, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            ## A match at the start of the chunk may be a cut line, unless it is the start of the file
+            matches = [match for match in BLOCK_OTAG_PATTERN.finditer(tail) if match.start() > 0 or position == 0]
+            if matches:
+                return matches[-1].group(1).decode('utf-8')
+    raise ValueError(f"{path} Invalid file type. Expected .dan syntax within. No Block Opening Tag found")
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def journal_append(path, op: str, buid: str = None, **fields) -> dict:
+    """
+    Append an operation to the journal of the document, without loading it. Returns the entry written
+    buid=None targets the last Block (or the next available buid for new_block)
+    """
+    if op not in JOURNAL_OPS:
+        raise ValueError(f"{op=} is not a journal operation. Expected any of {JOURNAL_OPS}")
+    if buid in ('0', '1'):
+        raise ValueError(f"{buid=} 0 or 1 cannot be modified through the journal")
+    if danotes.model.is_manifest(path):
+        raise ValueError(f"{path} is a shard manifest, sharded documents have no journal (only the modified shards are saved)")
+
+    with journal_lock(path) as file:
+        ## The last buid is recorded on each entry, so only the last line is read
+        last_line = read_tail_line(file)
+        if last_line:
+            last = json.loads(last_line)['last']
+        else:
+            last = read_last_buid(path)
+
+        if op == 'new_block':
+            if buid is None:
+                buid = danotes.model.get_next_uid(last)
+            last = buid
+        elif buid is None:
+            buid = last
+        elif danotes.model.uid_to_int(buid) > danotes.model.uid_to_int(last):
+            ## buids only grow, a buid past the last one cannot exist (and its entry would never be applied)
+            raise ValueError(f"{buid=} does not exist on {path}, the last buid is {last}")
+
+        entry = {'op': op, 'buid': buid, **fields, 'last': last, 'ts': time.time()}
+        ## A single write of a whole line on an O_APPEND file, readers never see it half written
+        file.write((json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+        file.flush()
+    return entry
+
+
+def read_journal(path) -> tuple[list, int]:
+    """Pending entries of the journal of the document. Returns (entries, bytes consumed by them)"""
+    jpath = journal_path(path)
+    if not os.path.exists(jpath):
+        return ([], 0)
+
+    with open(jpath, 'rb') as file:
+        data = file.read()
+    ## Only complete lines, one being appended right now is left for the next reader
+    consumed = data.rfind(b'\n') + 1
+    entries = [json.loads(line) for line in data[:consumed].splitlines() if line.strip()]
+    return (entries, consumed)
+
+
+def journal_consume(path, consumed: int):
+    """Drop the first `consumed` bytes of the journal in place (the file is kept, waiting writers hold it open)"""
+    if consumed <= 0:
+        return
+    with journal_lock(path) as file:
+        file.seek(consumed)
+        rest = file.read()
+        file.seek(0)
+        file.truncate()
+        file.write(rest)
+        file.flush()
+
+
+def iter_fold_journal(blocks, entries: list):
+    """
+    Generator applying journal entries on a stream of Blocks (e.g. Danom.iter_load) as they pass,
+    the Blocks created by the journal are yielded at the end
+    """
+    pending = {}
+    for entry in entries:
+        if entry['op'] != 'new_block':
+            pending.setdefault(entry['buid'], []).append(entry)
+
+    for block in blocks:
+        for entry in pending.pop(block.buid, ()):
+            apply_journal_entry(block, entry)
+        yield block
+
+    for entry in entries:
+        if entry['op'] == 'new_block':
+            content = danotes.model.Content()
+            if entry.get('source'):
+                content.append(f'source: "{entry["source"]}"')
+            block = danotes.model.Block(entry.get('label') or "Unnamed Article", entry['buid'], content, source=entry.get('source') or '')
+            for pending_entry in pending.pop(block.buid, ()):
+                apply_journal_entry(block, pending_entry)
+            yield block
+
+    for buid in pending:
+        print(f"[Warning]: Journal entries for {buid=} skipped, the Block does not exist", file=sys.stderr)
+
+
+def apply_journal_entry(block, entry: dict):
+    """Apply an append_query/new_link entry to its Block"""
+    if entry['op'] == 'append_query':
+        block.append_query(entry['query'])
+    elif entry['op'] == 'new_link':
+        ## The next iid follows the links already on the Content
+        block.append_link(entry['label'])
+    return block
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['journal_path', 'has_journal', 'journal_lock', 'locked_document', 'read_last_buid', 'journal_append', 'read_journal', 'journal_consume', 'iter_fold_journal']
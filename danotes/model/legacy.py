@@ -0,0 +1,182 @@
+"""
+Migration of vim-dan-generator legacy documents to the danotes syntax
+
+The legacy syntax has no Header Block nor <T> tags, and its buids start on the Toc Block. Migrating
+a document means adding the tags (see transform_legacy_title), shifting every buid and Link buid
+one up, dropping the old figlet art of each Block and rebuilding the Header from the vim modelines.
+
+Each Block only depends on its own lines, so migrate_legacy() streams the legacy file: it is read
+once, tagged on the fly, parsed by Danom.iter_parse and every migrated Block is written as soon as
+it is closed. Memory is bounded by the largest Block instead of the whole document.
+"""
+
+import re
+from pathlib import Path
+import pyfiglet
+import danotes.model
+
+
+## Modeline variables of the legacy header, and the line of its content where each one is found
+LEGACY_MODELINE_VARS = {
+    'dan_ext_list':       11,
+    'dan_kw_question_list':  12,
+    'dan_kw_nontext_list':   13,
+    'dan_kw_linenr_list':    14,
+    'dan_kw_warningmsg_list':15,
+    'dan_kw_colorcolumn_list':16,
+    'dan_kw_underlined_list':17,
+    'dan_kw_preproc_list':    18,
+    'dan_kw_comment_list':   19,
+    'dan_kw_identifier_list':20,
+    'dan_kw_ignore_list':    21,
+    'dan_kw_statement_list': 22,
+    'dan_kw_cursorline_list':23,
+    'dan_kw_tabline_list':   24,
+}
+## Lines of figlet art on top of the legacy Toc Block
+LEGACY_TOC_ART_LINES = 6
+B_TAG_PATTERN = re.compile(r'^<B=[0-9a-zA-Z]+>.+')
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def is_legacy_separator(line: str) -> bool:
+    """Full-width '=' line, the first one closes the legacy header"""
+    return line.strip('=\n') == '' and len(line.strip()) >= 50
+
+
+def iter_legacy_lines(path):
+    """Lines of the legacy file with the danotes tags added, the same ones transform_legacy_title(path) writes
+    (utf-8 bytes, as read from a binary file, see Danom.iter_parse)
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        yield f"<B=0>{Path(path).stem}\n".encode('utf-8')
+        yield b'\n'
+        yield b'<T>\n'
+
+        header_closed = False
+        after_tag = False
+        for line in file:
+            ## <T> after each Block Opening Tag, unless the next line already is one
+            if after_tag and line.strip() != '<T>':
+                yield b'\n'
+                yield b'<T>\n'
+            ## Closing the header Block before the first separator
+            if not header_closed and is_legacy_separator(line):
+                yield b'</B>Something\n'
+                header_closed = True
+            after_tag = B_TAG_PATTERN.match(line) is not None
+            if after_tag and not line.endswith('\n'):
+                ## Last line of the file, the newline of the added <T> ends it
+                yield (line + '\n').encode('utf-8')
+                yield b'<T>\n'
+                after_tag = False
+                continue
+            yield line.encode('utf-8')
+        if after_tag:
+            yield b'\n'
+            yield b'<T>\n'
+
+
+def legacy_header(content, basename_no_ext: str) -> 'danotes.model.Content':
+    """Content of the danotes Header Block, from the content of the legacy header (its vim modelines)"""
+    # Step 1) Parse modeline variables dynamically
+    parsed_lists = {}
+
+    for varname, index in LEGACY_MODELINE_VARS.items():
+        line = content[index]
+        match = re.search(rf'g:{varname}\s*=\s*"([^"]*)"', line)
+        if match:
+            items = [item.strip() for item in match.group(1).split(',') if item.strip()]
+            parsed_lists[varname] = items
+        else:
+            print(f"Warning: Could not parse line for {varname}:")
+
+    # Step 2) Create the Header content
+    new_content = danotes.model.Content()
+    new_content.append("")
+
+    pyfiglet_string = pyfiglet.figlet_format("danotes", font="univers")
+    lines = [line.rstrip() for line in pyfiglet_string.split('\n') if line.strip()]
+    new_content.extend(lines)
+    new_content.append("")
+
+    new_content.append("")
+    new_content.append("The following lines are used by danotes, modify them only if you know !")
+    new_content.append("")
+
+    for key in LEGACY_MODELINE_VARS:
+        if key in parsed_lists:
+            items = parsed_lists[key]
+            value_str = ', '.join(f'"{item}"' for item in items)
+            new_content.append(f'{key}: [{value_str}]')
+        else:
+            new_content.append(f'{key}: []')
+
+    # Other metadata
+    new_content.append('dan_wrap_lines: 105')
+    new_content.append('dan_indexed_from:')
+    new_content.append('dan_parsed_on:')
+    new_content.append(f'dan_title: "{basename_no_ext}"')
+    new_content.append('dan_description:')
+    new_content.append('dan_tags: []')
+    return new_content
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def update_legacy_block(block, index: int):
+    """Migrate the Block at position `index` of a tagged legacy document (see transform_legacy_title)
+    0: Header Block, rebuilt from the modelines. 1: Toc Block. 2 onwards: articles, buid shifted one up
+    """
+    # Shift the blocks buid + 1 starting from the articles, and the Link Sources/Link Targets buids on Content
+    if index == 1:
+        block.buid = '1'
+    elif index >= 2:
+        block.buid = danotes.model.get_next_uid(block.buid)
+    block.content.shift_links_one_buid()
+
+    # Transform Header
+    if index == 0:
+        block.content = legacy_header(block.content, block.label)
+        return block
+
+    # Delete old figlet from content
+    if index == 1:
+        block.label = 'Document TOC'
+        no_lines = LEGACY_TOC_ART_LINES
+    else:
+        # Calculate the length of the figlet string
+        no_lines = len(danotes.model.render_figlet(block.label).split('\n'))
+    del block.content[:no_lines]
+    return block
+
+
+def iter_legacy_blocks(path):
+    """Generator of the migrated Blocks of a legacy document, read once and without modifying it"""
+    for index, block in enumerate(danotes.model.Danom.iter_parse(iter_legacy_lines(path))):
+        yield update_legacy_block(block, index)
+
+
+def migrate_legacy(path, output=None) -> int:
+    """Migrate a legacy vim-dan document to the danotes syntax, streaming it Block by Block
+    The result replaces `path` atomically (or is written to `output`). Returns the number of Blocks written
+    """
+    count = 0
+    with danotes.model.atomic_writer(output or path) as file:
+        for block in iter_legacy_blocks(path):
+            file.write(block.to_text(article_toc=False).encode('utf-8'))
+            count += 1
+    return count
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['LEGACY_MODELINE_VARS', 'iter_legacy_lines', 'legacy_header', 'update_legacy_block', 'iter_legacy_blocks', 'migrate_legacy']
@@ -7,35 +7,70 @@ import json
 import pyfiglet
 from pathlib import Path
 import os
-from typing import Self
+from typing import Self, NamedTuple
 import yaml
 import danotes.model
 
 
-class LinkTarget():
-    """Each Individual Link Target in the for of <I={buid}#{iid}>{label}</I>"""
-    ## Core methods -------------------
-    def __init__(self, label: str, iid: str):
-        self.label = label
-        self.iid = iid
+class LinkTarget(NamedTuple):
+    """Each Individual Link Target in the for of <I={buid}#{iid}>{label}</I>
+    A tuple row (no per-instance __dict__)
+    """
+    label: str
+    iid: str
 
     def __repr__(self):
         return f"LinkTarget(label={repr(self.label)}, iid={repr(self.iid)})"
 
+## Link Target <I={buid}#{iid}>{label}</I> within a line of content
+LINK_TARGET_PATTERN = re.compile(r'<I=([0-9a-zA-Z]+)#([0-9a-zA-Z]+)>(.*?)</I>')
+
 class LinksTarget(list):
-    """The Container of Link Target Objects within a Block"""
+    """The Container of Link Target Objects within a Block
+    Derived from the Content of the Block, it records the Content (and its version) it was extracted from,
+    so the Block extracts it again only once its Content changes (see Block.links_target)
+    """
+    __slots__ = ('block', 'content', 'version')
+
     ## Core methods -------------------
     def __init__(self, block: 'Block'):
         super().__init__()  # Initialize the list properly
         self.block = block
+        self.sync()
         
     def __repr__(self):
         items = ', '.join(repr(item) for item in self)
         return f"LinksTarget(block={self.block.buid}, items=[{items}])"
 
+    ## Test Methods -------------------
+    def is_stale(self) -> bool:
+        """Return True if the Content of the Block changed since the Link Targets were extracted"""
+        content = self.block.content
+        return content is not self.content or getattr(content, 'version', None) != self.version
+
     ## Modification methods -----------
+    def sync(self):
+        """Record the current Content of the Block as the one the Link Targets describe"""
+        self.content = self.block.content
+        self.version = getattr(self.content, 'version', None)
+        return self
+
+    def extract(self):
+        """Extract the Link Targets from the Content of the Block (replacing the current ones)"""
+        self.clear()
+        for line in self.block.content:
+            if '<I=' not in line:
+                continue
+            for match in LINK_TARGET_PATTERN.finditer(line):
+                self.append(LinkTarget(match.group(3), match.group(2)))
+        return self.sync()
+
     def new_link(self, new_label: str, iid: str):
+        """Add a Link Target already written on the Content (no need to extract them again)"""
         self.append(LinkTarget(new_label, iid))
+        self.sync()
+        ## The Article TOC of the Block changes
+        self.block.mark_dirty()
         return self
 
     ## Output methods -----------------
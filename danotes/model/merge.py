@@ -0,0 +1,81 @@
+"""
+Merge of two documents: the articles of an incoming document are appended to a base one
+
+The incoming articles get the buids following the highest buid of the base document, allocated in a
+single pass, and every Link Source/Link Target of their content is rewritten through the resulting
+{old buid: new buid} mapping (Content.remap_links, a single regex pass per line). Links to the Header
+and Toc Blocks keep pointing to the ones of the merged document. The Toc Block tree is built again
+from the sources of both documents when the merged Danom is saved (see Danom.update_toc_block).
+"""
+
+import os
+from pathlib import Path
+import danotes.model
+
+
+## Blocks of the incoming document that are not merged (the base document keeps its own)
+MERGE_SKIPPED_BUIDS = ('0', '1')
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def allocate_buids(danom, count: int) -> list:
+    """The `count` buids following the highest buid of the danom (never the Header/Toc Block buids)"""
+    last = max((block.buid for block in danom), key=danotes.model.uid_to_int, default='1')
+    if danotes.model.uid_to_int(last) < 1:
+        last = '1'
+    buids = []
+    for _ in range(count):
+        last = danotes.model.get_next_uid(last)
+        buids.append(last)
+    return buids
+
+
+def rebase_source(block, from_path, to_path):
+    """Relative local sources are relative to the document, rewrite them for a document saved elsewhere"""
+    if not block.source or Path(block.source).is_absolute() or block.local_source(from_path) is None:
+        return
+    local = os.path.join(os.path.dirname(os.path.abspath(from_path)), block.source)
+    block.source = os.path.relpath(local, os.path.dirname(os.path.abspath(to_path)))
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def merge_danoms(base, incoming, incoming_path=None, output_path=None) -> tuple:
+    """Danom with the Blocks of base followed by the articles of incoming, renumbered after the base buids
+    incoming_path/output_path: rebase the relative local sources of the incoming Blocks to the output document
+    Returns (merged Danom, {old buid: new buid} of the incoming Blocks)
+    The clean Blocks of base are still copied verbatim from its file when the merged Danom is saved
+    """
+    articles = [block for block in incoming if block.buid not in MERGE_SKIPPED_BUIDS]
+    new_buids = allocate_buids(base, len(articles))
+    mapping = {}
+    for block, new_buid in zip(articles, new_buids):
+        if block.buid in mapping:
+            print(f"[Warning]: Repeated buid={block.buid} on the incoming document, its links point to the first Block")
+            continue
+        mapping[block.buid] = new_buid
+
+    merged = danotes.model.Danom(base)
+    merged.origin = base.origin
+    merged.journal = base.journal
+
+    for block, new_buid in zip(articles, new_buids):
+        block.buid = new_buid
+        block.content.remap_links(mapping)
+        if incoming_path is not None and output_path is not None:
+            rebase_source(block, incoming_path, output_path)
+        merged.append(block)
+    return merged, mapping
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['allocate_buids', 'merge_danoms']
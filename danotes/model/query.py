@@ -0,0 +1,329 @@
+"""
+Block selection queries, evaluated on a per-Block attribute index of the document (<path>.index)
+
+The index keeps a row of attributes per Block (INDEX_FIELDS: label, header fields, number of Content lines
+and of Link Targets, position and the byte span of the Block on a .dan text file). It is built by parsing
+the document once, and reused while the size and mtime of the document do not change, so a query over a
+large document reads a small JSON file instead of parsing (or rendering) the Blocks. Only the Blocks
+selected are read afterwards (from their byte spans on .dan text documents), and only if their Content is
+needed by the output. Documents with pending journal edits are indexed on each query (no cache).
+
+Query syntax (keywords are case insensitive, values may be "quoted" or 'quoted'):
+    field:glob       fnmatch pattern, case sensitive            source:*.html
+    field~regex      regular expression search, case insensitive label~"Request"
+    field=value      equal (field!=value not equal)              buid=2a   source=""
+    field>number     >, >=, <, <= on lines, links, position and buid (compared as uid values)
+    field            true if the field is set/non-zero           title_marked
+    and, or, not, ( )   and binds tighter than or
+"""
+
+import os
+import re
+import json
+import fnmatch
+from typing import NamedTuple
+import danotes.model
+
+
+INDEX_SUFFIX = '.index'
+INDEX_VERSION = 1
+INDEX_FIELDS = ('buid', 'label', 'title_marked', 'source', 'title_cmd', 'content_cmd', 'filters', 'lines', 'links', 'position', 'start', 'end')
+## Fields a query can filter by (the byte span is not an attribute of the Block)
+QUERY_FIELDS = INDEX_FIELDS[:-2]
+NUMERIC_FIELDS = ('lines', 'links', 'position')
+## Longest first, so '>=' is not read as '>'
+QUERY_OPERATORS = ('!=', '>=', '<=', ':', '~', '=', '>', '<')
+QUERY_KEYWORDS = ('and', 'or', 'not')
+TRUE_VALUES = ('true', 'yes', '1')
+FALSE_VALUES = ('false', 'no', '0')
+
+FIELD_PATTERN = re.compile(r'[A-Za-z_]+')
+BARE_VALUE_PATTERN = re.compile(r'[^\s()]+')
+
+
+class BlockRow(NamedTuple):
+    buid: str
+    label: str
+    title_marked: bool
+    source: str
+    title_cmd: str
+    content_cmd: str
+    filters: str
+    lines: int
+    links: int
+    position: int
+    start: int | None       ## byte span of the Block on a .dan text document, None on other formats
+    end: int | None
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def index_path(path) -> str:
+    """Path of the attribute index of a document"""
+    return os.path.realpath(path) + INDEX_SUFFIX
+
+
+def document_key(path) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def index_row(block, position: int, span: bool = True) -> BlockRow:
+    start = end = None
+    if span and block._span is not None:
+        _, start, end, _ = block._span
+    return BlockRow(block.buid, block.label, bool(block.title_marked), block.source or '', block.title_cmd or '',
+                    block.content_cmd or '', block.filters or '', len(block.content), len(block.links_target), position, start, end)
+
+
+def read_index(path) -> list | None:
+    """Rows of the index of a document, None if there is no index or the document changed since it was built"""
+    try:
+        with open(index_path(path), 'r', encoding='utf-8') as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION or index.get('key') != document_key(path) or index.get('fields') != list(INDEX_FIELDS):
+        return None
+    return [BlockRow(*row) for row in index['rows']]
+
+
+def write_index(path, key: list, rows: list):
+    try:
+        with danotes.model.atomic_writer(index_path(path), 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'key': key, 'fields': INDEX_FIELDS, 'rows': rows}, file, ensure_ascii=False, separators=(',', ':'))
+    except OSError as e:
+        print(f"[Warning]: Could not write the index of {path}: {e}")
+
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValueError(f"{value=} Expected any of {TRUE_VALUES + FALSE_VALUES}")
+
+
+def compile_predicate(field: str, operator: str | None, value: str | None):
+    """Function of a BlockRow testing a single `field operator value` condition"""
+    if field not in QUERY_FIELDS:
+        raise ValueError(f"{field=} is not a Block attribute. Expected any of {QUERY_FIELDS}")
+    index = QUERY_FIELDS.index(field)
+
+    if operator is None:
+        return lambda row: bool(row[index])
+    if operator == ':':
+        return lambda row: row[index] not in ('', None) and fnmatch.fnmatchcase(str(row[index]), value)
+    if operator == '~':
+        try:
+            pattern = re.compile(value, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"{value=} is not a valid regular expression: {e}")
+        return lambda row: row[index] not in ('', None) and pattern.search(str(row[index])) is not None
+
+    if field in NUMERIC_FIELDS:
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"{field} {operator} {value!r} Expected an integer")
+        key = lambda row: row[index]
+    elif field == 'buid' and operator not in ('=', '!='):
+        ## uid_to_int raises a ValueError on characters that are not UID characters (e.g. buid>zz!)
+        value = danotes.model.uid_to_int(value)
+        key = lambda row: danotes.model.uid_to_int(row[index])
+    elif field == 'title_marked':
+        value = parse_bool(value)
+        key = lambda row: row[index]
+    elif operator in ('=', '!='):
+        key = lambda row: row[index]
+    else:
+        raise ValueError(f"{field} {operator} Only {NUMERIC_FIELDS} and buid can be compared with {operator}")
+
+    match operator:
+        case '=':
+            return lambda row: key(row) == value
+        case '!=':
+            return lambda row: key(row) != value
+        case '>':
+            return lambda row: key(row) > value
+        case '>=':
+            return lambda row: key(row) >= value
+        case '<':
+            return lambda row: key(row) < value
+        case '<=':
+            return lambda row: key(row) <= value
+
+
+class QueryParser:
+    """Recursive descent parser of the query syntax, compiling it into a function of a BlockRow"""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.position = 0
+
+    def error(self, reason: str):
+        raise ValueError(f"query={self.query!r} {reason} at position {self.position}")
+
+    def skip_spaces(self):
+        while self.position < len(self.query) and self.query[self.position].isspace():
+            self.position += 1
+
+    def keyword(self, word: str) -> bool:
+        """Consume a keyword (followed by a space, a parenthesis or the end)"""
+        self.skip_spaces()
+        end = self.position + len(word)
+        if self.query[self.position:end].lower() == word and (end == len(self.query) or self.query[end].isspace() or self.query[end] in '()'):
+            self.position = end
+            return True
+        return False
+
+    def parse(self):
+        predicate = self.parse_or()
+        self.skip_spaces()
+        if self.position < len(self.query):
+            self.error("Unexpected text")
+        return predicate
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.keyword('or'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else lambda row: any(term(row) for term in terms)
+
+    def parse_and(self):
+        factors = [self.parse_not()]
+        while self.keyword('and'):
+            factors.append(self.parse_not())
+        return factors[0] if len(factors) == 1 else lambda row: all(factor(row) for factor in factors)
+
+    def parse_not(self):
+        if self.keyword('not'):
+            operand = self.parse_not()
+            return lambda row: not operand(row)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        self.skip_spaces()
+        if self.query.startswith('(', self.position):
+            self.position += 1
+            predicate = self.parse_or()
+            self.skip_spaces()
+            if not self.query.startswith(')', self.position):
+                self.error("Expected ')'")
+            self.position += 1
+            return predicate
+
+        match = FIELD_PATTERN.match(self.query, self.position)
+        if not match or match.group(0).lower() in QUERY_KEYWORDS:
+            self.error("Expected a Block attribute")
+        field = match.group(0)
+        self.position = match.end()
+
+        operator = next((operator for operator in QUERY_OPERATORS if self.query.startswith(operator, self.position)), None)
+        if operator is None:
+            return compile_predicate(field, None, None)
+        self.position += len(operator)
+        return compile_predicate(field, operator, self.parse_value())
+
+    def parse_value(self) -> str:
+        if self.position < len(self.query) and self.query[self.position] in '"\'':
+            quote = self.query[self.position]
+            value = []
+            self.position += 1
+            while self.position < len(self.query):
+                char = self.query[self.position]
+                if char == '\\' and self.position + 1 < len(self.query):
+                    value.append(self.query[self.position + 1])
+                    self.position += 2
+                    continue
+                self.position += 1
+                if char == quote:
+                    return ''.join(value)
+                value.append(char)
+            self.error("Unterminated string")
+        match = BARE_VALUE_PATTERN.match(self.query, self.position)
+        if not match:
+            self.error("Expected a value")
+        self.position = match.end()
+        return match.group(0)
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def compile_query(query: str):
+    """Function of a BlockRow telling if the Block matches the query"""
+    return QueryParser(query).parse()
+
+
+def load_index(path) -> list:
+    """BlockRows of a document (with the pending edits of its journal), from its index when it is up to date"""
+    entries, _ = danotes.model.read_journal(path)
+    if not entries:
+        rows = read_index(path)
+        if rows is not None:
+            return rows
+
+    key = document_key(path)
+    blocks = danotes.model.Danom.iter_load(path, {})
+    if entries:
+        blocks = danotes.model.iter_fold_journal(blocks, entries)
+    ## Spans of folded Blocks do not describe their text anymore
+    rows = [index_row(block, position, span=not entries) for position, block in enumerate(blocks)]
+
+    if not entries and document_key(path) == key:
+        write_index(path, key, rows)
+    return rows
+
+
+def select_rows(path, query: str) -> tuple[list, int]:
+    """(BlockRows matching the query, Blocks of the document)"""
+    predicate = compile_query(query)
+    rows = load_index(path)
+    return [row for row in rows if predicate(row)], len(rows)
+
+
+def iter_selected_blocks(path, rows: list):
+    """Blocks of the selected rows, in document order. Read from their byte spans when the rows have them"""
+    if not rows:
+        return
+    entries, _ = danotes.model.read_journal(path)
+    if not entries and all(row.start is not None for row in rows):
+        with open(path, 'rb') as file:
+            for row in rows:
+                file.seek(row.start)
+                text = file.read(row.end - row.start)
+                for block in danotes.model.Danom.iter_parse(text.splitlines(keepends=True)):
+                    yield block
+                    break
+        return
+
+    positions = {row.position for row in rows}
+    last = max(positions)
+    blocks = danotes.model.Danom.iter_load(path)
+    if entries:
+        blocks = danotes.model.iter_fold_journal(blocks, entries)
+    for position, block in enumerate(blocks):
+        if position in positions:
+            yield block
+        if position == last:
+            return
+
+
+def format_row(row: BlockRow) -> str:
+    output = f"{row.buid:<6} {row.lines:>6} {row.links:>4}  {row.label}"
+    if row.source:
+        output += f"  [{row.source}]"
+    return output
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['INDEX_FIELDS', 'QUERY_FIELDS', 'BlockRow', 'index_path', 'compile_query', 'load_index',
+           'select_rows', 'iter_selected_blocks', 'format_row']
@@ -0,0 +1,366 @@
+"""
+Sharded documents: a manifest (.danm) over N shard files (.dan)
+
+Large documents are split into shards of Blocks grouped by buid range or by source directory.
+Each shard is a regular stream of .dan Blocks (the head shard holds the Header Block 0 and the Toc Block 1),
+and the manifest keeps a summary row per Block, so a ShardedDanom loads only the shards it needs
+and assembles the Toc Block without reading the others.
+
+Manifest (single line JSON, written atomically after the shards):
+    {"format": "danotes-manifest", "version": 1, "by": "range", "size": 1000, "depth": 1,
+     "shards": [{"file": "doc.shards/0000.dan", "key": null,
+                 "blocks": [[buid, label, source, title_marked, position], ...]}, ...]}
+
+`position` is the document order of the Block, shards sharded by source are not contiguous.
+"""
+
+import os
+import sys
+import math
+import json
+import heapq
+import itertools
+import urllib.parse
+from pathlib import Path, PurePath
+from typing import Self, NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+import danotes.model
+from danotes.profiling import trace, PROFILER
+from .danom import Danom
+
+
+MANIFEST_FORMAT = 'danotes-manifest'
+MANIFEST_VERSION = 1
+## Manifests are told apart from .dan/.danb files by their first bytes
+MANIFEST_MAGIC = b'{"format":"danotes-manifest"'
+SHARD_BY = ('range', 'source')
+DEFAULT_SHARD_SIZE = 1000
+
+
+class TocEntry(NamedTuple):
+    """Summary of a Block of a shard that is not loaded, enough to list it on the Toc Block"""
+    buid: str
+    label: str
+    source: str
+    title_marked: bool
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def is_manifest(path) -> bool:
+    """Return if the file is a shard manifest"""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(MANIFEST_MAGIC)) == MANIFEST_MAGIC
+    except OSError:
+        return False
+
+
+def read_manifest(path) -> dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"{path} is not a shard manifest")
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{path} unsupported manifest version={manifest.get('version')}. Expected {MANIFEST_VERSION}")
+    return manifest
+
+
+def write_manifest(path, manifest: dict):
+    ## 'format' first, so is_manifest() only needs the first bytes
+    manifest = {'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION, **manifest}
+    with danotes.model.atomic_writer(path, 'w') as file:
+        file.write(json.dumps(manifest, ensure_ascii=False, separators=(',', ':')))
+        file.write('\n')
+
+
+def shard_file(path, index: int) -> str:
+    """Path of the shard `index` of a manifest, relative to the manifest directory"""
+    return f"{Path(path).stem}.shards/{index:04d}.dan"
+
+
+def shard_key(source: str, depth: int = 1) -> str:
+    """Group of a Block when sharding by source: the first `depth` components of its source directory ('' if none)"""
+    if not source:
+        return ''
+    if danotes.model.is_url(source):
+        parsed = urllib.parse.urlparse(source)
+        parts = [parsed.netloc] + parsed.path.split('/')[:-1]
+    elif danotes.model.is_a_dir_path(source):
+        parts = os.path.normpath(source).split('/')
+    else:
+        parts = PurePath(os.path.normpath(source)).parent.as_posix().split('/')
+    return '/'.join([part for part in parts if part and part != '.'][:depth])
+
+
+def block_row(block, position: int) -> list:
+    """Manifest summary row of a Block"""
+    return [block.buid, block.label, block.source, block.title_marked, position]
+
+
+def group_blocks(blocks: list, by: str = 'range', size: int = DEFAULT_SHARD_SIZE, depth: int = 1) -> list:
+    """Split the Blocks (in document order) into shards. Returns [(key, blocks)]"""
+    if by == 'range':
+        return [(None, blocks[start:start + size]) for start in range(0, len(blocks), size)]
+
+    ## The Header and Toc Blocks go on the head shard, with the Blocks without a source directory
+    groups = {'': []}
+    for block in blocks:
+        key = '' if block.buid in ('0', '1') else shard_key(block.source, depth)
+        groups.setdefault(key, []).append(block)
+    return [(key, group[start:start + size]) for key, group in groups.items() for start in range(0, len(group), size)]
+
+
+def write_shards(jobs: list, workers: int = None):
+    """
+    Save the (path, Danom) shards concurrently
+    Clean Blocks are copied from the file they were loaded from, which is I/O bound, so threads are enough
+    """
+    ## The profiler keeps a single stack of open phases
+    if PROFILER.enabled:
+        workers = 1
+    for path, _ in jobs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(danom.to_file, path, update_toc=False, tail=False) for path, danom in jobs]
+        for future in futures:
+            future.result()
+
+
+def iter_manifest(path):
+    """Generator of the Blocks of a sharded document in document order, reading one shard at a time where possible"""
+    manifest = read_manifest(path)
+    directory = os.path.dirname(os.path.realpath(path))
+    streams = [Danom.iter_load(os.path.join(directory, shard['file'])) for shard in manifest['shards']]
+    if manifest['by'] == 'range':
+        yield from itertools.chain(*streams)
+        return
+    positions = {row[0]: row[4] for shard in manifest['shards'] for row in shard['blocks']}
+    yield from heapq.merge(*streams, key=lambda block: positions.get(block.buid, math.inf))
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section SHARDED_DANOM
+
+class ShardedDanom(Danom):
+    """
+    Danom of a sharded document. Only the Blocks of the loaded shards are on the list (in document order),
+    get_block_by_buid()/get_block_by_label() load the shard of the Block requested, and the Toc Block is
+    assembled from the manifest rows of the shards that are not loaded
+    Saving to the manifest path only writes the shards with modified Blocks, and the manifest
+    """
+
+    ## Core methods -------------------
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.path = None            ## realpath of the manifest
+        self.manifest = None
+        self.shards = {}            ## index -> Danom of the loaded shards
+        self.buid_shards = {}       ## buid -> shard index
+        self.positions = {}         ## buid -> position in the document
+        self.last_position = -1
+        self.changed = set()        ## shards with new Blocks
+        self.links_computed = False
+
+    ## Getter Methods -----------------
+    @trace('ShardedDanom.load')
+    def load(self, path, lazy: bool = False) -> Self:
+        """Load the manifest, and every shard (lazy=False) or only the head and last shards (lazy=True)"""
+        self.path = os.path.realpath(path)
+        self.manifest = read_manifest(path)
+
+        for index, shard in enumerate(self.manifest['shards']):
+            for row in shard['blocks']:
+                self.buid_shards[row[0]] = index
+                self.positions[row[0]] = row[4]
+                self.last_position = max(self.last_position, row[4])
+
+        if lazy:
+            ## The Header/Toc Blocks, and the last Block (next available buid, default target of writes)
+            indexes = [index for index, shard in enumerate(self.manifest['shards']) if any(row[4] in (0, 1, self.last_position) for row in shard['blocks'])]
+        else:
+            indexes = range(len(self.manifest['shards']))
+        self.load_shards(indexes)
+        return self
+
+    def load_shards(self, indexes) -> Self:
+        indexes = [index for index in indexes if index not in self.shards]
+        if not indexes:
+            return self
+
+        for index in indexes:
+            shard = Danom()
+            shard.load(self.shard_path(index))
+            for block in shard:
+                ## Blocks missing on the manifest (e.g. a shard edited by hand) go after the rest
+                if block.buid not in self.positions:
+                    self.last_position += 1
+                    self.positions[block.buid] = self.last_position
+                    self.buid_shards[block.buid] = index
+            if self.links_computed:
+                shard.get_links_target()
+            self.shards[index] = shard
+
+        self[:] = sorted((block for shard in self.shards.values() for block in shard), key=lambda block: self.positions[block.buid])
+        return self
+
+    def shard_path(self, index: int) -> str:
+        return os.path.join(os.path.dirname(self.path), self.manifest['shards'][index]['file'])
+
+    def shard_size(self, index: int) -> int:
+        if index in self.shards:
+            return len(self.shards[index])
+        return len(self.manifest['shards'][index]['blocks'])
+
+    def get_block_by_buid(self, buid: str) -> 'Block | None':
+        if buid in self.buid_shards:
+            self.load_shards([self.buid_shards[buid]])
+        return super().get_block_by_buid(buid)
+
+    def get_block_by_label(self, label) -> 'Block | None':
+        block = super().get_block_by_label(label)
+        if block is not None:
+            return block
+        for index, shard in enumerate(self.manifest['shards']):
+            if index not in self.shards and any(row[1] == label for row in shard['blocks']):
+                self.load_shards([index])
+                return super().get_block_by_label(label)
+        return None
+
+    def get_links_target(self):
+        ## Shards loaded afterwards get their Links Target on load
+        self.links_computed = True
+        return super().get_links_target()
+
+    def toc_entries(self):
+        entries = list(self)
+        for index, shard in enumerate(self.manifest['shards']):
+            if index not in self.shards:
+                entries.extend(TocEntry(*row[:4]) for row in shard['blocks'])
+        return sorted(entries, key=lambda entry: self.positions[entry.buid])
+
+    ## Modification methods -----------
+    def create_new_block(self, buid: str=None, new_label: str="Unnamed Article", source: str=None):
+        """Create a new Block at the end of the document, on the shard its group goes to"""
+        if buid is None:
+            buid = self.get_next_available_buid()
+
+        index = self.shard_for(source)
+        new_block = super().create_new_block(buid, new_label, source)
+        self.last_position += 1
+        self.positions[buid] = self.last_position
+        self.buid_shards[buid] = index
+        self.shards[index].append(new_block)
+        self.changed.add(index)
+        return new_block
+
+    def shard_for(self, source: str = None) -> int:
+        """Index of the (loaded) shard a new Block goes to, a new shard if the group is full"""
+        shards = self.manifest['shards']
+        size = self.manifest['size']
+        if self.manifest['by'] == 'source':
+            key = shard_key(source, self.manifest['depth'])
+            candidates = [index for index, shard in enumerate(shards) if shard['key'] == key]
+        else:
+            key = None
+            candidates = [self.buid_shards[self[-1].buid]] if self else []
+
+        for index in reversed(candidates):
+            if self.shard_size(index) < size:
+                self.load_shards([index])
+                return index
+
+        index = len(shards)
+        shards.append({'file': shard_file(self.path, index), 'key': key, 'blocks': []})
+        self.shards[index] = Danom()
+        return index
+
+    ## Output methods -----------------
+    @trace('ShardedDanom.to_file')
+    def to_file(self, path, update_toc: bool = True, tail: bool = True):
+        """Save the shards with modified Blocks and the manifest (any other path gets the loaded Blocks as a single document)"""
+        if os.path.realpath(path) != self.path:
+            return super().to_file(path, update_toc=update_toc, tail=tail)
+
+        if update_toc and self.get_block_by_buid('1') is not None:
+            self.update_toc_block()
+        self.save_shards()
+
+    def to_file_notoc(self, path, article_toc: bool = False):
+        if os.path.realpath(path) != self.path:
+            return super().to_file_notoc(path, article_toc=article_toc)
+
+        ## Same as the single file version, every loaded Block is rendered again
+        self.mark_dirty()
+        self.save_shards()
+
+    def save_shards(self, workers: int = None):
+        jobs = []
+        for index, shard in sorted(self.shards.items()):
+            if index in self.changed or not all(block.is_clean(shard.origin) for block in shard):
+                jobs.append((self.shard_path(index), shard))
+                self.manifest['shards'][index]['blocks'] = [block_row(block, self.positions[block.buid]) for block in shard]
+
+        write_shards(jobs, workers)
+        write_manifest(self.path, self.manifest)
+        self.changed.clear()
+        print(f"Saved {len(jobs)} of {len(self.manifest['shards'])} shards of {self.path}", file=sys.stderr)
+
+## EOF EOF EOF SHARDED_DANOM
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def load_document(path, lazy: bool = False) -> Danom:
+    """Danom of a .dan/.danb document, or ShardedDanom of a shard manifest (lazy: only the shards needed are loaded)"""
+    if is_manifest(path):
+        return ShardedDanom().load(path, lazy=lazy)
+    return Danom().load(path)
+
+
+@trace('shard_danom')
+def shard_danom(danom: Danom, path, by: str = 'range', size: int = DEFAULT_SHARD_SIZE, depth: int = 1, workers: int = None) -> dict:
+    """
+    Write the Danom as a manifest on `path` plus its shard files. Returns the manifest
+    by='range' : consecutive runs of `size` Blocks
+    by='source': Blocks grouped by the first `depth` components of their source directory (runs of up to `size`)
+    """
+    if by not in SHARD_BY:
+        raise ValueError(f"{by=} Expected any of {SHARD_BY}")
+    if size < 1:
+        raise ValueError(f"{size=} Shards need at least one Block")
+    if not danom:
+        raise ValueError(f"Cannot shard an empty document")
+
+    if danom.get_block_by_buid('1') is not None:
+        danom.update_toc_block()
+
+    positions = {block.buid: position for position, block in enumerate(danom)}
+    directory = os.path.dirname(os.path.realpath(path))
+    manifest = {'by': by, 'size': size, 'depth': depth, 'shards': []}
+    jobs = []
+    for index, (key, blocks) in enumerate(group_blocks(list(danom), by, size, depth)):
+        file = shard_file(path, index)
+        ## Sharing the origin, the clean Blocks are copied from the document instead of rendered
+        shard = Danom(blocks)
+        shard.origin = danom.origin
+        jobs.append((os.path.join(directory, file), shard))
+        manifest['shards'].append({'file': file, 'key': key, 'blocks': [block_row(block, positions[block.buid]) for block in blocks]})
+
+    write_shards(jobs, workers)
+    write_manifest(path, manifest)
+    return manifest
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['ShardedDanom', 'TocEntry', 'is_manifest', 'read_manifest', 'write_manifest', 'iter_manifest', 'shard_key', 'load_document', 'shard_danom']
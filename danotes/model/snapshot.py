@@ -0,0 +1,269 @@
+"""
+Content-addressed snapshots of a .dan document (<path>.snapshots/), for cheap history and undo
+
+A snapshot cuts the document file into the byte span of each Block (the same spans Danom.iter_load records:
+from the end of the previous one to the '=' separator after </B>) plus the bytes after the last one (tail),
+and stores each piece once, by hash, whatever the number of snapshots holding it:
+    <path>.snapshots/objects/<2 hex>/<38 hex>   zlib of the piece, named by the blake2b (160 bits) of its bytes
+    <path>.snapshots/snapshots.ndjson           one line per snapshot, recording only what changed since the previous one
+        {"id": 3, "ts": 1700000000.0, "message": "...", "blocks": 120, "size": 1048576, "stored": 2048,
+         "changed": {"5": "<hash>", "a": "<hash>"}, "removed": ["7"], "tail": "<hash>"}
+`changed` holds the new or modified Blocks (keyed by buid, a repeated buid is keyed <buid>:<n>) in document order.
+The Blocks are in the order of the previous snapshot with the new ones added at the end, unless the entry
+carries the whole "order" (list of keys). A document is rebuilt by folding the entries up to a snapshot,
+and restoring it writes the stored pieces back to back, so the restored file is the snapshotted one byte by byte.
+
+Only the pieces missing from the store are compressed and written, so snapshotting a document where a few
+Blocks changed costs a read and hash of the file plus those Blocks. Snapshots are taken from plain .dan
+text documents (the pending journal edits are compacted into the file first).
+"""
+
+import io
+import os
+import json
+import time
+import zlib
+import hashlib
+import re
+import danotes.model
+
+
+SNAPSHOTS_SUFFIX = '.snapshots'
+SNAPSHOTS_LOG = 'snapshots.ndjson'
+SNAPSHOT_DIGEST_SIZE = 20
+SNAPSHOT_ZLIB_LEVEL = 6
+
+## Same tags and span rules as Danom.iter_parse (on bytes)
+BLOCK_OTAG_PATTERN = re.compile(rb'(?<=<B=)([0-9a-zA-Z]+)>([^\n]+)')
+ARTICLE_TOC_TAG_PATTERN = re.compile(rb'^<T>\r?$')
+BLOCK_CTAG_PATTERN = re.compile(rb'^</B>')
+SEPARATOR_BYTES = b'=' * 105
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def snapshot_store(path) -> str:
+    """Directory of the snapshots of a document"""
+    return os.path.realpath(path) + SNAPSHOTS_SUFFIX
+
+
+def object_path(store: str, digest: str) -> str:
+    return os.path.join(store, 'objects', digest[:2], digest[2:])
+
+
+def write_object(store: str, data: bytes) -> tuple[str, int]:
+    """Store a piece by its hash if it is not stored yet. Returns (hash, bytes written)"""
+    digest = hashlib.blake2b(data, digest_size=SNAPSHOT_DIGEST_SIZE).hexdigest()
+    target = object_path(store, digest)
+    if os.path.exists(target):
+        return digest, 0
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    compressed = zlib.compress(data, SNAPSHOT_ZLIB_LEVEL)
+    with danotes.model.atomic_writer(target) as file:
+        file.write(compressed)
+    return digest, len(compressed)
+
+
+def read_object(store: str, digest: str) -> bytes:
+    try:
+        with open(object_path(store, digest), 'rb') as file:
+            data = zlib.decompress(file.read())
+    except (OSError, zlib.error) as e:
+        raise ValueError(f"{store} Snapshot object {digest} is missing or damaged: {e}")
+    if hashlib.blake2b(data, digest_size=SNAPSHOT_DIGEST_SIZE).hexdigest() != digest:
+        raise ValueError(f"{store} Snapshot object {digest} is damaged (its hash does not match)")
+    return data
+
+
+def iter_pieces(file):
+    """(buid, bytes) of the span of each Block of an open binary .dan file, and (None, bytes) of the tail after them"""
+    data = bytearray()      ## Bytes read since the start of the current span
+    inside_block = False
+    inside_header = False
+    pending = None          ## (buid, span length up to the end of the footer) waiting for the separator line
+    for raw in file:
+        line_start = len(data)
+        data += raw
+
+        if pending is not None:
+            buid, footer_end = pending
+            pending = None
+            end = line_start + len(SEPARATOR_BYTES) if raw.startswith(SEPARATOR_BYTES) else footer_end
+            yield buid, bytes(data[:end])
+            del data[:end]
+
+        if not inside_block:
+            match = BLOCK_OTAG_PATTERN.search(raw)
+            if match:
+                inside_block, inside_header = True, True
+                block_buid = match.group(1).decode('utf-8')
+        elif inside_header:
+            if ARTICLE_TOC_TAG_PATTERN.match(raw.rstrip(b'\n')):
+                inside_header = False
+        elif BLOCK_CTAG_PATTERN.match(raw):
+            inside_block = False
+            ## The span ends right before the newline of the footer if no separator follows
+            pending = (block_buid, len(data) - (1 if raw.endswith(b'\n') else 0))
+
+    if pending is not None:
+        buid, footer_end = pending
+        yield buid, bytes(data[:footer_end])
+        del data[:footer_end]
+    yield None, bytes(data)
+
+
+def piece_keys(buids: list) -> list:
+    """Keys of the pieces of a snapshot: the buid, <buid>:<n> for the n-th repetition of a buid"""
+    seen = {}
+    keys = []
+    for buid in buids:
+        count = seen[buid] = seen.get(buid, 0) + 1
+        keys.append(buid if count == 1 else f"{buid}:{count}")
+    return keys
+
+
+def read_snapshots(path) -> list:
+    """Entries of the snapshots of a document, oldest first"""
+    log = os.path.join(snapshot_store(path), SNAPSHOTS_LOG)
+    entries = []
+    try:
+        with open(log, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.endswith('\n'):
+                    ## An entry being written (or cut by a crash) is not a snapshot yet
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    print(f"[Warning]: {log}:{number} is not a valid snapshot entry, skipped")
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def fold_snapshots(entries: list, snapshot: int = None) -> tuple[list, dict, str | None]:
+    """(keys in order, {key: hash}, tail hash) of a snapshot (the last one if None) folding the entries up to it"""
+    order, hashes, tail = [], {}, None
+    for entry in entries:
+        for key in entry.get('removed', ()):
+            hashes.pop(key, None)
+        changed = entry.get('changed', {})
+        if 'order' in entry:
+            order = entry['order']
+        else:
+            order = [key for key in order if key in hashes] + [key for key in changed if key not in hashes]
+        hashes.update(changed)
+        tail = entry.get('tail')
+        if entry['id'] == snapshot:
+            return order, hashes, tail
+    if snapshot is not None:
+        raise ValueError(f"{snapshot=} does not exist. Expected any of {[entry['id'] for entry in entries]} (see danotes history)")
+    return order, hashes, tail
+
+
+def check_snapshot_document(path):
+    if danotes.model.is_danb(path) or danotes.model.is_manifest(path) or danotes.model.compression_of(path):
+        raise ValueError(f"{path} Snapshots are taken from .dan text documents, convert it first (see danotes file convert)")
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def take_snapshot(path, message: str = '') -> dict | None:
+    """Snapshot the document, storing only the Blocks not stored yet
+    Returns the new entry, or None if nothing changed since the last snapshot
+    """
+    check_snapshot_document(path)
+
+    ## Pending journal edits go first, the snapshot is the document a load would give
+    pending, _ = danotes.model.read_journal(path)
+    if pending:
+        danotes.model.Danom().load(path).to_file(path)
+
+    store = snapshot_store(path)
+    entries = read_snapshots(path)
+    previous_order, previous, previous_tail = fold_snapshots(entries)
+
+    buids = []
+    digests = []
+    size = 0
+    stored = 0
+    os.makedirs(store, exist_ok=True)
+    with open(path, 'rb') as file:
+        for buid, data in iter_pieces(file):
+            digest, written = write_object(store, data)
+            size += len(data)
+            stored += written
+            if buid is None:
+                tail = digest
+            else:
+                buids.append(buid)
+                digests.append(digest)
+
+    order = piece_keys(buids)
+    hashes = dict(zip(order, digests))
+    changed = {key: digest for key, digest in hashes.items() if previous.get(key) != digest}
+    removed = [key for key in previous_order if key not in hashes]
+    if entries and not changed and not removed and order == previous_order and tail == previous_tail:
+        return None
+
+    entry = {'id': entries[-1]['id'] + 1 if entries else 1, 'ts': time.time(), 'message': message or '',
+             'blocks': len(order), 'size': size, 'stored': stored, 'changed': changed, 'removed': removed, 'tail': tail}
+    ## The order is only written when it is not the previous one plus the new Blocks at the end
+    kept = [key for key in previous_order if key in hashes]
+    if kept + [key for key in order if key not in previous] != order:
+        entry['order'] = order
+
+    with open(os.path.join(store, SNAPSHOTS_LOG), 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+    return entry
+
+
+def restore_snapshot(path, snapshot: int, output=None) -> int:
+    """Write the document as it was on a snapshot to output (path itself if None). Returns the bytes written"""
+    store = snapshot_store(path)
+    order, hashes, tail = fold_snapshots(read_snapshots(path), snapshot)
+    written = 0
+    with danotes.model.atomic_writer(output or path) as file:
+        for digest in [hashes[key] for key in order] + [tail]:
+            data = read_object(store, digest)
+            file.write(data)
+            written += len(data)
+    return written
+
+
+def snapshot_block(path, snapshot: int, buid: str) -> 'Block':
+    """Block of a document as it was on a snapshot"""
+    order, hashes, _ = fold_snapshots(read_snapshots(path), snapshot)
+    if buid not in hashes:
+        raise ValueError(f"{buid=} is not on {snapshot=} of {path}")
+    data = read_object(snapshot_store(path), hashes[buid])
+    for block in danotes.model.Danom.iter_parse(io.BytesIO(data)):
+        return block
+    raise ValueError(f"{buid=} of {snapshot=} could not be parsed")
+
+
+def format_snapshot(entry: dict) -> str:
+    when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['ts']))
+    changes = f"{len(entry['changed'])} changed"
+    if entry['removed']:
+        changes += f", {len(entry['removed'])} removed"
+    return f"{entry['id']:>4}  {when}  {changes} / {entry['blocks']} Blocks  {entry['stored']} bytes stored  {entry['message']}".rstrip()
+
+
+def snapshot_to_json(entry: dict) -> str:
+    return json.dumps({'id': entry['id'], 'ts': entry['ts'], 'message': entry['message'], 'blocks': entry['blocks'],
+                       'size': entry['size'], 'stored': entry['stored'], 'changed': list(entry['changed']),
+                       'removed': entry['removed']}, ensure_ascii=False) + '\n'
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['SNAPSHOTS_SUFFIX', 'snapshot_store', 'read_snapshots', 'fold_snapshots', 'take_snapshot',
+           'restore_snapshot', 'snapshot_block', 'format_snapshot', 'snapshot_to_json']
@@ -0,0 +1,214 @@
+"""
+Sources of the Externally Generated Blocks (EGB), and the cached execution of command sources
+
+The kind of a source is classified once per Block (Block.source_kind), so each kind goes straight to its handler:
+    none    : no source, or a directory (the source only places the Block on the Toc tree)
+    url     : downloaded with wget and extracted as html
+    html    : local .html/.htm file, extracted as html
+    file    : local text file, dumped as it is
+    command : anything else (and executable local files), run with sh. Stdout is the content
+Single word paths (./x, ../x, /x, ~/x, x.html) are local sources even when the file is missing, they are not run.
+
+The output of the commands is cached on disk (COMMAND_CACHE_DIR/<sha256 of the directory and the command>.json)
+for `ttl` seconds (DANOTES_COMMAND_TTL, read when a command runs), so refreshing a document full of `man`/`--help` Blocks does not run them again. Commands are killed after
+`timeout` seconds, and their output is read as a stream up to `max_bytes` (the process is killed past it).
+Only the commands exiting with status 0 are cached. Commands run on the current directory, so the same command
+run from another directory (e.g. `ls`, `cat README`) is cached apart.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import hashlib
+import functools
+import threading
+import subprocess
+from pathlib import Path
+from typing import NamedTuple
+import danotes.model
+
+
+SOURCE_KINDS = ('none', 'url', 'html', 'file', 'command')
+HTML_SUFFIX_PATTERN = re.compile(r'\.(?:html|htm)$', re.IGNORECASE)
+## A single word starting like a path, or an .html file, is a local source even if the file is missing (not run as a command)
+LOCAL_PATH_PATTERN = re.compile(r'^(?:\.{0,2}/|~/)\S*$|^\S+\.(?:html|htm)$', re.IGNORECASE)
+
+## Seconds a command output is reused when DANOTES_COMMAND_TTL is not set (0 disables the cache)
+COMMAND_TTL = 24 * 3600.0
+## Seconds a command may run before being killed
+COMMAND_TIMEOUT = 60.0
+## Bytes of output kept from a command, the process is killed past them
+COMMAND_MAX_BYTES = 16 << 20
+COMMAND_READ_SIZE = 1 << 16
+COMMAND_CACHE_DIR = os.environ.get('DANOTES_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'danotes', 'commands')
+
+
+class CommandResult(NamedTuple):
+    returncode: int
+    stdout: str
+    truncated: bool     ## Output cut at max_bytes
+    timed_out: bool
+    cached: bool        ## Read from the cache instead of running the command
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def classify_source(source: str, path) -> str:
+    """Kind of a Block source (any of SOURCE_KINDS), relative local sources are relative to the document path"""
+    if not source:
+        return 'none'
+    if danotes.model.is_url(source):
+        return 'url'
+    if danotes.model.is_a_dir_path(source):
+        return 'none'
+
+    local = Path(source) if Path(source).is_absolute() else Path(path).parent.joinpath(source)
+    try:
+        if local.is_dir():
+            return 'none'
+        if local.is_file():
+            if HTML_SUFFIX_PATTERN.search(source):
+                return 'html'
+            ## An executable path was always run as a command, its output is the content
+            return 'command' if os.access(local, os.X_OK) else 'file'
+    except (OSError, ValueError):
+        pass
+    if LOCAL_PATH_PATTERN.match(source):
+        return 'html' if HTML_SUFFIX_PATTERN.search(source) else 'file'
+    return 'command'
+
+
+def command_ttl() -> float:
+    """Seconds a command output is reused: DANOTES_COMMAND_TTL, or COMMAND_TTL if it is not set or not a number"""
+    return parse_command_ttl(os.environ.get('DANOTES_COMMAND_TTL'))
+
+
+## Cached, so an invalid value is warned about once and not on every command of a refresh
+@functools.lru_cache(maxsize=None)
+def parse_command_ttl(value: str | None) -> float:
+    if value is None:
+        return COMMAND_TTL
+    try:
+        return float(value)
+    except ValueError:
+        print(f"[Warning]: DANOTES_COMMAND_TTL={value!r} is not a number of seconds, using {COMMAND_TTL}", file=sys.stderr)
+        return COMMAND_TTL
+
+
+def command_cache_path(command: str, cwd: str) -> str:
+    key = f"{cwd}\0{command}"
+    return os.path.join(COMMAND_CACHE_DIR, hashlib.sha256(key.encode('utf-8', errors='surrogateescape')).hexdigest() + '.json')
+
+
+def read_command_cache(command: str, ttl: float) -> CommandResult | None:
+    """Cached output of a command, if it is younger than ttl seconds"""
+    if ttl <= 0:
+        return None
+    cwd = os.getcwd()
+    try:
+        with open(command_cache_path(command, cwd), 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+    ## Hash collisions, or an entry written by an older danotes
+    if entry.get('command') != command or entry.get('cwd') != cwd or time.time() - entry.get('ts', 0) > ttl:
+        return None
+    return CommandResult(entry['returncode'], entry['stdout'], entry['truncated'], False, True)
+
+
+def write_command_cache(command: str, result: CommandResult):
+    try:
+        cwd = os.getcwd()
+        os.makedirs(COMMAND_CACHE_DIR, exist_ok=True)
+        with danotes.model.atomic_writer(command_cache_path(command, cwd), 'w') as file:
+            json.dump({'command': command, 'cwd': cwd, 'ts': time.time(), 'returncode': result.returncode,
+                       'stdout': result.stdout, 'truncated': result.truncated}, file, ensure_ascii=False)
+    except OSError as e:
+        print(f"[Warning]: Could not cache the output of {command=} on {COMMAND_CACHE_DIR}: {e}")
+
+
+def kill_process(process):
+    """Kill a command and its pipeline (the whole process group where there are groups)"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_command(command: str, timeout: float = COMMAND_TIMEOUT, max_bytes: int = COMMAND_MAX_BYTES) -> CommandResult:
+    """Run a shell command reading its stdout as a stream, killed after timeout seconds or max_bytes of output"""
+    ## On its own process group, so every process of a pipeline (man | col ...) is killed along with sh
+    process = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               start_new_session=hasattr(os, 'killpg'))
+    ## Killing the processes closes their end of the pipe, so the reads below stop waiting
+    killed = threading.Event()
+    def kill():
+        killed.set()
+        kill_process(process)
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    chunks = []
+    size = 0
+    truncated = False
+    try:
+        while True:
+            chunk = process.stdout.read1(COMMAND_READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                truncated = True
+                kill_process(process)
+                break
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        timed_out = killed.is_set()
+        process.stdout.close()
+
+    stdout = b''.join(chunks)[:max_bytes].decode('utf-8', errors='replace')
+    if truncated:
+        ## The output is kept, cut at max_bytes (the kill is not a failure of the command)
+        returncode = 0
+    return CommandResult(returncode, stdout, truncated, timed_out, False)
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section CORE_SUBROUTINES
+
+def run_cached_command(command: str, ttl: float = None, timeout: float = COMMAND_TIMEOUT, max_bytes: int = COMMAND_MAX_BYTES) -> CommandResult:
+    """Output of a command source, from the cache if it ran less than ttl seconds ago (command_ttl() if None)"""
+    if ttl is None:
+        ttl = command_ttl()
+    cached = read_command_cache(command, ttl)
+    if cached is not None:
+        return cached
+
+    result = run_command(command, timeout=timeout, max_bytes=max_bytes)
+    if result.timed_out:
+        print(f"[Warning]: {command=} was killed after {timeout}s")
+    elif result.truncated:
+        print(f"[Warning]: {command=} output was cut at {max_bytes} bytes")
+    if result.returncode == 0 and not result.timed_out and ttl > 0:
+        write_command_cache(command, result)
+    return result
+
+## EOF EOF EOF CORE_SUBROUTINES
+## ----------------------------------------------------------------------------
+
+__all__ = ['SOURCE_KINDS', 'COMMAND_TTL', 'COMMAND_TIMEOUT', 'COMMAND_MAX_BYTES', 'CommandResult',
+           'command_ttl', 'classify_source', 'run_command', 'run_cached_command']
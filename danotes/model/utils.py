@@ -13,6 +13,20 @@ import yaml
 import danotes.model
 import urllib.parse
 import subprocess
+import shutil
+import tempfile
+import functools
+from contextlib import contextmanager
+from danotes.profiling import trace
+
+
+## Characters of a DAN UID (buid/iid) in order, and their values
+UID_CHARS = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+UID_VALUES = {char: value for value, char in enumerate(UID_CHARS)}
+
+## Permission bits of newly created files (os.replace() of a mkstemp file would leave them 0600)
+UMASK = os.umask(0)
+os.umask(UMASK)
 
 
 ## ----------------------------------------------------------------------------
@@ -29,15 +43,12 @@ def get_next_uid(uid):
         'lZ' -> 'm0'
         'ZZ' -> '000' (overflow, adds a digit)
     """
-    # Define the alphanumeric characters in order
-    alphanumeric = [str(d) for d in range(10)] + [chr(c) for c in range(ord('a'), ord('z')+1)] + [chr(C) for C in range(ord('A'), ord('Z')+1)]
+    # The alphanumeric characters in order
+    alphanumeric = UID_CHARS
     base = len(alphanumeric)
-    char_to_value = {c: i for i, c in enumerate(alphanumeric)}
 
     # Convert UID to decimal
-    decimal = 0
-    for char in uid:
-        decimal = decimal * base + char_to_value[char]
+    decimal = uid_to_int(uid)
 
     # Increment
     decimal += 1
@@ -54,6 +65,51 @@ def get_next_uid(uid):
     return ''.join(reversed(next_uid))
 
 
+def uid_to_int(uid: str) -> int:
+    """Value of a DAN UID, e.g. to find the highest buid of a document ('Z' -> 61, '10' -> 62)"""
+    if any(char not in UID_VALUES for char in uid):
+        raise ValueError(f"{uid=} is not a DAN UID. Expected characters in {UID_CHARS!r}")
+    decimal = 0
+    for char in uid:
+        decimal = decimal * len(UID_CHARS) + UID_VALUES[char]
+    return decimal
+
+
+@functools.lru_cache(maxsize=None)
+def get_figlet(font: str = pyfiglet.DEFAULT_FONT) -> pyfiglet.Figlet:
+    """Figlet renderer of a font. Parsing the font file is most of the cost of pyfiglet.figlet_format()"""
+    return pyfiglet.Figlet(font=font)
+
+
+@functools.lru_cache(maxsize=4096)
+def render_figlet(text: str, font: str = pyfiglet.DEFAULT_FONT) -> str:
+    """Same output as pyfiglet.figlet_format(text, font) with the font parsed once (and repeated labels rendered once)"""
+    return get_figlet(font).renderText(text)
+
+
+@contextmanager
+def atomic_writer(path, mode: str = 'wb'):
+    """
+    Open a temporary file next to path, and os.replace() path with it once the block exits without errors
+    Readers never see a half written document, and path can be read while its replacement is written
+    """
+    path = os.path.realpath(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        encoding = None if 'b' in mode else 'utf-8'
+        with os.fdopen(fd, mode, encoding=encoding) as file:
+            yield file
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
 def create_new_header_block(path):
     content = []
 
@@ -89,6 +145,7 @@ def create_new_header_block(path):
     content.append('')
 
 
+@trace('transform_legacy_title')
 def transform_legacy_title(path):
     path = Path(path)
     basename_no_ext = path.stem
@@ -125,6 +182,9 @@ def transform_legacy_title(path):
 
 
 def check_yaml_line(line):
+    ## A YAML mapping needs a ':' , '?' or '{' indicator, the figlet lines of the headers are not parsed
+    if ':' not in line and '?' not in line and '{' not in line:
+        return False
     try:
         # Attempt to parse the line as YAML
         yaml_content = yaml.safe_load(line)
@@ -147,23 +207,11 @@ def is_url(string: str) -> bool:
     return bool(re.match(r'^(?:http|https|ftp)://\S+\.\S+$', string))
 
 
-def index_file(url: str, path: str) -> tuple[Path, str]:
-    """
-    Download a file from a URL to a local directory structure under DOCU_PATH.
-    Creates necessary subdirectories if they don't exist.
-
-    Args:
-        url (str): The URL of the file to download.
-        path (str): Base path for downloads.
-
-    Returns:
-        tuple[Path, str]: (download_directory, filename)
-    """
-    # Parse URL and handle filename
+def download_location(url: str, path: str) -> tuple[Path, str]:
+    """(directory, filename) where the page of a URL source is kept: <document stem>/downloaded/<host>/<url path>"""
     parsed_url = urllib.parse.urlparse(url)
     url_path = f"{parsed_url.netloc}/{parsed_url.path.lstrip('/')}"
 
-
     # Split into directory path and filename
     *dirparts, last_part = url_path.split('/') if url_path else []
     dirpath = '/'.join(dirparts)
@@ -172,9 +220,24 @@ def index_file(url: str, path: str) -> tuple[Path, str]:
     # Create base paths using pathlib
     base_path = Path(path).parent / Path(path).stem
     downloaded_path = base_path / "downloaded"
+    return (downloaded_path / dirpath, filename)
+
 
+@trace('index_file (wget)')
+def index_file(url: str, path: str) -> tuple[Path, str]:
+    """
+    Download a file from a URL to a local directory structure under DOCU_PATH.
+    Creates necessary subdirectories if they don't exist.
+
+    Args:
+        url (str): The URL of the file to download.
+        path (str): Base path for downloads.
+
+    Returns:
+        tuple[Path, str]: (download_directory, filename)
+    """
     # Create the full target directory path
-    full_dirpath = downloaded_path / dirpath
+    full_dirpath, filename = download_location(url, path)
     full_dirpath.mkdir(parents=True, exist_ok=True)
 
     # Construct the wget command
@@ -206,7 +269,14 @@ def index_file(url: str, path: str) -> tuple[Path, str]:
 # @description Subroutines triggered directly by CLI Handlers
 
 def is_valid_dan_format(path):
-    """Return if the file has proper .dan format"""
+    """Return if the file has proper .dan format (or is a .danb binary document, a shard manifest, or a compressed .dan)"""
+    if danotes.model.is_danb(path) or danotes.model.is_manifest(path):
+        return True
+    ## Compressed documents are checked on their first decompressed line
+    if danotes.model.compression_of(path):
+        with danotes.model.open_decompressed(path) as file:
+            line = file.readline().decode('utf-8', errors='replace')
+        return bool(re.search(r'^<B=0>.*', line))
     with open(path, 'r', encoding='utf-8') as file:
             line = file.readline()
             match = re.search(r'^<B=0>.*', line)
@@ -217,6 +287,8 @@ def is_valid_dan_format(path):
 
 
 def append_after_third_last_line(file_path, string_to_append, estimated_max_line_length=200):
+    if danotes.model.compression_of(file_path):
+        raise ValueError(f"{file_path} is a compressed document, it cannot be appended in place (use danotes block write --journal)")
     # Open in binary mode to work with byte offsets
     with open(file_path, 'rb') as f:
         f.seek(0, os.SEEK_END)
@@ -267,4 +339,4 @@ def append_after_third_last_line(file_path, string_to_append, estimated_max_line
 ## EOF EOF EOF CORE_SUBROUTINES 
 ## ----------------------------------------------------------------------------
 
-__all__ = [ 'is_valid_dan_format' , 'append_after_third_last_line', 'get_next_uid', 'transform_legacy_title', 'check_yaml_line', 'is_a_dir_path', 'is_url', 'index_file']
+__all__ = [ 'is_valid_dan_format' , 'append_after_third_last_line', 'get_next_uid', 'uid_to_int', 'transform_legacy_title', 'check_yaml_line', 'is_a_dir_path', 'is_url', 'download_location', 'index_file', 'render_figlet', 'atomic_writer']
@@ -0,0 +1,179 @@
+"""
+Per-phase profiling and timing instrumentation
+
+Enabled with the global `danotes --profile [table|json]` flag or the DANOTES_TRACE
+environment variable (DANOTES_TRACE=table|json , DANOTES_TRACE_DUMP=<file> for a cProfile dump)
+Records wall time, call counts and peak memory (tracemalloc) for each phase and for each block.
+When disabled the instrumented functions only pay for a boolean check.
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import tracemalloc
+import cProfile
+from contextlib import contextmanager
+
+
+class Profiler():
+    """Collector of the timings of the instrumented phases"""
+    ## Core methods -------------------
+    def __init__(self):
+        self.enabled = False
+        self.output = 'table'
+        self.dump_path = None
+        self.phases = {}
+        self.blocks = {}
+        self.stack = []
+        self.cprofile = None
+
+    def __repr__(self):
+        return f"Profiler(enabled={self.enabled}, output='{self.output}', phases={list(self.phases)})"
+
+    ## Modification methods -----------
+    def start(self, output: str = 'table', dump_path: str = None):
+        """Start recording (tracemalloc and optionally cProfile)"""
+        self.enabled = True
+        self.output = output
+        self.dump_path = dump_path
+        tracemalloc.start()
+        if dump_path:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        return self
+
+    def stop(self):
+        """Stop recording, dumping the cProfile stats if requested"""
+        if not self.enabled:
+            return self
+        self.enabled = False
+        tracemalloc.stop()
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.dump_path)
+        return self
+
+    def record(self, name: str, buid: str, elapsed: float, peak: int):
+        if buid is None:
+            stats = self.phases.setdefault(name, {'calls': 0, 'time': 0.0, 'peak': 0})
+        else:
+            stats = self.blocks.setdefault(name, {}).setdefault(buid, {'calls': 0, 'time': 0.0, 'peak': 0})
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['peak'] = max(stats['peak'], peak)
+
+    @contextmanager
+    def phase(self, name: str, buid: str = None):
+        """Time (and memory-peak) the enclosed code as `name` (per block if buid is given)"""
+        if not self.enabled:
+            yield
+            return
+
+        ## Nested phases: fold the peak reached so far into the open ones before resetting it
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self.stack:
+            frame[1] = max(frame[1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+        self.stack.append(frame)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            self.stack.pop()
+            frame[1] = max(frame[1], peak)
+            for parent in self.stack:
+                parent[1] = max(parent[1], peak)
+            self.record(name, buid, elapsed, frame[1] - frame[0])
+
+    ## Output methods -----------------
+    def to_dict(self) -> dict:
+        return {'phases': self.phases, 'blocks': self.blocks}
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+
+    def to_table(self, top: int = 10) -> str:
+        """Human table of the phases, plus the `top` slowest blocks of each per-block phase"""
+        output = [f"{'phase':<40} {'calls':>8} {'total ms':>12} {'mean ms':>10} {'peak KiB':>10}"]
+        output.append('-' * len(output[0]))
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1]['time']):
+            output.append(self.format_row(name, stats))
+
+        for name, blocks in self.blocks.items():
+            output.append('')
+            output.append(f"{name} (per block, {top} slowest of {len(blocks)})")
+            output.append('-' * len(output[0]))
+            total = {'calls': 0, 'time': 0.0, 'peak': 0}
+            for stats in blocks.values():
+                total['calls'] += stats['calls']
+                total['time'] += stats['time']
+                total['peak'] = max(total['peak'], stats['peak'])
+            output.append(self.format_row('(all blocks)', total))
+            for buid, stats in sorted(blocks.items(), key=lambda item: -item[1]['time'])[:top]:
+                output.append(self.format_row(f"buid={buid}", stats))
+
+        return '\n'.join(output) + '\n'
+
+    @staticmethod
+    def format_row(name: str, stats: dict) -> str:
+        mean = stats['time'] / stats['calls'] if stats['calls'] else 0.0
+        return f"{name:<40} {stats['calls']:>8} {stats['time'] * 1000:>12.3f} {mean * 1000:>10.3f} {stats['peak'] / 1024:>10.1f}"
+
+    def report(self, file=sys.stderr):
+        """Print the report on the requested output format"""
+        if self.output == 'json':
+            print(self.to_json(), file=file)
+        else:
+            print(self.to_table(), end='', file=file)
+
+
+## Profiler in use for the whole run
+PROFILER = Profiler()
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def trace(name: str = None, per_block: bool = False):
+    """Decorator recording every call of the function as a phase
+    per_block: the function is a Block method, record it under the buid of the Block too
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.phase(label, args[0].buid if per_block else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profile_from_env(output: str = None, dump_path: str = None) -> Profiler:
+    """Start the profiler if requested by arguments or by DANOTES_TRACE / DANOTES_TRACE_DUMP"""
+    env_output = os.environ.get('DANOTES_TRACE', '').strip().lower()
+    if env_output in ('0', 'false', 'no', 'off'):
+        env_output = ''
+    dump_path = dump_path or os.environ.get('DANOTES_TRACE_DUMP') or None
+
+    if not output and env_output:
+        output = 'json' if env_output == 'json' else 'table'
+    if not output and dump_path:
+        output = 'table'
+
+    if output:
+        PROFILER.start(output, dump_path)
+    return PROFILER
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+__all__ = ['Profiler', 'PROFILER', 'trace', 'profile_from_env']
@@ -0,0 +1,208 @@
+"""
+Filesystem change notifications for `danotes watch`
+
+InotifyWatcher subscribes to the parent directories of the watched files through the Linux
+inotify API (libc via ctypes, no extra dependency). Directories are watched instead of the files
+themselves because editors usually save by writing a new file and renaming it over the old one.
+PollingWatcher compares (mtime, size) snapshots every `interval` seconds, it is used where
+inotify is not available or with `danotes watch --poll`.
+
+Both expose the same interface:
+    watcher.watch(paths)       : replace the set of watched files
+    watcher.wait(timeout=None) : block until some watched file changes, returns the set of changed paths
+                                 (empty set if the timeout expires first)
+    watcher.close()
+"""
+
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+
+## inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_STRUCT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+## ----------------------------------------------------------------------------
+# @section WATCHERS
+
+class InotifyWatcher():
+    """Change notifications through inotify, watching the parent directory of each file"""
+
+    ## Core methods -------------------
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.paths = set()
+        self.dirs = {}          ## dir -> wd
+        self.wd_dirs = {}       ## wd -> dir
+
+    def __repr__(self):
+        return f"InotifyWatcher(fd={self.fd}, paths={len(self.paths)}, dirs={len(self.dirs)})"
+
+    ## Modification methods -----------
+    def watch(self, paths):
+        """Replace the set of watched files"""
+        self.paths = {os.path.realpath(path) for path in paths}
+        dirs = {os.path.dirname(path) for path in self.paths}
+
+        for directory in set(self.dirs) - dirs:
+            self.libc.inotify_rm_watch(self.fd, self.dirs[directory])
+            del self.wd_dirs[self.dirs.pop(directory)]
+
+        for directory in dirs - set(self.dirs):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                print(f"[Warning]: Cannot watch {directory=} {os.strerror(ctypes.get_errno())}", file=sys.stderr)
+                continue
+            self.dirs[directory] = wd
+            self.wd_dirs[wd] = directory
+        return self
+
+    def wait(self, timeout: float = None) -> set:
+        """Block until some watched file changes (or the timeout expires). Returns the changed paths"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return set()
+            changed = self.read_events()
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+    def read_events(self) -> set:
+        """Read the pending events, returning the watched paths they refer to"""
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_STRUCT.size <= len(data):
+            wd, mask, _, length = EVENT_STRUCT.unpack_from(data, offset)
+            offset += EVENT_STRUCT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            ## Events were dropped, anything may have changed
+            if mask & IN_Q_OVERFLOW:
+                return set(self.paths)
+            if mask & IN_IGNORED or wd not in self.wd_dirs:
+                continue
+            path = os.path.join(self.wd_dirs[wd], os.fsdecode(name))
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher():
+    """Change notifications by comparing (mtime, size) snapshots of the watched files"""
+
+    ## Core methods -------------------
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.snapshots = {}
+
+    def __repr__(self):
+        return f"PollingWatcher(interval={self.interval}, paths={len(self.snapshots)})"
+
+    @staticmethod
+    def snapshot(path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    ## Modification methods -----------
+    def watch(self, paths):
+        """Replace the set of watched files"""
+        paths = {os.path.realpath(path) for path in paths}
+        self.snapshots = {path: self.snapshots[path] if path in self.snapshots else self.snapshot(path) for path in paths}
+        return self
+
+    def wait(self, timeout: float = None) -> set:
+        """Poll until some watched file changes (or the timeout expires). Returns the changed paths"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, previous in self.snapshots.items():
+                current = self.snapshot(path)
+                if current != previous:
+                    self.snapshots[path] = current
+                    changed.add(path)
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            sleep = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(sleep)
+
+    def close(self):
+        self.snapshots = {}
+
+## EOF EOF EOF WATCHERS
+## ----------------------------------------------------------------------------
+
+
+
+## ----------------------------------------------------------------------------
+# @section HELPERS
+
+def make_watcher(paths, poll: bool = False, interval: float = 1.0):
+    """inotify watcher on the given paths, falling back to polling where it is not available"""
+    if not poll:
+        try:
+            return InotifyWatcher().watch(paths)
+        except OSError as e:
+            print(f"[Warning]: inotify not available ({e}), polling every {interval}s instead", file=sys.stderr)
+    return PollingWatcher(interval).watch(paths)
+
+
+def wait_debounced(watcher, debounce: float, timeout: float = None) -> set:
+    """Wait for a change, then keep collecting changes until `debounce` seconds pass without any"""
+    changed = watcher.wait(timeout)
+    if not changed:
+        return changed
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+## EOF EOF EOF HELPERS
+## ----------------------------------------------------------------------------
+
+__all__ = ['InotifyWatcher', 'PollingWatcher', 'make_watcher', 'wait_debounced']
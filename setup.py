@@ -7,12 +7,13 @@ setup(
     author="Your Name",
     author_email="your@email.com",
     license="MIT",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     package_data={
         "danotes": [
             "filters/builtin/*.lua",
-            "filters/user/*.lua"
+            "filters/user/*.lua",
+            "filters/user/*.py"
         ],
     },
     install_requires=[
@@ -22,6 +23,9 @@ setup(
         "beautifulsoup4>=4.13.4",
         "lxml>=6.0.0"
         ],
+    extras_require={
+        "zstd": ["zstandard>=0.22"],
+    },
     entry_points={
         "console_scripts": [
             "danotes=danotes.cli:main",